@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga a PostgreSQL: execute_values vs COPY + staging
+Compara insert_ventas y upsert_inventario por sus dos caminos con datos
+sintéticos (filas nuevas y recarga de las mismas filas).
+
+Requiere .env con DB_* y database/migration_v4_carga_masiva.sql aplicada.
+Ejecutar desde la raíz del proyecto:
+    python backend/lambdas/data_collector/bench_carga.py --filas 100000 1000000
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import date, timedelta
+
+# Agregar el directorio al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ['LOCAL_DEV'] = 'true'
+
+import handler
+from handler import get_db_connection, upsert_productos, insert_ventas, upsert_inventario
+
+# Marcadores de los datos sintéticos (se borran al terminar)
+PREFIJO_BENCH = 'BENCH'
+REF_BENCH = 'BENCH-'
+
+LOTE = 100_000          # Filas por llamada al escritor
+REFS_VENTAS = 5_000     # Referencias distintas en las ventas sintéticas
+FECHA_SNAPSHOT = '2099-01-01'
+
+
+def obtener_bodegas(conn) -> list:
+    with conn.cursor() as cur:
+        cur.execute("SELECT codigo FROM almacenes ORDER BY codigo")
+        return [r[0] for r in cur.fetchall()]
+
+
+def generar_ventas(n: int, bodegas: list):
+    """Ventas sintéticas en lotes de LOTE filas"""
+    inicio = date(2099, 1, 1)
+    lote = []
+    for i in range(n):
+        cantidad = 1 + i % 5
+        lote.append({
+            'TIPMOV': 'FV',
+            'PREFIJO': PREFIJO_BENCH,
+            'NUMDOC': str(i // 3),
+            'FECHA': (inicio + timedelta(days=i % 28)).isoformat(),
+            'HORA': f"{8 + i % 10:02d}:{i % 60:02d}:00",
+            'CEDULA': str(10_000_000 + i % 9_000),
+            'NOMCED': f"CLIENTE {i % 9_000}",
+            'CODSEC': '01',
+            'NOMSEC': 'BENCHMARK',
+            'BODEGA': bodegas[i % len(bodegas)],
+            'REFER': f"{REF_BENCH}{(i * 7 + i // 3) % REFS_VENTAS:06d}",
+            'CANTID': cantidad,
+            'VALUND': 12500.5,
+            'VALTOT': 12500.5 * cantidad,
+            'PORDES': 0,
+            'VALDES': 0,
+            'VCOSTO': 9800.25 * cantidad,
+            'VALUTI': 2700.25 * cantidad,
+            'PORUTI': 21.6,
+            'PORIVA': 19,
+            'VENDED': f"V{i % 40:03d}",
+            'NOMVEN': f"VENDEDOR {i % 40}"
+        })
+        if len(lote) >= LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def generar_inventario(n: int, bodegas: list, variante: int = 0):
+    """Inventario sintético: una fila por (bodega, referencia)"""
+    lote = []
+    for i in range(n):
+        lote.append({
+            'BODEGA': bodegas[i % len(bodegas)],
+            'REFERENCIA': f"{REF_BENCH}{i // len(bodegas):06d}",
+            'NOMREF': f"PRODUCTO BENCH {i // len(bodegas)}",
+            'CANTIDAD': (i + variante) % 23,
+            'VCOSTO': 9800.25,
+            'VVENTA': 12500.5,
+            'OBSERV1': ''
+        })
+        if len(lote) >= LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def preparar_productos(conn, n_inventario: int, bodegas: list):
+    """Crea los productos sintéticos (FK de ventas e inventario)"""
+    n_refs = max(REFS_VENTAS, n_inventario // len(bodegas) + 1)
+    productos = [{'REFERENCIA': f"{REF_BENCH}{r:06d}", 'NOMBRE': f"PRODUCTO BENCH {r}"} for r in range(n_refs)]
+    upsert_productos(conn, productos)
+
+
+def limpiar(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM ventas WHERE prefijo = %s", (PREFIJO_BENCH,))
+        cur.execute("DELETE FROM inventario_snapshot WHERE referencia LIKE %s", (REF_BENCH + '%',))
+        cur.execute("DELETE FROM inventario_actual WHERE referencia LIKE %s", (REF_BENCH + '%',))
+        cur.execute("DELETE FROM productos WHERE referencia LIKE %s", (REF_BENCH + '%',))
+    conn.commit()
+
+
+def medir(lotes, escribir) -> tuple:
+    """Ejecuta el escritor sobre cada lote; solo cuenta el tiempo de escritura"""
+    segundos = 0.0
+    filas = 0
+    for lote in lotes:
+        t0 = time.perf_counter()
+        escribir(lote)
+        segundos += time.perf_counter() - t0
+        filas += len(lote)
+    return filas, segundos
+
+
+def ejecutar(conn, n: int, camino: str, bodegas: list) -> list:
+    # 1 fila = siempre COPY; 0 = siempre execute_values
+    handler.CARGA_COPY_MIN_FILAS = 1 if camino == 'copy' else 0
+
+    limpiar(conn)
+    preparar_productos(conn, n, bodegas)
+
+    casos = [
+        ('ventas nuevas', lambda: medir(generar_ventas(n, bodegas), lambda l: insert_ventas(conn, l))),
+        ('ventas repetidas', lambda: medir(generar_ventas(n, bodegas), lambda l: insert_ventas(conn, l))),
+        ('inventario nuevo', lambda: medir(generar_inventario(n, bodegas),
+                                           lambda l: upsert_inventario(conn, l, FECHA_SNAPSHOT))),
+        ('inventario recarga', lambda: medir(generar_inventario(n, bodegas, variante=1),
+                                             lambda l: upsert_inventario(conn, l, FECHA_SNAPSHOT))),
+    ]
+
+    resultados = []
+    for nombre, caso in casos:
+        filas, segundos = caso()
+        resultados.append((n, camino, nombre, filas, segundos))
+        print(f"  {camino:<15} {nombre:<20} {filas:>10,} filas  {segundos:>8.2f} s  {filas / segundos:>12,.0f} filas/s")
+
+    limpiar(conn)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark execute_values vs COPY + staging')
+    parser.add_argument('--filas', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--caminos', nargs='+', default=['execute_values', 'copy'],
+                        choices=['execute_values', 'copy'])
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        bodegas = obtener_bodegas(conn)
+        if not bodegas:
+            print("❌ La tabla almacenes está vacía")
+            return
+
+        resultados = []
+        for n in args.filas:
+            print(f"\n=== {n:,} filas ===")
+            for camino in args.caminos:
+                resultados.extend(ejecutar(conn, n, camino, bodegas))
+
+        # Resumen: aceleración de COPY sobre execute_values
+        print("\n" + "=" * 60)
+        print("RESUMEN (COPY vs execute_values)")
+        print("=" * 60)
+        tiempos = {(n, camino, nombre): seg for n, camino, nombre, _, seg in resultados}
+        for (n, camino, nombre), seg in tiempos.items():
+            if camino != 'copy' or (n, 'execute_values', nombre) not in tiempos:
+                continue
+            print(f"  {n:>10,} {nombre:<20} x{tiempos[(n, 'execute_values', nombre)] / seg:.1f}")
+    finally:
+        limpiar(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end del colector contra fake_soap_server.py y PostgreSQL local
+Levanta el servidor SOAP falso, ejecuta cada escenario del colector en un
+proceso aparte (para medir el pico de RSS de cada uno) y reporta filas/s, pico
+de RSS y tiempo por etapa (HTTP, parseo, productos, escritura).
+
+Requiere .env con DB_* y las migraciones aplicadas. Ejecutar desde la raíz del proyecto:
+    python backend/lambdas/data_collector/bench_colector.py --dias 7 --ventas-por-dia 20000
+    python backend/lambdas/data_collector/bench_colector.py --escenarios inventario inventario_pipeline --latencia 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import functools
+import subprocess
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Agregar el directorio al path
+sys.path.insert(0, DIRECTORIO)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ['LOCAL_DEV'] = 'true'
+
+from fake_soap_server import PREFIJO_FALSO, REF_FALSA
+
+FECHA_INICIO = '2025-03-01'
+FECHA_INVENTARIO = '2025-03-15'
+
+ESCENARIOS = {
+    'ventas': lambda h, a: h.handler_ventas(
+        {'fecha_inicio': FECHA_INICIO, 'fecha_fin': a.fecha_fin}, None),
+    'ventas_streaming': lambda h, a: h.handler_ventas(
+        {'fecha_inicio': FECHA_INICIO, 'fecha_fin': a.fecha_fin, 'streaming': True}, None),
+    'inventario': lambda h, a: h.handler_inventario(
+        {'fecha': FECHA_INVENTARIO}, None),
+    'inventario_pipeline': lambda h, a: h.handler_inventario(
+        {'fecha': FECHA_INVENTARIO, 'pipeline': True, 'concurrencia': a.concurrencia}, None),
+    'ambos_concurrente': lambda h, a: h.handler(
+        {'tipo': 'ambos', 'concurrente': True, 'fecha_inicio': FECHA_INICIO, 'fecha_fin': a.fecha_fin,
+         'fecha': FECHA_INVENTARIO}, None),
+}
+
+
+# ============================================
+# MEDICIÓN POR ETAPA (PROCESO HIJO)
+# ============================================
+
+def instrumentar(handler, etapas: dict):
+    """
+    Envuelve las funciones de cada etapa del módulo handler para acumular su
+    tiempo. En modo streaming el parseo ocurre dentro de la lectura HTTP y
+    queda contado como HTTP.
+    """
+    def cronometrar(etapa, funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                etapas[etapa] += time.perf_counter() - inicio
+        return envoltura
+
+    for etapa, nombres in (('parseo', ('parse_soap_response',)),
+                           ('productos', ('guardar_productos',)),
+                           ('escritura', ('insert_ventas', 'upsert_inventario'))):
+        for nombre in nombres:
+            setattr(handler, nombre, cronometrar(etapa, getattr(handler, nombre)))
+    handler.SincronizadorDelta.procesar = cronometrar('escritura', handler.SincronizadorDelta.procesar)
+
+
+def filas_procesadas(resultado: dict) -> int:
+    """Suma las filas recibidas de la API en la respuesta de un handler"""
+    body = json.loads(resultado['body'])
+    partes = [body] + [json.loads(r['body']) for r in body.values() if isinstance(r, dict) and 'body' in r]
+    return sum(p.get('ventas_procesadas', 0) + p.get('items_procesados', 0) for p in partes)
+
+
+def ejecutar_escenario(nombre: str, args) -> dict:
+    import handler
+    etapas = {'parseo': 0.0, 'productos': 0.0, 'escritura': 0.0}
+    instrumentar(handler, etapas)
+    handler.soap_client.estadisticas(reiniciar=True)
+
+    inicio = time.perf_counter()
+    resultado = ESCENARIOS[nombre](handler, args)
+    total = time.perf_counter() - inicio
+
+    soap = handler.soap_client.estadisticas()
+    etapas['http'] = sum(op['segundos'] for op in soap.values())
+    return {
+        'escenario': nombre,
+        'status': resultado['statusCode'],
+        'filas': filas_procesadas(resultado),
+        'segundos': total,
+        'etapas': etapas,
+        'llamadas': sum(op['llamadas'] for op in soap.values()),
+        'bytes_red': sum(op['bytes_red'] for op in soap.values()),
+        # ru_maxrss está en KB en Linux (bytes en macOS)
+        'rss_pico_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != 'darwin' else 1024 ** 2)
+    }
+
+
+# ============================================
+# ORQUESTACIÓN (PROCESO PADRE)
+# ============================================
+
+def iniciar_servidor(args, bodegas: list) -> tuple:
+    comando = [
+        sys.executable, os.path.join(DIRECTORIO, 'fake_soap_server.py'), '--puerto', '0',
+        '--ventas-por-dia', str(args.ventas_por_dia), '--inventario-items', str(args.inventario_items),
+        '--latencia', str(args.latencia), '--tasa-error', str(args.tasa_error), '--bodegas', *bodegas
+    ]
+    proceso = subprocess.Popen(comando, stdout=subprocess.PIPE, text=True)
+    linea = proceso.stdout.readline().split()
+    if not linea or linea[0] != 'PUERTO':
+        proceso.kill()
+        raise RuntimeError('El servidor SOAP falso no arrancó')
+    return proceso, f"http://127.0.0.1:{linea[1]}/srvAPI.asmx"
+
+
+def limpiar(conn):
+    """Borra los datos sintéticos del servidor falso"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM ventas WHERE prefijo = %s", (PREFIJO_FALSO,))
+        cur.execute("DELETE FROM inventario_snapshot WHERE referencia LIKE %s", (REF_FALSA + '%',))
+        cur.execute("DELETE FROM inventario_actual WHERE referencia LIKE %s", (REF_FALSA + '%',))
+        cur.execute("DELETE FROM productos WHERE referencia LIKE %s", (REF_FALSA + '%',))
+    conn.commit()
+
+
+def ejecutar_hijo(nombre: str, url: str, args) -> dict:
+    entorno = dict(os.environ, VENTAS_API_URL=url, INVENTARIO_API_URL=url)
+    if args.copy:
+        entorno['CARGA_COPY_MIN_FILAS'] = '1'
+    comando = [sys.executable, os.path.abspath(__file__), '--interno', nombre,
+               '--fecha-fin', args.fecha_fin, '--concurrencia', str(args.concurrencia)]
+    salida = subprocess.run(comando, env=entorno, capture_output=True, text=True)
+    if salida.returncode != 0:
+        raise RuntimeError(f"{nombre} falló:\n{salida.stderr[-2000:]}")
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def imprimir(resultados: list):
+    print("\n" + "=" * 104)
+    print(f"{'escenario':<22}{'filas':>10}{'seg':>9}{'filas/s':>11}{'RSS MB':>9}"
+          f"{'http':>9}{'parseo':>9}{'productos':>11}{'escritura':>11}{'llamadas':>10}")
+    print("=" * 104)
+    for r in resultados:
+        e = r['etapas']
+        print(f"{r['escenario']:<22}{r['filas']:>10,}{r['segundos']:>9.2f}{r['filas'] / r['segundos']:>11,.0f}"
+              f"{r['rss_pico_mb']:>9.0f}{e['http']:>9.2f}{e['parseo']:>9.2f}{e['productos']:>11.2f}"
+              f"{e['escritura']:>11.2f}{r['llamadas']:>10}")
+    print("\nEtapas en segundos acumulados; con concurrencia pueden sumar más que el total.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark end-to-end del colector')
+    parser.add_argument('--escenarios', nargs='+', default=list(ESCENARIOS), choices=list(ESCENARIOS))
+    parser.add_argument('--dias', type=int, default=3, help='Días de ventas a extraer')
+    parser.add_argument('--ventas-por-dia', type=int, default=10_000)
+    parser.add_argument('--inventario-items', type=int, default=25_000)
+    parser.add_argument('--latencia', type=float, default=0.0, help='Latencia por llamada del servidor falso')
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='Probabilidad de HTTP 500 por llamada')
+    parser.add_argument('--concurrencia', type=int, default=4, help='Páginas de inventario en paralelo (pipeline)')
+    parser.add_argument('--copy', action='store_true', help='Cargar con COPY + staging')
+    parser.add_argument('--interno', help=argparse.SUPPRESS)
+    parser.add_argument('--fecha-fin', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno:
+        print(json.dumps(ejecutar_escenario(args.interno, args)))
+        return
+
+    from datetime import datetime, timedelta
+    args.fecha_fin = (datetime.strptime(FECHA_INICIO, '%Y-%m-%d') + timedelta(days=args.dias - 1)).strftime('%Y-%m-%d')
+
+    import handler
+    conn = handler.get_db_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT codigo FROM almacenes ORDER BY codigo")
+        bodegas = [r[0] for r in cur.fetchall()]
+    if not bodegas:
+        print("❌ La tabla almacenes está vacía")
+        return
+
+    servidor, url = iniciar_servidor(args, bodegas)
+    print(f"Servidor SOAP falso: {url}")
+    print(f"Ventas: {args.dias} días x {args.ventas_por_dia:,} | Inventario: {args.inventario_items:,} items | "
+          f"Latencia: {args.latencia}s | Carga: {'COPY' if args.copy else 'execute_values'}")
+
+    resultados = []
+    try:
+        for nombre in args.escenarios:
+            limpiar(conn)
+            print(f"  ▶ {nombre}...", flush=True)
+            resultados.append(ejecutar_hijo(nombre, url, args))
+    finally:
+        limpiar(conn)
+        conn.close()
+        servidor.terminate()
+        servidor.wait()
+
+    imprimir(resultados)
+
+
+if __name__ == "__main__":
+    main()
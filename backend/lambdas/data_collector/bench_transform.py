@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de la transformación registro SOAP -> filas de base de datos
+Compara la conversión fila por fila con Decimal(str()) (implementación previa)
+contra TransformadorLote, tanto para execute_values (tuplas) como para COPY
+(texto). No toca la base de datos.
+
+Ejecutar desde la raíz del proyecto:
+    python backend/lambdas/data_collector/bench_transform.py --filas 100000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from decimal import Decimal
+
+# Agregar el directorio al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from handler import TRANSFORMADOR_VENTAS, TRANSFORMADOR_INVENTARIO, _valor_copy
+
+TAMANO_PAGINA = 5_000   # Registros por página (igual que VENTAS_LOTE_STREAMING)
+REFERENCIAS = 3_000     # Catálogo sintético: cada referencia tiene su precio
+
+
+# ============================================
+# IMPLEMENTACIÓN PREVIA (FILA POR FILA)
+# ============================================
+
+def fila_venta_previa(v: dict) -> tuple:
+    hora = None
+    if v.get('HORA'):
+        hora = v['HORA']
+    return (
+        v.get('TIPMOV'), v.get('PREFIJO'), v.get('NUMDOC'), v.get('FECHA'), hora,
+        v.get('CEDULA'), v.get('NOMCED'), v.get('CODSEC'), v.get('NOMSEC'),
+        v.get('BODEGA'), v.get('REFER'),
+        Decimal(str(v.get('CANTID', 0))),
+        Decimal(str(v.get('VALUND', 0))),
+        Decimal(str(v.get('VALTOT', 0))),
+        Decimal(str(v.get('PORDES', 0))),
+        Decimal(str(v.get('VALDES', 0))),
+        Decimal(str(v.get('VCOSTO', 0))),
+        Decimal(str(v.get('VALUTI', 0))),
+        Decimal(str(v.get('PORUTI', 0))),
+        Decimal(str(v.get('PORIVA', 0))),
+        v.get('VENDED'), v.get('NOMVEN')
+    )
+
+
+def fila_inventario_previa(i: dict) -> tuple:
+    return (
+        i.get('BODEGA'),
+        i.get('REFERENCIA'),
+        Decimal(str(i.get('CANTIDAD', 0))),
+        Decimal(str(i.get('VCOSTO', 0))),
+        Decimal(str(i.get('VVENTA', 0))),
+        (i.get('OBSERV1') or '').strip() or None
+    )
+
+
+def copy_previo(filas) -> int:
+    """Texto de COPY fila por fila, como lo generaba _FuenteCopy"""
+    return sum(len('\t'.join(_valor_copy(v) for v in fila) + '\n') for fila in filas)
+
+
+# ============================================
+# DATOS SINTÉTICOS
+# ============================================
+
+def generar_ventas(n: int) -> list:
+    rnd = random.Random(42)
+    precios = [round(rnd.uniform(1_000, 250_000), 2) for _ in range(REFERENCIAS)]
+    ventas = []
+    for i in range(n):
+        ref = rnd.randrange(REFERENCIAS)
+        cantidad = rnd.choice((1, 1, 1, 2, 2, 3, 5, 12))
+        descuento = rnd.choice((0, 0, 0, 5, 10))
+        total = round(precios[ref] * cantidad * (100 - descuento) / 100, 2)
+        costo = round(total * 0.78, 2)
+        ventas.append({
+            'TIPMOV': 'FV', 'PREFIJO': 'FE', 'NUMDOC': str(100_000 + i // 3),
+            'FECHA': f"2025-03-{1 + i % 28:02d}", 'HORA': f"{8 + i % 12:02d}:{i % 60:02d}:{i * 7 % 60:02d}",
+            'CEDULA': str(10_000_000 + rnd.randrange(20_000)), 'NOMCED': f"CLIENTE {rnd.randrange(20_000)}",
+            'CODSEC': '01', 'NOMSEC': 'ALMACEN', 'BODEGA': rnd.choice(('0001', '0002', '0003', '0004', '0010')),
+            'REFER': f"REF{ref:05d}", 'CANTID': cantidad, 'VALUND': precios[ref], 'VALTOT': total,
+            'PORDES': descuento, 'VALDES': round(precios[ref] * cantidad - total, 2), 'VCOSTO': costo,
+            'VALUTI': round(total - costo, 2), 'PORUTI': 22, 'PORIVA': 19,
+            'VENDED': f"V{i % 40:03d}", 'NOMVEN': f"VENDEDOR {i % 40}"
+        })
+    return ventas
+
+
+def generar_inventario(n: int) -> list:
+    rnd = random.Random(7)
+    bodegas = ('0001', '0002', '0003', '0004', '0010')
+    return [{
+        'BODEGA': bodegas[i % len(bodegas)],
+        'REFERENCIA': f"REF{i // len(bodegas):05d}",
+        'NOMREF': f"PRODUCTO {i // len(bodegas)}",
+        'CANTIDAD': rnd.choice((0, 0, 1, 2, 3, 4, 6, 10, 24)),
+        'VCOSTO': round(rnd.uniform(800, 200_000), 2),
+        'VVENTA': round(rnd.uniform(1_000, 250_000), 2),
+        'OBSERV1': rnd.choice(('', '', '', 'AGOTADO '))
+    } for i in range(n)]
+
+
+# ============================================
+# MEDICIÓN
+# ============================================
+
+def paginas(registros: list):
+    for i in range(0, len(registros), TAMANO_PAGINA):
+        yield registros[i:i + TAMANO_PAGINA]
+
+
+def medir(nombre: str, registros: list, transformar, repeticiones: int) -> float:
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        for pagina in paginas(registros):
+            transformar(pagina)
+        mejor = min(mejor, time.perf_counter() - t0)
+    filas_s = len(registros) / mejor
+    print(f"  {nombre:<36} {mejor:>7.3f} s  {filas_s:>12,.0f} filas/s")
+    return filas_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark de transformación por lotes')
+    parser.add_argument('--filas', type=int, default=100_000)
+    parser.add_argument('--repeticiones', type=int, default=3, help='Se reporta la mejor')
+    args = parser.parse_args()
+
+    casos = [
+        ('ventas', generar_ventas(args.filas), fila_venta_previa, TRANSFORMADOR_VENTAS),
+        ('inventario', generar_inventario(args.filas), fila_inventario_previa, TRANSFORMADOR_INVENTARIO),
+    ]
+
+    print(f"\n=== {args.filas:,} filas, páginas de {TAMANO_PAGINA:,} ===")
+    resumen = []
+    for nombre, registros, previa, transformador in casos:
+        print(f"\n{nombre}")
+        antes = medir('fila por fila -> tuplas', registros,
+                      lambda p: [previa(r) for r in p], args.repeticiones)
+        despues = medir('columnar -> tuplas', registros,
+                        lambda p: transformador.transformar(p).filas(), args.repeticiones)
+        antes_copy = medir('fila por fila -> texto COPY', registros,
+                           lambda p: copy_previo(previa(r) for r in p), args.repeticiones)
+        despues_copy = medir('columnar -> texto COPY', registros,
+                             lambda p: sum(map(len, transformador.transformar(p).lineas_copy())), args.repeticiones)
+        resumen.append((nombre, despues / antes, despues_copy / antes_copy))
+
+    print("\n" + "=" * 60)
+    print("RESUMEN (columnar vs fila por fila)")
+    print("=" * 60)
+    for nombre, tuplas, copy in resumen:
+        print(f"  {nombre:<12} tuplas x{tuplas:.1f}   COPY x{copy:.1f}")
+
+
+if __name__ == "__main__":
+    main()
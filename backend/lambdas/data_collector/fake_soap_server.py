@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita srvAPI.asmx de fomplus para pruebas y benchmarks
+Responde GenerarInfoVentas y GenerarInformacionInventarios con datos sintéticos
+determinísticos, volumen y paginación configurables, latencia e inyección de
+errores. Reproduce la particularidad de la API de ventas: el array JSON llega
+antes del sobre XML (con el tag de resultado vacío).
+
+Ejecutar desde la raíz del proyecto:
+    python backend/lambdas/data_collector/fake_soap_server.py --puerto 8089 --ventas-por-dia 20000
+y apuntar el colector con:
+    VENTAS_API_URL=http://127.0.0.1:8089/srvAPI.asmx INVENTARIO_API_URL=http://127.0.0.1:8089/srvAPI.asmx
+"""
+
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.sax.saxutils import escape
+
+PREFIJO_FALSO = 'FAKE'    # Prefijo de los documentos de venta sintéticos
+REF_FALSA = 'FAKE-'       # Prefijo de las referencias sintéticas
+
+SOBRE_VENTAS = """<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema"><soap:Body><GenerarInfoVentasResponse xmlns="http://tempuri.org/"><GenerarInfoVentasResult /></GenerarInfoVentasResponse></soap:Body></soap:Envelope>"""
+
+SOBRE_INVENTARIO = """<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema"><soap:Body><GenerarInformacionInventariosResponse xmlns="http://tempuri.org/"><GenerarInformacionInventariosResult>{resultado}</GenerarInformacionInventariosResult><strError /></GenerarInformacionInventariosResponse></soap:Body></soap:Envelope>"""
+
+SOBRE_FALLA = """<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><soap:Fault><faultcode>soap:Server</faultcode><faultstring>{mensaje}</faultstring></soap:Fault></soap:Body></soap:Envelope>"""
+
+
+# ============================================
+# DATOS SINTÉTICOS
+# ============================================
+
+class Generador:
+    """
+    Datos determinísticos: la misma consulta devuelve siempre las mismas filas
+    """
+
+    def __init__(self, ventas_por_dia: int, referencias: int, inventario_items: int, bodegas: list):
+        self.ventas_por_dia = ventas_por_dia
+        self.referencias = referencias
+        self.inventario_items = inventario_items
+        self.bodegas = bodegas
+        rnd = random.Random(2024)
+        self.precios = [round(rnd.uniform(2_000, 350_000), 2) for _ in range(referencias)]
+
+    def ventas_dia(self, dia: date, hora_inicio: str = '00:00:00', hora_fin: str = '23:59:59') -> list:
+        rnd = random.Random(dia.toordinal())
+        ventas = []
+        for i in range(self.ventas_por_dia):
+            segundo = 6 * 3600 + i * (16 * 3600) // max(self.ventas_por_dia, 1)
+            hora = f"{segundo // 3600:02d}:{segundo % 3600 // 60:02d}:{segundo % 60:02d}"
+            # Los aleatorios se sacan antes de filtrar por hora: una venta es la
+            # misma sin importar la ventana horaria pedida
+            ref = rnd.randrange(self.referencias)
+            cantidad = rnd.choice((1, 1, 1, 2, 2, 3, 6))
+            descuento = rnd.choice((0, 0, 0, 5, 10))
+            cliente, nombre_cliente = rnd.randrange(50_000), rnd.randrange(50_000)
+            vendedor = rnd.randrange(40)
+            if not hora_inicio <= hora <= hora_fin:
+                continue
+            bruto = self.precios[ref] * cantidad
+            total = round(bruto * (100 - descuento) / 100, 2)
+            costo = round(total * 0.78, 2)
+            ventas.append({
+                'TIPMOV': 'FV',
+                'PREFIJO': PREFIJO_FALSO,
+                'NUMDOC': f"{dia:%y%m%d}{i // 3:06d}",
+                'FECHA': dia.isoformat(),
+                'HORA': hora,
+                'CEDULA': str(10_000_000 + cliente),
+                'NOMCED': f"CLIENTE {nombre_cliente}",
+                'CODSEC': '01',
+                'NOMSEC': 'ALMACENES',
+                'BODEGA': self.bodegas[i % len(self.bodegas)],
+                'REFER': f"{REF_FALSA}{ref:06d}",
+                'NOMREF': f"PRODUCTO SINTETICO {ref}",
+                'CANTID': cantidad,
+                'VALUND': self.precios[ref],
+                'VALTOT': total,
+                'PORDES': descuento,
+                'VALDES': round(bruto - total, 2),
+                'VCOSTO': costo,
+                'VALUTI': round(total - costo, 2),
+                'PORUTI': 22,
+                'PORIVA': 19,
+                'VENDED': f"V{vendedor:03d}",
+                'NOMVEN': f"VENDEDOR {vendedor}"
+            })
+        return ventas
+
+    def ventas(self, inicio: datetime, fin: datetime) -> list:
+        ventas = []
+        dia = inicio.date()
+        while dia <= fin.date():
+            hora_inicio = inicio.strftime('%H:%M:%S') if dia == inicio.date() else '00:00:00'
+            hora_fin = fin.strftime('%H:%M:%S') if dia == fin.date() else '23:59:59'
+            ventas.extend(self.ventas_dia(dia, hora_inicio, hora_fin))
+            dia += timedelta(days=1)
+        return ventas
+
+    def inventario(self, fecha: date, bodega: str, pagina: int, filas: int) -> list:
+        bodegas = [bodega] if bodega else self.bodegas
+        total = self.inventario_items if not bodega else self.inventario_items // len(self.bodegas)
+        items = []
+        for i in range((pagina - 1) * filas, min(pagina * filas, total)):
+            ref = i // len(bodegas)
+            rnd = random.Random(i * 7919 + fecha.toordinal())
+            items.append({
+                'BODEGA': bodegas[i % len(bodegas)],
+                'REFERENCIA': f"{REF_FALSA}{ref:06d}",
+                'NOMREF': f"PRODUCTO SINTETICO {ref}",
+                'CANTIDAD': rnd.choice((0, 0, 1, 2, 3, 5, 8, 12, 24)),
+                'VCOSTO': round(self.precios[ref % self.referencias] * 0.78, 2),
+                'VVENTA': self.precios[ref % self.referencias],
+                'OBSERV1': ''
+            })
+        return items
+
+
+# ============================================
+# SERVIDOR
+# ============================================
+
+def _parametro(cuerpo: str, tag: str) -> str:
+    encontrado = re.search(f'<{tag}>(.*?)</{tag}>', cuerpo, re.S)
+    return encontrado.group(1) if encontrado else ''
+
+
+class ManejadorSoap(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, como IIS
+    server_version = 'Microsoft-IIS/10.0'
+
+    def do_POST(self):
+        config = self.server.config
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        accion = self.headers.get('SOAPAction', '')
+
+        with self.server.lock:
+            self.server.llamadas += 1
+        rnd = random.Random()
+
+        time.sleep(config.latencia + rnd.uniform(0, config.jitter))
+
+        if rnd.random() < config.tasa_timeout:
+            time.sleep(config.demora_timeout)
+        if rnd.random() < config.tasa_error:
+            return self._responder(500, SOBRE_FALLA.format(mensaje='Error interno simulado'))
+
+        if 'GenerarInfoVentas' in accion or '<GenerarInfoVentas' in cuerpo:
+            inicio = datetime.fromisoformat(_parametro(cuerpo, 'datPar_FecIni'))
+            fin = datetime.fromisoformat(_parametro(cuerpo, 'datPar_FecFin'))
+            # Particularidad de la API real: JSON seguido del sobre XML
+            texto = json.dumps(self.server.generador.ventas(inicio, fin)) + SOBRE_VENTAS
+        elif 'GenerarInformacionInventarios' in accion or '<GenerarInformacionInventarios' in cuerpo:
+            items = self.server.generador.inventario(
+                datetime.fromisoformat(_parametro(cuerpo, 'datPar_Fecha')).date(),
+                _parametro(cuerpo, 'strPar_Bodega'),
+                int(_parametro(cuerpo, 'intPar_Pagina') or 1),
+                int(_parametro(cuerpo, 'intPar_Filas') or 1000)
+            )
+            texto = SOBRE_INVENTARIO.format(resultado=escape(json.dumps(items)))
+        else:
+            return self._responder(500, SOBRE_FALLA.format(mensaje=f'Operación no soportada: {accion}'))
+
+        if rnd.random() < config.tasa_corte:
+            return self._responder(200, texto, cortar=True)
+        self._responder(200, texto)
+
+    def _responder(self, status: int, texto: str, cortar: bool = False):
+        datos = texto.encode('utf-8')
+        comprimir = self.server.config.gzip and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if comprimir:
+            datos = gzip.compress(datos, compresslevel=1)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        if comprimir:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+
+        if cortar:
+            # Respuesta truncada: se anuncia el largo completo y se cierra a la mitad
+            self.wfile.write(datos[:len(datos) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(datos)
+
+    def log_message(self, formato, *args):
+        if self.server.config.verbose:
+            super().log_message(formato, *args)
+
+
+def crear_servidor(config, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    servidor = ThreadingHTTPServer((host, config.puerto), ManejadorSoap)
+    servidor.daemon_threads = True
+    servidor.config = config
+    servidor.lock = threading.Lock()
+    servidor.llamadas = 0
+    servidor.generador = Generador(config.ventas_por_dia, config.referencias,
+                                   config.inventario_items, config.bodegas)
+    return servidor
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor SOAP falso (srvAPI.asmx)')
+    parser.add_argument('--puerto', type=int, default=8089, help='0 = puerto libre')
+    parser.add_argument('--ventas-por-dia', type=int, default=5_000)
+    parser.add_argument('--referencias', type=int, default=5_000)
+    parser.add_argument('--inventario-items', type=int, default=25_000, help='Items totales (todas las bodegas)')
+    parser.add_argument('--bodegas', nargs='+', default=['0001', '0002', '0003', '0004', '0010'])
+    parser.add_argument('--latencia', type=float, default=0.0, help='Segundos por llamada')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Segundos aleatorios adicionales')
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='Probabilidad de HTTP 500')
+    parser.add_argument('--tasa-timeout', type=float, default=0.0, help='Probabilidad de demorar la respuesta')
+    parser.add_argument('--demora-timeout', type=float, default=30.0, help='Segundos de demora inyectada')
+    parser.add_argument('--tasa-corte', type=float, default=0.0, help='Probabilidad de cortar la respuesta')
+    parser.add_argument('--sin-gzip', dest='gzip', action='store_false', help='No comprimir respuestas')
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main():
+    config = parsear_argumentos()
+    servidor = crear_servidor(config)
+    # Primera línea: puerto real (la usa bench_colector.py con --puerto 0)
+    print(f"PUERTO {servidor.server_port}", flush=True)
+    print(f"Servidor SOAP falso en http://127.0.0.1:{servidor.server_port}/srvAPI.asmx", file=sys.stderr)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
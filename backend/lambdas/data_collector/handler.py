@@ -5,9 +5,31 @@ Extrae datos de APIs SOAP (Ventas e Inventario) y los carga a PostgreSQL
 
 import json
 import os
+import re
+import time
+import sys
+import hashlib
+import random
+import math
+import gzip
+import codecs
 import logging
+import queue
+import threading
+import contextvars
+import functools
+import inspect
+import sqlite3
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+from urllib.parse import urlsplit
 import xml.etree.ElementTree as ET
 
 import requests
@@ -22,18 +44,18 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def get_http_session():
+def get_http_session(pool_maxsize: int = 10, reintentos: int = 3):
     """Crea una sesión HTTP con reintentos y configuración robusta"""
     session = requests.Session()
     
-    # Configurar reintentos
+    # Configurar reintentos (con 0, los 429/5xx llegan tal cual al llamador)
     retry_strategy = Retry(
-        total=3,
+        total=reintentos,
         backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
+        status_forcelist=[429, 500, 502, 503, 504] if reintentos else [],
     )
     
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=pool_maxsize)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
     
@@ -43,9 +65,9 @@ def get_http_session():
 # CONFIGURACIÓN
 # ============================================
 
-# APIs SOAP
-VENTAS_API_URL = "https://gspapiest.fomplus.com/srvAPI.asmx"
-INVENTARIO_API_URL = "https://gspapi.fomplus.com/srvAPI.asmx"
+# APIs SOAP (sobrescribibles para apuntar a fake_soap_server.py)
+VENTAS_API_URL = os.environ.get('VENTAS_API_URL', "https://gspapiest.fomplus.com/srvAPI.asmx")
+INVENTARIO_API_URL = os.environ.get('INVENTARIO_API_URL', "https://gspapi.fomplus.com/srvAPI.asmx")
 
 # Token (en producción usar Secrets Manager)
 API_TOKEN = os.environ.get('API_TOKEN', '0db03ce0e7f6ad6d153f7d53585fff6b')
@@ -54,417 +76,3936 @@ API_TOKEN = os.environ.get('API_TOKEN', '0db03ce0e7f6ad6d153f7d53585fff6b')
 EMPRESA = os.environ.get('EMPRESA', 'GSPSAS')  # Ajustar según tu config
 BASE_DATOS = os.environ.get('BASE_DATOS', 'GSPSAS')  # Ajustar según tu config
 
+# Empresa a colectar en lugar de EMPRESA/BASE_DATOS: lista JSON de configuraciones, p.ej.
+# [{"empresa": "GSPSAS", "base_datos": "GSPSAS", "llamadas_soap": 4}]
+# (vacío = solo EMPRESA/BASE_DATOS). Se puede sobrescribir con event['empresas'].
+# ventas e inventario_actual no tienen columna de empresa: una segunda empresa
+# sobre las mismas tablas pisaría las filas de la primera, así que se rechaza.
+EMPRESAS_CONFIG = os.environ.get('EMPRESAS_CONFIG', '')
+EMPRESAS_CONCURRENCIA = int(os.environ.get('EMPRESAS_CONCURRENCIA', '2'))  # Empresas colectadas en paralelo
+EMPRESA_LLAMADAS_SOAP = int(os.environ.get('EMPRESA_LLAMADAS_SOAP', '0'))  # Llamadas SOAP simultáneas por empresa; 0 = sin límite
+
+# Streaming de ventas: decodifica la respuesta por lotes en vez de cargarla completa
+VENTAS_STREAMING = os.environ.get('VENTAS_STREAMING', '').lower() in ('1', 'true', 'si')
+VENTAS_LOTE_STREAMING = int(os.environ.get('VENTAS_LOTE_STREAMING', '5000'))
+STREAMING_CHUNK_BYTES = 64 * 1024
+
+# Extracción incremental de ventas por watermark (requiere migration_v6_watermark_ventas.sql)
+VENTAS_INCREMENTAL = os.environ.get('VENTAS_INCREMENTAL', '').lower() in ('1', 'true', 'si')
+VENTAS_RECONCILIACION_DIAS = int(os.environ.get('VENTAS_RECONCILIACION_DIAS', '2'))  # Días que re-revisa la reconciliación
+
+# Prefiltro de duplicados de ventas: las claves ya cargadas en la ventana de la
+# corrida se descartan en memoria antes de llegar a la BD
+VENTAS_PREFILTRO = os.environ.get('VENTAS_PREFILTRO', '').lower() in ('1', 'true', 'si')
+
+# División adaptativa de rangos de ventas (requiere migration_v8_granularidad_ventas.sql)
+VENTAS_ADAPTATIVO = os.environ.get('VENTAS_ADAPTATIVO', '').lower() in ('1', 'true', 'si')
+VENTAS_MAX_FILAS_POR_LLAMADA = int(os.environ.get('VENTAS_MAX_FILAS_POR_LLAMADA', '150000'))
+VENTAS_TIMEOUT_ADAPTATIVO = int(os.environ.get('VENTAS_TIMEOUT_ADAPTATIVO', '120'))  # Segundos antes de partir el rango
+
+# Ventas por tramos: el rango se parte en tramos de VENTAS_TRAMO_DIAS días que se
+# descargan en paralelo y se guardan a medida que llegan
+VENTAS_TRAMOS = os.environ.get('VENTAS_TRAMOS', '').lower() in ('1', 'true', 'si')
+VENTAS_TRAMO_DIAS = int(os.environ.get('VENTAS_TRAMO_DIAS', '1'))
+VENTAS_TRAMOS_CONCURRENCIA = int(os.environ.get('VENTAS_TRAMOS_CONCURRENCIA', '4'))  # Tramos en vuelo
+
+# Cuadre de ventas: compara por día y bodega (filas, SUM cantidad, SUM valor_total)
+# la API contra la tabla ventas y recarga solo los días que no cuadran
+VENTAS_CUADRE_DIAS = int(os.environ.get('VENTAS_CUADRE_DIAS', '7'))  # Días (hasta ayer) que revisa el cuadre programado
+VENTAS_CUADRE_TOLERANCIA = Decimal(os.environ.get('VENTAS_CUADRE_TOLERANCIA', '0.01'))  # Diferencia admitida en las sumas
+
+# Paginación de inventario
+INVENTARIO_FILAS_POR_PAGINA = 1000
+INVENTARIO_MAX_PAGINAS = 100  # Límite de seguridad
+INVENTARIO_CONCURRENCIA = int(os.environ.get('INVENTARIO_CONCURRENCIA', '1'))  # 1 = secuencial
+
+# Pipeline descarga -> transformación -> escritura de inventario
+INVENTARIO_PIPELINE = os.environ.get('INVENTARIO_PIPELINE', '').lower() in ('1', 'true', 'si')
+INVENTARIO_PIPELINE_COLA = int(os.environ.get('INVENTARIO_PIPELINE_COLA', '2'))  # Páginas en espera
+
+# Sincronización delta: solo escribe filas nuevas o modificadas de inventario
+INVENTARIO_DELTA = os.environ.get('INVENTARIO_DELTA', '').lower() in ('1', 'true', 'si')
+
+# Inventario por bodega: una descarga y una transacción por almacén activo, en paralelo
+INVENTARIO_POR_BODEGA = os.environ.get('INVENTARIO_POR_BODEGA', '').lower() in ('1', 'true', 'si')
+INVENTARIO_BODEGAS_CONCURRENCIA = int(os.environ.get('INVENTARIO_BODEGAS_CONCURRENCIA', '4'))  # Bodegas en paralelo
+
+# Cliente SOAP
+SOAP_TIMEOUT = 300
+SOAP_POOL_SIZE = int(os.environ.get('SOAP_POOL_SIZE', '10'))  # Conexiones keep-alive por host
+
+# Control adaptativo de llamadas simultáneas por host (AIMD) con circuit breaker.
+# Activo, la sesión no reintenta: cada intento (SOAP_INTENTOS_ADAPTATIVO) pasa
+# por el limitador, que ve el status real y absorbe la sobrecarga
+SOAP_ADAPTATIVO = os.environ.get('SOAP_ADAPTATIVO', '').lower() in ('1', 'true', 'si')
+SOAP_LIMITE_INICIAL = int(os.environ.get('SOAP_LIMITE_INICIAL', '4'))
+SOAP_LIMITE_MIN = int(os.environ.get('SOAP_LIMITE_MIN', '1'))
+SOAP_LIMITE_MAX = int(os.environ.get('SOAP_LIMITE_MAX', '16'))
+SOAP_AIMD_RETROCESO = float(os.environ.get('SOAP_AIMD_RETROCESO', '0.5'))  # Factor del límite ante una falla
+SOAP_AIMD_TOLERANCIA = float(os.environ.get('SOAP_AIMD_TOLERANCIA', '3'))  # Latencia / mínima reciente que cuenta como lenta
+SOAP_CIRCUITO_FALLAS = int(os.environ.get('SOAP_CIRCUITO_FALLAS', '5'))  # Fallas seguidas que abren el circuito
+SOAP_CIRCUITO_ESPERA = int(os.environ.get('SOAP_CIRCUITO_ESPERA', '30'))  # Segundos abierto antes de la llamada de prueba
+SOAP_INTENTOS_ADAPTATIVO = int(os.environ.get('SOAP_INTENTOS_ADAPTATIVO', '4'))  # Intentos por llamada (5xx, 429, conexión)
+
+# Archivo de respuestas SOAP crudas: directorio local o s3://bucket/prefijo (vacío = desactivado)
+SOAP_ARCHIVO = os.environ.get('SOAP_ARCHIVO', '')
+# Replay: las respuestas se leen del archivo, sin llamar a la API
+SOAP_REPLAY = os.environ.get('SOAP_REPLAY', '').lower() in ('1', 'true', 'si')
+
+# Spool en disco entre la descarga SOAP y la carga a la BD (SQLite). En Lambda
+# /tmp solo sobrevive en contenedores calientes; para durabilidad real montar EFS
+# y apuntar SPOOL_DIR al punto de montaje
+SPOOL = os.environ.get('SPOOL', '').lower() in ('1', 'true', 'si')
+SPOOL_DIR = os.environ.get('SPOOL_DIR', '/tmp/spool_ingesta')
+SPOOL_LOTE_FILAS = int(os.environ.get('SPOOL_LOTE_FILAS', '20000'))  # Filas por carga del drenador
+
+# Carga masiva con COPY + tablas staging (requiere migration_v4_carga_masiva.sql)
+# Lotes con al menos este número de filas usan COPY; 0 = desactivado
+CARGA_COPY_MIN_FILAS = int(os.environ.get('CARGA_COPY_MIN_FILAS', '0'))
+
+# tipo='ambos': ventas e inventario en paralelo, cada uno con su conexión
+AMBOS_CONCURRENTE = os.environ.get('AMBOS_CONCURRENTE', '').lower() in ('1', 'true', 'si')
+
+# Corridas con plazo: antes del timeout del Lambda la corrida se detiene tras el
+# último lote confirmado y se re-invoca con un evento de continuación
+# (checkpoints en migration_v11_checkpoints.sql). El margen debe cubrir el lote
+# más lento en curso (un tramo de ventas o una bodega).
+PLAZO_MARGEN_S = int(os.environ.get('PLAZO_MARGEN_S', '45'))  # Segundos reservados antes del timeout
+CONTINUACION_AUTOMATICA = os.environ.get('CONTINUACION_AUTOMATICA', 'true').lower() in ('1', 'true', 'si')
+CONTINUACION_MAX = int(os.environ.get('CONTINUACION_MAX', '20'))  # Continuaciones encadenadas como máximo
+
+# Recursos reutilizados entre invocaciones del mismo contenedor (warm start)
+DB_SECRET_TTL = int(os.environ.get('DB_SECRET_TTL', '900'))  # Segundos que se cachea el secreto
+
+# Cache de valores del catálogo de productos: solo se escriben productos nuevos o
+# modificados. Segundos antes de recargarlo de la tabla; 0 = desactivado
+PRODUCTOS_CACHE_TTL = int(os.environ.get('PRODUCTOS_CACHE_TTL', '3600'))
+
+# Validación fila por fila antes de escribir; las filas rechazadas van a
+# cuarentena_ingesta y el resto del lote se confirma (requiere migration_v10_cuarentena.sql)
+VALIDACION_FILAS = os.environ.get('VALIDACION_FILAS', '').lower() in ('1', 'true', 'si')
+ALMACENES_CACHE_TTL = int(os.environ.get('ALMACENES_CACHE_TTL', '900'))  # Segundos que se cachean los códigos
+
+# Métricas por etapa de cada corrida: CloudWatch EMF + tabla ingest_runs (requiere migration_v9_ingest_runs.sql)
+METRICAS_NAMESPACE = os.environ.get('METRICAS_NAMESPACE', 'StockIQ/Colector')
+METRICAS_PERSISTIR = os.environ.get('METRICAS_PERSISTIR', 'true').lower() in ('1', 'true', 'si')
+
+# ============================================
+# EMPRESAS
+# ============================================
+
+class ConfigEmpresa:
+    """
+    Empresa (ventas) y base de datos (inventario) de fomplus a colectar, con
+    su propio límite de llamadas SOAP simultáneas. La sesión HTTP y las
+    conexiones a PostgreSQL son compartidas entre empresas.
+    """
+    
+    def __init__(self, empresa: str, base_datos: str = None, token: str = None,
+                 llamadas_soap: int = EMPRESA_LLAMADAS_SOAP):
+        self.empresa = empresa
+        self.base_datos = base_datos or empresa
+        self.token = token or API_TOKEN
+        self.llamadas_soap = llamadas_soap
+        self._semaforo = threading.BoundedSemaphore(llamadas_soap) if llamadas_soap else None
+    
+    def configuracion(self) -> dict:
+        """Dict aceptado por ConfigEmpresa.desde (el token solo si no es el global)"""
+        config = {'empresa': self.empresa, 'base_datos': self.base_datos, 'llamadas_soap': self.llamadas_soap}
+        if self.token != API_TOKEN:
+            config['token'] = self.token
+        return config
+    
+    @contextmanager
+    def turno_soap(self):
+        """Espera un cupo de llamada SOAP de la empresa (sin límite si llamadas_soap = 0)"""
+        if self._semaforo is None:
+            yield
+            return
+        with self._semaforo:
+            yield
+    
+    @classmethod
+    def desde(cls, config) -> 'ConfigEmpresa':
+        """Desde un nombre de empresa o un dict con empresa/base_datos/token/llamadas_soap"""
+        if isinstance(config, str):
+            return cls(config)
+        return cls(config['empresa'], config.get('base_datos'), config.get('token'),
+                   int(config.get('llamadas_soap', EMPRESA_LLAMADAS_SOAP)))
+
+
+EMPRESA_POR_DEFECTO = ConfigEmpresa(EMPRESA, BASE_DATOS)
+
+# Empresa que se está colectando en el contexto actual (los hilos de trabajo la
+# heredan vía contextvars.copy_context)
+_empresa_actual = contextvars.ContextVar('empresa', default=None)
+
+
+def empresa_actual() -> ConfigEmpresa:
+    return _empresa_actual.get() or EMPRESA_POR_DEFECTO
+
+
+def cargar_empresas(config) -> list:
+    """
+    Lista de ConfigEmpresa desde event['empresas'] o EMPRESAS_CONFIG (lista o
+    texto JSON); vacío = solo la empresa por defecto
+    
+    Raises:
+        ValueError: con más de una empresa. Las claves de ventas e
+            inventario_actual no incluyen la empresa, así que dos empresas
+            sobre las mismas tablas se sobrescribirían entre sí.
+    """
+    if isinstance(config, str):
+        config = json.loads(config) if config.strip() else []
+    empresas = [ConfigEmpresa.desde(c) for c in config or []]
+    nombres = [e.empresa for e in empresas]
+    if len(set(nombres)) != len(nombres):
+        raise ValueError(f"Empresas repetidas en la configuración: {nombres}")
+    if len(empresas) > 1:
+        raise ValueError(f"Una sola empresa por base de datos: ventas e inventario_actual no distinguen "
+                         f"empresa y {nombres} se sobrescribirían entre sí")
+    return empresas
+
+
+# ============================================
+# PLAZO DE EJECUCIÓN
+# ============================================
+
+class PlazoEjecucion:
+    """
+    Tiempo restante de la invocación según el context del Lambda
+    
+    Sin context (scripts, pruebas locales) nunca vence. `corrida` identifica la
+    corrida a través de sus continuaciones (checkpoints_ingesta).
+    """
+    
+    def __init__(self, context=None, corrida: str = None, continuacion: int = 0, margen: int = PLAZO_MARGEN_S):
+        self.context = context
+        self.margen = margen
+        self.continuacion = continuacion
+        self.corrida = corrida or getattr(context, 'aws_request_id', None) or uuid.uuid4().hex
+    
+    @property
+    def activo(self) -> bool:
+        return hasattr(self.context, 'get_remaining_time_in_millis')
+    
+    def restante(self) -> float:
+        """Segundos hasta el timeout del Lambda"""
+        if not self.activo:
+            return float('inf')
+        return self.context.get_remaining_time_in_millis() / 1000
+    
+    def vencido(self) -> bool:
+        return self.restante() <= self.margen
+
+
+_SIN_PLAZO = PlazoEjecucion()
+_plazo_actual = contextvars.ContextVar('plazo', default=None)
+
+
+def plazo_actual() -> PlazoEjecucion:
+    return _plazo_actual.get() or _SIN_PLAZO
+
+
+def plazo_vencido() -> bool:
+    """True si ya no hay tiempo para empezar otro lote antes del timeout"""
+    return plazo_actual().vencido()
+
+
+# ============================================
+# MÉTRICAS DE INGESTA
+# ============================================
+
+ETAPAS_INGESTA = ('http', 'parse', 'transform', 'db_write', 'commit')
+CONTADORES_INGESTA = ('bytes', 'bytes_red', 'llamadas', 'filas', 'rechazadas', 'filtradas')
+
+
+class MetricasIngesta:
+    """
+    Tiempo por etapa de una corrida de ingesta (ventas o inventario), en total
+    y por página
+    
+    Las etapas se miden en tiempo exclusivo: una etapa anidada en otra (la
+    espera HTTP dentro del parseo en streaming, la transformación dentro de la
+    escritura COPY) se descuenta de la que la contiene. Con hilos en paralelo
+    las etapas pueden sumar más que la duración de la corrida.
+    """
+    
+    def __init__(self, fuente: str, empresa: str = None):
+        self.fuente = fuente
+        self.empresa = empresa or empresa_actual().empresa
+        self.inicio = datetime.now()
+        self.segundos = None
+        self.estado = None
+        self.error = None
+        self.resultado = None
+        self.totales = dict.fromkeys(ETAPAS_INGESTA + CONTADORES_INGESTA, 0)
+        self.paginas = {}   # pagina -> mismos campos que totales
+        self.limites_soap = {}  # host -> límite adaptativo y circuito al terminar (SOAP_ADAPTATIVO)
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._pilas = threading.local()
+    
+    def sumar(self, clave: str, valor):
+        """Acumula en la corrida y en la página activa del contexto (si hay)"""
+        pagina = _pagina_actual.get()
+        with self._lock:
+            self.totales[clave] += valor
+            if pagina is not None:
+                registro = self.paginas.get(pagina)
+                if registro is None:
+                    registro = self.paginas[pagina] = dict.fromkeys(self.totales, 0)
+                registro[clave] += valor
+    
+    @contextmanager
+    def etapa(self, nombre: str):
+        pila = self._pilas.__dict__.setdefault('marcos', [])
+        anidados = [0.0]    # Segundos de etapas anidadas en esta
+        pila.append(anidados)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            pila.pop()
+            if pila:
+                pila[-1][0] += duracion
+            self.sumar(nombre, duracion - anidados[0])
+    
+    def finalizar(self, respuesta: dict = None, error: Exception = None):
+        self.segundos = time.perf_counter() - self._t0
+        if error is not None:
+            self.estado, self.error = 'error', str(error)
+            return
+        self.resultado = json.loads(respuesta['body']) if respuesta and 'body' in respuesta else {}
+        self.estado = 'ok' if respuesta and respuesta.get('statusCode') == 200 else 'error'
+        self.error = self.resultado.get('error')
+    
+    def resumen(self) -> dict:
+        resumen = {etapa: round(self.totales[etapa], 4) for etapa in ETAPAS_INGESTA}
+        resumen.update({c: self.totales[c] for c in CONTADORES_INGESTA})
+        resumen['paginas'] = len(self.paginas)
+        if self.limites_soap:
+            resumen['limites_soap'] = {host: l['limite'] for host, l in self.limites_soap.items()}
+        resumen['segundos'] = round(self.segundos, 4) if self.segundos is not None else None
+        return resumen
+    
+    def emf(self) -> list:
+        """
+        Registros en CloudWatch Embedded Metric Format: uno por corrida y uno
+        por página (el número de página va como propiedad, no como dimensión)
+        """
+        def registro(nivel: str, valores: dict, **propiedades) -> dict:
+            metricas = [{'Name': f"{etapa}_s", 'Unit': 'Seconds'} for etapa in ETAPAS_INGESTA]
+            metricas += [{'Name': c, 'Unit': 'Bytes' if c.startswith('bytes') else 'Count'} for c in CONTADORES_INGESTA]
+            datos = {
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': METRICAS_NAMESPACE,
+                        'Dimensions': [['Fuente', 'Empresa', 'Nivel']],
+                        'Metrics': metricas
+                    }]
+                },
+                'Fuente': self.fuente,
+                'Empresa': self.empresa,
+                'Nivel': nivel
+            }
+            datos.update({f"{etapa}_s": round(valores[etapa], 4) for etapa in ETAPAS_INGESTA})
+            datos.update({c: valores[c] for c in CONTADORES_INGESTA})
+            datos.update(propiedades)
+            return datos
+        
+        corrida = registro('corrida', self.totales, estado=self.estado, paginas=len(self.paginas),
+                           inicio=self.inicio.isoformat(timespec='seconds'), limites_soap=self.limites_soap)
+        corrida['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': 'duracion_s', 'Unit': 'Seconds'})
+        corrida['duracion_s'] = round(self.segundos or 0, 4)
+        return [corrida] + [registro('pagina', valores, pagina=pagina) for pagina, valores in self.paginas.items()]
+
+
+# Corrida y página activas en el contexto actual (los hilos de trabajo las
+# heredan vía contextvars.copy_context)
+_metricas_activas = contextvars.ContextVar('metricas_ingesta', default=None)
+_pagina_actual = contextvars.ContextVar('pagina_ingesta', default=None)
+
+
+@contextmanager
+def medir(etapa: str):
+    """Mide una etapa de la corrida activa (sin corrida activa no hace nada)"""
+    metricas = _metricas_activas.get()
+    if metricas is None:
+        yield
+        return
+    with metricas.etapa(etapa):
+        yield
+
+
+def contar(**valores):
+    """Suma contadores (bytes, filas, ...) a la corrida activa"""
+    metricas = _metricas_activas.get()
+    if metricas is not None:
+        for clave, valor in valores.items():
+            metricas.sumar(clave, valor)
+
+
+@contextmanager
+def pagina_ingesta(pagina, filas: int = 0):
+    """Atribuye a `pagina` las etapas medidas dentro del bloque"""
+    token = _pagina_actual.set(pagina)
+    try:
+        if filas:
+            contar(filas=filas)
+        yield
+    finally:
+        _pagina_actual.reset(token)
+
+
+def _confirmar(conn):
+    """conn.commit() medido como etapa 'commit'"""
+    with medir('commit'):
+        conn.commit()
+
+
+def registrar_corrida(conn, metricas: MetricasIngesta):
+    """
+    Guarda el resumen de la corrida en ingest_runs
+    """
+    t = metricas.totales
+    detalle = {
+        'resultado': metricas.resultado,
+        'rechazadas': t['rechazadas'],
+        'filtradas': t['filtradas'],
+        'limites_soap': metricas.limites_soap,
+        'paginas': {str(p): {k: round(v, 4) if isinstance(v, float) else v for k, v in valores.items()}
+                    for p, valores in metricas.paginas.items()}
+    }
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO ingest_runs (empresa, fuente, inicio, duracion_s, estado, filas, paginas, llamadas,
+                                     bytes, bytes_red, http_s, parse_s, transform_s, db_write_s, commit_s,
+                                     detalle, error)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (metricas.empresa, metricas.fuente, metricas.inicio, round(metricas.segundos, 3), metricas.estado,
+              t['filas'], len(metricas.paginas), t['llamadas'], t['bytes'], t['bytes_red'],
+              *(round(t[etapa], 3) for etapa in ETAPAS_INGESTA),
+              json.dumps(detalle, default=str), (metricas.error or '')[:1000] or None))
+    conn.commit()
+
+
+def publicar_metricas(metricas: MetricasIngesta):
+    """
+    Emite los registros EMF y persiste el resumen; un fallo al persistir no
+    afecta el resultado de la corrida
+    """
+    # print y no logger: CloudWatch solo interpreta EMF si la línea es JSON puro
+    for registro in metricas.emf():
+        print(json.dumps(registro, default=str), flush=True)
+    
+    if not METRICAS_PERSISTIR:
+        return
+    conn = None
+    try:
+        conn = obtener_conexion()
+        registrar_corrida(conn, metricas)
+    except Exception as e:
+        logger.warning(f"No se pudo registrar la corrida en ingest_runs: {e}")
+    finally:
+        if conn is not None:
+            liberar_conexion(conn)
+
+
+def con_metricas(fuente: str):
+    """
+    Decorador de handlers: abre una corrida de métricas para la invocación,
+    y al terminar la emite en EMF y la registra en ingest_runs
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(event, context):
+            metricas = MetricasIngesta(fuente)
+            token = _metricas_activas.set(metricas)
+            try:
+                respuesta = funcion(event, context)
+            except Exception as e:
+                metricas.finalizar(error=e)
+                raise
+            else:
+                metricas.finalizar(respuesta)
+                return respuesta
+            finally:
+                _metricas_activas.reset(token)
+                metricas.limites_soap = soap_client.limites()
+                logger.info(f"Métricas {fuente}: {metricas.resumen()}")
+                publicar_metricas(metricas)
+        return envoltura
+    return decorador
+
+
+# ============================================
+# ARCHIVO DE RESPUESTAS SOAP
+# ============================================
+
+class RespuestaNoArchivada(KeyError):
+    """No hay respuesta archivada para la operación y parámetros pedidos"""
+
+
+class _AlmacenLocal:
+    """Archivo en un directorio local"""
+    
+    def __init__(self, raiz: str):
+        self.raiz = raiz
+    
+    def leer(self, ruta: str):
+        try:
+            with open(os.path.join(self.raiz, ruta), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def escribir(self, ruta: str, datos: bytes):
+        destino = os.path.join(self.raiz, ruta)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, destino)  # Atómico: un lector nunca ve un archivo a medias
+    
+    def existe(self, ruta: str) -> bool:
+        return os.path.exists(os.path.join(self.raiz, ruta))
+    
+    def listar(self, prefijo: str):
+        base = os.path.join(self.raiz, prefijo)
+        for directorio, _, archivos in os.walk(base):
+            for nombre in sorted(archivos):
+                if not nombre.endswith('.tmp'):
+                    yield os.path.relpath(os.path.join(directorio, nombre), self.raiz)
+
+
+class _AlmacenS3:
+    """Archivo en un bucket S3 (s3://bucket/prefijo)"""
+    
+    def __init__(self, bucket: str, prefijo: str):
+        self.bucket = bucket
+        self.prefijo = prefijo.strip('/')
+        self._s3 = boto3.client('s3')
+    
+    def _clave(self, ruta: str) -> str:
+        return f"{self.prefijo}/{ruta}" if self.prefijo else ruta
+    
+    def leer(self, ruta: str):
+        try:
+            return self._s3.get_object(Bucket=self.bucket, Key=self._clave(ruta))['Body'].read()
+        except self._s3.exceptions.NoSuchKey:
+            return None
+    
+    def escribir(self, ruta: str, datos: bytes):
+        self._s3.put_object(Bucket=self.bucket, Key=self._clave(ruta), Body=datos)
+    
+    def existe(self, ruta: str) -> bool:
+        try:
+            self._s3.head_object(Bucket=self.bucket, Key=self._clave(ruta))
+            return True
+        except self._s3.exceptions.ClientError:
+            return False
+    
+    def listar(self, prefijo: str):
+        inicio = len(self._clave(''))
+        for pagina in self._s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket,
+                                                                        Prefix=self._clave(prefijo)):
+            for objeto in pagina.get('Contents', []):
+                yield objeto['Key'][inicio:]
+
+
+class ArchivoSoap:
+    """
+    Archivo de respuestas SOAP crudas, comprimidas y direccionadas por contenido
+    
+    Estructura:
+        objetos/<sha[:2]>/<sha256>.gz          cuerpo de la respuesta (gzip)
+        indice/<operacion>/<clave>.json        parámetros -> sha256 (última captura)
+    
+    La clave del índice es el sha256 de los parámetros de la llamada (sin el
+    token), así que una misma consulta se puede reproducir sin red; respuestas
+    idénticas se guardan una sola vez.
+    """
+    
+    def __init__(self, almacen):
+        self.almacen = almacen
+    
+    @staticmethod
+    def clave_parametros(operacion: str, parametros: dict) -> str:
+        canonico = json.dumps({'operacion': operacion, 'parametros': parametros}, sort_keys=True)
+        return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _ruta_objeto(sha: str) -> str:
+        return f"objetos/{sha[:2]}/{sha}.gz"
+    
+    def _ruta_indice(self, operacion: str, parametros: dict) -> str:
+        return f"indice/{operacion}/{self.clave_parametros(operacion, parametros)}.json"
+    
+    def guardar(self, operacion: str, parametros: dict, contenido: bytes) -> str:
+        """
+        Archiva una respuesta completa
+        
+        Returns:
+            sha256 del contenido
+        """
+        sha = hashlib.sha256(contenido).hexdigest()
+        if not self.almacen.existe(self._ruta_objeto(sha)):
+            self.almacen.escribir(self._ruta_objeto(sha), gzip.compress(contenido, compresslevel=6))
+        self.almacen.escribir(self._ruta_indice(operacion, parametros), json.dumps({
+            'operacion': operacion,
+            'parametros': parametros,
+            'sha256': sha,
+            'bytes': len(contenido),
+            'capturado': datetime.now().isoformat(timespec='seconds')
+        }, sort_keys=True).encode('utf-8'))
+        return sha
+    
+    def entrada(self, operacion: str, parametros: dict) -> dict:
+        datos = self.almacen.leer(self._ruta_indice(operacion, parametros))
+        if datos is None:
+            raise RespuestaNoArchivada(f"Respuesta no archivada: {operacion} {parametros}")
+        return json.loads(datos)
+    
+    def cargar(self, operacion: str, parametros: dict) -> bytes:
+        """Cuerpo archivado de la última respuesta para estos parámetros"""
+        sha = self.entrada(operacion, parametros)['sha256']
+        datos = self.almacen.leer(self._ruta_objeto(sha))
+        if datos is None:
+            raise RespuestaNoArchivada(f"Objeto {sha} ausente ({operacion} {parametros})")
+        return gzip.decompress(datos)
+    
+    def entradas(self, operacion: str = None):
+        """Entradas del índice (todas o de una operación)"""
+        for ruta in self.almacen.listar(f"indice/{operacion}" if operacion else 'indice'):
+            if ruta.endswith('.json'):
+                yield json.loads(self.almacen.leer(ruta))
+
+
+def abrir_archivo(destino: str):
+    """
+    ArchivoSoap para un directorio local o 's3://bucket/prefijo' (None si vacío)
+    """
+    if not destino:
+        return None
+    if destino.startswith('s3://'):
+        bucket, _, prefijo = destino[len('s3://'):].partition('/')
+        return ArchivoSoap(_AlmacenS3(bucket, prefijo))
+    return ArchivoSoap(_AlmacenLocal(destino))
+
+
+# ============================================
+# CONTROL ADAPTATIVO DE CONCURRENCIA
+# ============================================
+
+class CircuitoAbierto(Exception):
+    """El host acumuló fallas seguidas: la llamada se rechaza sin enviarse"""
+
+
+class LimitadorAdaptativo:
+    """
+    Límite de llamadas simultáneas a un host SOAP ajustado por AIMD
+    
+    Cada llamada exitosa con todos los cupos ocupados suma 1/límite (≈ +1 por
+    ronda de llamadas); una falla
+    (5xx, 429, timeout o error de conexión) multiplica el límite por
+    SOAP_AIMD_RETROCESO y una respuesta lenta (SOAP_AIMD_TOLERANCIA veces la
+    latencia mínima reciente) lo reduce un 10%, como máximo una reducción por
+    ronda. Tras SOAP_CIRCUITO_FALLAS fallas seguidas el circuito se abre: las
+    llamadas fallan de inmediato durante SOAP_CIRCUITO_ESPERA segundos y luego
+    una sola llamada de prueba lo cierra o lo vuelve a abrir.
+    """
+    
+    def __init__(self, host: str, inicial: int = SOAP_LIMITE_INICIAL, minimo: int = SOAP_LIMITE_MIN,
+                 maximo: int = SOAP_LIMITE_MAX):
+        self.host = host
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.limite = float(min(max(inicial, self.minimo), self.maximo))
+        self.en_vuelo = 0
+        self.estado = 'cerrado'     # 'cerrado' | 'abierto' | 'semiabierto'
+        self._fallas_seguidas = 0
+        self._reabrir = 0.0
+        self._prueba_en_curso = False
+        self._ultima_reduccion = 0.0
+        self._latencias = deque(maxlen=50)
+        self._condicion = threading.Condition()
+        self._reiniciar_contadores()
+    
+    def _reiniciar_contadores(self):
+        self.aperturas = 0
+        self.reducciones = 0
+        self.rechazadas = 0
+        self.limite_min = self.limite_max = self.limite
+    
+    def adquirir(self):
+        """
+        Espera un cupo; lanza CircuitoAbierto si el circuito está abierto
+        
+        Returns:
+            True si la llamada es la prueba del circuito semiabierto
+        """
+        with self._condicion:
+            while True:
+                if self.estado == 'abierto' and time.monotonic() >= self._reabrir:
+                    self.estado = 'semiabierto'
+                if self.estado == 'abierto' or (self.estado == 'semiabierto' and self._prueba_en_curso):
+                    self.rechazadas += 1
+                    raise CircuitoAbierto(f"Circuito abierto para {self.host} "
+                                          f"({self._fallas_seguidas} fallas seguidas)")
+                if self.estado == 'semiabierto':
+                    self._prueba_en_curso = True
+                    self.en_vuelo += 1
+                    return True
+                if self.en_vuelo < int(self.limite):
+                    self.en_vuelo += 1
+                    return False
+                self._condicion.wait()
+    
+    def liberar(self, segundos: float, exito: bool, prueba: bool = False):
+        with self._condicion:
+            saturado = self.en_vuelo >= int(self.limite)
+            self.en_vuelo -= 1
+            if prueba:
+                self._prueba_en_curso = False
+            
+            if exito:
+                self._fallas_seguidas = 0
+                if prueba:
+                    self.estado = 'cerrado'
+                    logger.info(f"Circuito cerrado para {self.host}")
+                lenta = len(self._latencias) >= 5 and segundos > min(self._latencias) * SOAP_AIMD_TOLERANCIA
+                self._latencias.append(segundos)
+                if lenta:
+                    self._reducir(0.9)
+                elif saturado:
+                    # Solo crece si el límite actual se está usando completo
+                    self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            else:
+                self._fallas_seguidas += 1
+                self._reducir(SOAP_AIMD_RETROCESO)
+                if prueba or (self.estado == 'cerrado' and self._fallas_seguidas >= SOAP_CIRCUITO_FALLAS):
+                    self.estado = 'abierto'
+                    self._reabrir = time.monotonic() + SOAP_CIRCUITO_ESPERA
+                    self.aperturas += 1
+                    logger.warning(f"Circuito abierto para {self.host} por {SOAP_CIRCUITO_ESPERA}s "
+                                   f"({self._fallas_seguidas} fallas seguidas)")
+            
+            self.limite_min = min(self.limite_min, self.limite)
+            self.limite_max = max(self.limite_max, self.limite)
+            self._condicion.notify_all()
+    
+    def _reducir(self, factor: float):
+        """Reducción multiplicativa, una por ronda (latencia de la llamada más reciente)"""
+        ahora = time.monotonic()
+        ronda = self._latencias[-1] if self._latencias else 0.0
+        if ahora - self._ultima_reduccion < ronda:
+            return
+        self._ultima_reduccion = ahora
+        self.limite = max(self.minimo, self.limite * factor)
+        self.reducciones += 1
+    
+    def estadisticas(self, reiniciar: bool = False) -> dict:
+        with self._condicion:
+            resultado = {
+                'limite': round(self.limite, 2),
+                'limite_min': round(self.limite_min, 2),
+                'limite_max': round(self.limite_max, 2),
+                'circuito': self.estado,
+                'aperturas': self.aperturas,
+                'reducciones': self.reducciones,
+                'rechazadas': self.rechazadas
+            }
+            if reiniciar:
+                # El límite aprendido se conserva entre invocaciones
+                self._reiniciar_contadores()
+        return resultado
+
+
+# ============================================
+# CLIENTE SOAP
+# ============================================
+
+# Sobres SOAP precompilados (solo se formatean los parámetros de cada llamada)
+SOBRE_VENTAS = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <GenerarInfoVentas xmlns="http://tempuri.org/">
+      <strPar_Empresa>{empresa}</strPar_Empresa>
+      <datPar_FecIni>{fecha_ini}</datPar_FecIni>
+      <datPar_FecFin>{fecha_fin}</datPar_FecFin>
+      <objPar_Objeto>{token}</objPar_Objeto>
+    </GenerarInfoVentas>
+  </soap:Body>
+</soap:Envelope>"""
+
+SOBRE_INVENTARIO = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <GenerarInformacionInventarios xmlns="http://tempuri.org/">
+      <datPar_Fecha>{fecha}</datPar_Fecha>
+      <strPar_Bodega>{bodega}</strPar_Bodega>
+      <bolPar_ConSaldo>true</bolPar_ConSaldo>
+      <bolPar_ConImg>false</bolPar_ConImg>
+      <strPar_Basedatos>{base_datos}</strPar_Basedatos>
+      <strPar_Token>{token}</strPar_Token>
+      <strError></strError>
+      <intPar_Filas>{filas}</intPar_Filas>
+      <intPar_Pagina>{pagina}</intPar_Pagina>
+      <intPar_LisPre>1</intPar_LisPre>
+      <bolPar_ConSer>false</bolPar_ConSer>
+    </GenerarInformacionInventarios>
+  </soap:Body>
+</soap:Envelope>"""
+
+# Headers por operación SOAP
+SOAP_HEADERS = {
+    operacion: {
+        'Content-Type': 'text/xml; charset=utf-8',
+        'SOAPAction': f'http://tempuri.org/{operacion}',
+        'Accept-Encoding': 'gzip, deflate',
+        'User-Agent': 'StockIQ/1.0'
+    }
+    for operacion in ('GenerarInfoVentas', 'GenerarInformacionInventarios')
+}
+
+
+class SoapClient:
+    """
+    Cliente SOAP persistente
+    
+    Se instancia a nivel de módulo para sobrevivir entre invocaciones "warm" del
+    Lambda: mantiene una sesión con pool keep-alive por host (sin handshake
+    TCP+TLS por página) y lleva contadores de latencia y bytes por llamada.
+    
+    Con un ArchivoSoap guarda cada respuesta cruda junto con sus parámetros;
+    en modo replay las lee del archivo en vez de llamar a la API. Con `tasa`
+    (un objeto con adquirir(), p.ej. el TokenBucket de load_historical.py)
+    cada request HTTP, reintentos incluidos, espera su turno antes de salir.
+    """
+    
+    def __init__(self, pool_maxsize: int = SOAP_POOL_SIZE, timeout: int = SOAP_TIMEOUT,
+                 archivo: ArchivoSoap = None, replay: bool = False, adaptativo: bool = SOAP_ADAPTATIVO,
+                 tasa=None):
+        if replay and archivo is None:
+            raise ValueError("El modo replay requiere un archivo (SOAP_ARCHIVO)")
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.archivo = archivo
+        self.replay = replay
+        self.adaptativo = adaptativo
+        self.tasa = tasa
+        self._sesiones = {}
+        self._limitadores = {}  # host -> LimitadorAdaptativo
+        self._lock = threading.Lock()
+        self._totales = {}
+        self.llamadas = deque(maxlen=500)  # Últimas llamadas (latencia/bytes por llamada)
+    
+    def sesion(self, url: str) -> requests.Session:
+        """Sesión keep-alive del host de `url` (se crea la primera vez)"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sesiones:
+                self._sesiones[host] = get_http_session(self.pool_maxsize, 0 if self.adaptativo else 3)
+            return self._sesiones[host]
+    
+    @contextmanager
+    def _turno(self, url: str):
+        """
+        Cupo de la empresa y, en modo adaptativo, del limitador del host
+        
+        Yields:
+            dict donde la llamada deja 'status' (None = timeout o error de
+            conexión) y, opcionalmente, 'segundos' de red para el limitador (por
+            defecto, el tiempo con el cupo tomado)
+        """
+        llamada = {'status': None}
+        with empresa_actual().turno_soap():
+            if not self.adaptativo:
+                yield llamada
+                return
+            host = urlsplit(url).netloc
+            with self._lock:
+                limitador = self._limitadores.get(host)
+                if limitador is None:
+                    limitador = self._limitadores[host] = LimitadorAdaptativo(host)
+            prueba = limitador.adquirir()
+            inicio = time.perf_counter()
+            try:
+                yield llamada
+            finally:
+                status = llamada['status']
+                limitador.liberar(llamada.get('segundos', time.perf_counter() - inicio),
+                                  status is not None and status < 500 and status != 429, prueba)
+    
+    def limites(self, reiniciar: bool = False) -> dict:
+        """Límite adaptativo y estado del circuito por host"""
+        with self._lock:
+            limitadores = dict(self._limitadores)
+        return {host: l.estadisticas(reiniciar) for host, l in limitadores.items()}
+    
+    def llamar(self, url: str, operacion: str, body: bytes, timeout: int = None, parametros: dict = None) -> str:
+        """
+        Ejecuta una operación SOAP y devuelve el texto de la respuesta
+        
+        Args:
+            parametros: parámetros de la llamada (sin token), clave del archivo
+        """
+        if self.replay:
+            return self._replay(url, operacion, parametros).decode('utf-8')
+        if not self.adaptativo:
+            return self._llamar(url, operacion, body, timeout, parametros)
+        return self._reintentar(operacion, lambda: self._llamar(url, operacion, body, timeout, parametros))
+    
+    @staticmethod
+    def _reintentar(operacion: str, intentar):
+        """
+        Reintentos propios del modo adaptativo (la sesión no reintenta): cada
+        intento vuelve a esperar cupo con el límite ya reducido, y se cortan
+        apenas el circuito se abre. Los timeouts no se reintentan (la división
+        adaptativa de rangos los usa para partir).
+        """
+        for intento in range(1, SOAP_INTENTOS_ADAPTATIVO + 1):
+            try:
+                return intentar()
+            except requests.exceptions.Timeout:
+                raise
+            except requests.exceptions.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                if intento == SOAP_INTENTOS_ADAPTATIVO or (status is not None and status < 500 and status != 429):
+                    raise
+                espera = min(2 ** intento, 30) * (0.5 + random.random() / 2)
+                logger.warning(f"{operacion}: {e} (intento {intento}, reintento en {espera:.1f}s)")
+                time.sleep(espera)
+    
+    def _llamar(self, url: str, operacion: str, body: bytes, timeout: int = None, parametros: dict = None) -> str:
+        if self.tasa is not None:
+            self.tasa.adquirir()
+        inicio = time.perf_counter()
+        status = None
+        n_bytes = 0
+        n_bytes_red = 0
+        try:
+            with medir('http'), self._turno(url) as llamada:
+                response = self.sesion(url).post(url, data=body, headers=SOAP_HEADERS[operacion],
+                                                 timeout=timeout or self.timeout)
+                status = llamada['status'] = response.status_code
+                response.raise_for_status()
+                n_bytes = len(response.content)
+            n_bytes_red = self._bytes_red(response, n_bytes)
+            texto = response.text
+            if self.archivo is not None and parametros is not None:
+                self.archivo.guardar(operacion, parametros, texto.encode('utf-8'))
+            return texto
+        finally:
+            self._registrar(url, operacion, time.perf_counter() - inicio, n_bytes, n_bytes_red, status)
+    
+    @contextmanager
+    def llamar_stream(self, url: str, operacion: str, body: bytes, chunk_size: int = STREAMING_CHUNK_BYTES,
+                      parametros: dict = None):
+        """
+        Ejecuta una operación SOAP en modo streaming
+        
+        En modo adaptativo se reintenta como llamar() solo la apertura (hasta
+        recibir el status): una vez entregado el primer chunk el consumidor ya
+        escribió parte de la respuesta y una falla se propaga.
+        
+        Yields:
+            iterador de chunks (bytes ya descomprimidos) de la respuesta
+        """
+        if self.replay:
+            contenido = self._replay(url, operacion, parametros)
+            yield (contenido[i:i + chunk_size] for i in range(0, len(contenido), chunk_size))
+            return
+        
+        with ExitStack() as pila:
+            def abrir():
+                return pila.enter_context(self._llamar_stream(url, operacion, body, chunk_size, parametros))
+            
+            yield self._reintentar(operacion, abrir) if self.adaptativo else abrir()
+    
+    @contextmanager
+    def _llamar_stream(self, url: str, operacion: str, body: bytes, chunk_size: int, parametros: dict):
+        if self.tasa is not None:
+            self.tasa.adquirir()
+        red = {'segundos': 0.0, 'bytes': 0, 'status': None, 'abierta': True}
+        response = None
+        archivar = self.archivo is not None and parametros is not None
+        partes = []
+        # El cupo de la empresa y del limitador se ocupa solo mientras se lee
+        # de la red: se libera al llegar el último chunk, no cuando el
+        # consumidor termina de escribir en la BD
+        turno = ExitStack()
+        
+        def cerrar():
+            """Fin de la lectura HTTP: libera el cupo y registra la latencia de red"""
+            if not red['abierta']:
+                return
+            red['abierta'] = False
+            try:
+                if llamada is not None:
+                    llamada['segundos'] = red['segundos']
+                turno.close()
+            finally:
+                n_bytes_red = self._bytes_red(response, red['bytes']) if response is not None else 0
+                if response is not None:
+                    response.close()
+                self._registrar(url, operacion, red['segundos'], red['bytes'], n_bytes_red, red['status'])
+        
+        def leer(lector):
+            inicio = time.perf_counter()
+            try:
+                with medir('http'):
+                    return next(lector, None)
+            finally:
+                red['segundos'] += time.perf_counter() - inicio
+        
+        def chunks():
+            lector = response.iter_content(chunk_size=chunk_size)
+            while True:
+                # Solo la espera por cada chunk cuenta como HTTP; el resto es del consumidor
+                chunk = leer(lector)
+                if chunk is None:
+                    break
+                red['bytes'] += len(chunk)
+                if archivar:
+                    partes.append(chunk)
+                yield chunk
+            cerrar()
+            if archivar:
+                # Solo se archivan respuestas leídas completas
+                self.archivo.guardar(operacion, parametros, b''.join(partes))
+        
+        llamada = None
+        try:
+            llamada = turno.enter_context(self._turno(url))
+            inicio = time.perf_counter()
+            try:
+                with medir('http'):
+                    response = self.sesion(url).post(url, data=body, headers=SOAP_HEADERS[operacion],
+                                                     timeout=self.timeout, stream=True)
+            finally:
+                red['segundos'] += time.perf_counter() - inicio
+            red['status'] = llamada['status'] = response.status_code
+            response.raise_for_status()
+            yield chunks()
+        finally:
+            cerrar()
+    
+    def _replay(self, url: str, operacion: str, parametros: dict) -> bytes:
+        """Respuesta archivada en lugar de la llamada a la API"""
+        inicio = time.perf_counter()
+        contenido = b''
+        try:
+            with medir('http'):
+                contenido = self.archivo.cargar(operacion, parametros or {})
+            return contenido
+        finally:
+            self._registrar('archivo://replay', operacion, time.perf_counter() - inicio,
+                            len(contenido), 0, 200 if contenido else None)
+    
+    @staticmethod
+    def _bytes_red(response, por_defecto: int) -> int:
+        """Bytes recibidos por la red (comprimidos si el servidor usó gzip)"""
+        try:
+            return response.raw.tell() or por_defecto
+        except Exception:
+            return por_defecto
+    
+    def _registrar(self, url, operacion, segundos, n_bytes, n_bytes_red, status):
+        llamada = {
+            'operacion': operacion,
+            'host': urlsplit(url).netloc,
+            'segundos': round(segundos, 4),
+            'bytes': n_bytes,
+            'bytes_red': n_bytes_red,
+            'status': status
+        }
+        with self._lock:
+            self.llamadas.append(llamada)
+            total = self._totales.setdefault(operacion, {
+                'llamadas': 0, 'errores': 0, 'segundos': 0.0, 'segundos_max': 0.0, 'bytes': 0, 'bytes_red': 0
+            })
+            total['llamadas'] += 1
+            total['errores'] += 0 if status and status < 400 else 1
+            total['segundos'] += segundos
+            total['segundos_max'] = max(total['segundos_max'], segundos)
+            total['bytes'] += n_bytes
+            total['bytes_red'] += n_bytes_red
+        contar(bytes=n_bytes, bytes_red=n_bytes_red, llamadas=1)
+    
+    def estadisticas(self, reiniciar: bool = False) -> dict:
+        """Contadores acumulados por operación"""
+        with self._lock:
+            resultado = {
+                op: dict(t, segundos=round(t['segundos'], 3), segundos_max=round(t['segundos_max'], 3))
+                for op, t in self._totales.items()
+            }
+            if reiniciar:
+                self._totales = {}
+                self.llamadas.clear()
+        return resultado
+
+
+# Instancia compartida (persiste mientras el contenedor del Lambda siga vivo)
+soap_client = SoapClient(archivo=abrir_archivo(SOAP_ARCHIVO), replay=SOAP_REPLAY, adaptativo=SOAP_ADAPTATIVO)
+
+
+# ============================================
+# FUNCIONES SOAP
+# ============================================
+
+def _sobre_ventas(fecha_inicio: str, fecha_fin: str, token: str,
+                  hora_inicio: str = '00:00:00', hora_fin: str = '23:59:59') -> bytes:
+    """
+    Construye el sobre SOAP de GenerarInfoVentas
+    """
+    # Convertir fechas al formato esperado por la API
+    return SOBRE_VENTAS.format(
+        empresa=empresa_actual().empresa,
+        fecha_ini=f"{fecha_inicio}T{hora_inicio}",
+        fecha_fin=f"{fecha_fin}T{hora_fin}",
+        token=token
+    ).encode('utf-8')
+
+
+def _parametros_ventas(fecha_inicio: str, fecha_fin: str, hora_inicio: str, hora_fin: str) -> dict:
+    """Parámetros de GenerarInfoVentas que identifican la respuesta (sin token)"""
+    return {'empresa': empresa_actual().empresa, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin,
+            'hora_inicio': hora_inicio, 'hora_fin': hora_fin}
+
+
+def call_soap_ventas(fecha_inicio: str, fecha_fin: str, token: str,
+                     hora_inicio: str = '00:00:00', hora_fin: str = '23:59:59', timeout: int = None) -> dict:
+    """
+    Llama a la API SOAP de ventas
+    
+    Args:
+        fecha_inicio: Fecha inicio formato 'YYYY-MM-DD'
+        fecha_fin: Fecha fin formato 'YYYY-MM-DD'
+        token: Token de autenticación
+        hora_inicio: Hora inicio formato 'HH:MM:SS' (extracción incremental)
+        hora_fin: Hora fin formato 'HH:MM:SS'
+        timeout: Segundos de espera (por defecto SOAP_TIMEOUT)
+    
+    Returns:
+        dict con los datos de ventas
+    """
+    logger.info(f"Llamando API Ventas: {fecha_inicio} {hora_inicio} a {fecha_fin} {hora_fin}")
+    
+    body = _sobre_ventas(fecha_inicio, fecha_fin, token, hora_inicio, hora_fin)
+    parametros = _parametros_ventas(fecha_inicio, fecha_fin, hora_inicio, hora_fin)
+    texto = soap_client.llamar(VENTAS_API_URL, 'GenerarInfoVentas', body, timeout, parametros)
+    
+    # Parsear respuesta XML y extraer JSON
+    with medir('parse'):
+        return parse_soap_response(texto, 'GenerarInfoVentasResult')
+
+
+def call_soap_ventas_stream(fecha_inicio: str, fecha_fin: str, token: str, tamano_lote: int = VENTAS_LOTE_STREAMING,
+                            hora_inicio: str = '00:00:00', hora_fin: str = '23:59:59'):
+    """
+    Llama a la API SOAP de ventas en modo streaming
+    
+    Lee el cuerpo con iter_content y lo decodifica de forma incremental, de modo
+    que la memoria depende del tamaño de lote y no del tamaño de la respuesta.
+    
+    Yields:
+        list de registros de venta (máximo `tamano_lote` por lote)
+    """
+    logger.info(f"Llamando API Ventas (streaming): {fecha_inicio} {hora_inicio} a {fecha_fin} {hora_fin}")
+    
+    body = _sobre_ventas(fecha_inicio, fecha_fin, token, hora_inicio, hora_fin)
+    parametros = _parametros_ventas(fecha_inicio, fecha_fin, hora_inicio, hora_fin)
+    with soap_client.llamar_stream(VENTAS_API_URL, 'GenerarInfoVentas', body, parametros=parametros) as chunks:
+        lotes = parse_soap_stream(chunks, 'GenerarInfoVentasResult', tamano_lote)
+        while True:
+            # La espera de red dentro de cada lote se mide aparte (etapa anidada)
+            with medir('parse'):
+                lote = next(lotes, None)
+            if lote is None:
+                break
+            yield lote
+        # Consumir el XML restante para devolver la conexión al pool
+        for _ in chunks:
+            pass
+
+
+def call_soap_inventario(fecha: str, bodega: str, token: str, pagina: int = 1, filas: int = 1000) -> dict:
+    """
+    Llama a la API SOAP de inventario
+    
+    Args:
+        fecha: Fecha formato 'YYYY-MM-DD'
+        bodega: Código de bodega (vacío para todas)
+        token: Token de autenticación
+        pagina: Número de página
+        filas: Registros por página
+    
+    Returns:
+        dict con los datos de inventario
+    """
+    body = SOBRE_INVENTARIO.format(
+        fecha=f"{fecha}T00:00:00",
+        bodega=bodega,
+        base_datos=empresa_actual().base_datos,
+        token=token,
+        filas=filas,
+        pagina=pagina
+    ).encode('utf-8')
+    
+    logger.info(f"Llamando API Inventario: {fecha}, Bodega: {bodega or 'TODAS'}, Página: {pagina}")
+    
+    parametros = {'base_datos': empresa_actual().base_datos, 'fecha': fecha, 'bodega': bodega, 'pagina': pagina, 'filas': filas}
+    texto = soap_client.llamar(INVENTARIO_API_URL, 'GenerarInformacionInventarios', body, parametros=parametros)
+    
+    with medir('parse'):
+        return parse_soap_response(texto, 'GenerarInformacionInventariosResult')
+
+
+def parse_soap_response(xml_text: str, result_tag: str) -> dict:
+    """
+    Parsea la respuesta SOAP y extrae el JSON del resultado
+    """
+    try:
+        # Caso especial: la API de ventas devuelve JSON seguido de XML
+        # Buscar si hay un array JSON al inicio o en medio del texto
+        if '[{' in xml_text:
+            # Encontrar el inicio del JSON array
+            start_idx = xml_text.find('[{')
+            # Encontrar el final del JSON array (último }])
+            end_idx = xml_text.rfind('}]') + 2
+            
+            if start_idx != -1 and end_idx > start_idx:
+                json_str = xml_text[start_idx:end_idx]
+                try:
+                    return json.loads(json_str)
+                except json.JSONDecodeError:
+                    pass
+        
+        # Intento estándar: parsear como XML SOAP
+        # Remover namespaces para facilitar el parseo
+        xml_clean = xml_text.replace('xmlns=', 'xmlns_original=')
+        root = ET.fromstring(xml_clean)
+        
+        # Buscar el tag de resultado en cualquier nivel
+        for elem in root.iter():
+            if result_tag in elem.tag:
+                # El contenido puede ser JSON string
+                if elem.text:
+                    try:
+                        return json.loads(elem.text)
+                    except json.JSONDecodeError:
+                        return {'raw': elem.text}
+        
+        logger.warning(f"No se encontró el tag {result_tag} en la respuesta")
+        return {'error': 'Tag no encontrado', 'xml': xml_text[:500]}
+        
+    except ET.ParseError as e:
+        # Si falla el parseo XML, intentar extraer JSON directamente
+        if '[{' in xml_text:
+            start_idx = xml_text.find('[{')
+            end_idx = xml_text.rfind('}]') + 2
+            if start_idx != -1 and end_idx > start_idx:
+                json_str = xml_text[start_idx:end_idx]
+                try:
+                    return json.loads(json_str)
+                except json.JSONDecodeError:
+                    pass
+        
+        logger.error(f"Error parseando XML: {e}")
+        return {'error': str(e), 'xml': xml_text[:500]}
+
+
+_ESPACIOS = re.compile(r'[ \t\n\r]*')
+
+
+def parse_soap_stream(chunks, result_tag: str, tamano_lote: int = VENTAS_LOTE_STREAMING):
+    """
+    Versión incremental de parse_soap_response
+    
+    Decodifica objeto por objeto el array JSON que la API devuelve antes del XML,
+    a medida que llegan los bytes, y entrega lotes de hasta `tamano_lote` registros.
+    Si la respuesta no trae el array JSON crudo (p.ej. JSON escapado dentro del
+    XML), acumula el texto completo y delega en parse_soap_response.
+    
+    Args:
+        chunks: iterable de bytes (p.ej. response.iter_content())
+        result_tag: tag de resultado SOAP para el fallback XML
+        tamano_lote: registros por lote
+    
+    Yields:
+        list de registros
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    json_decoder = json.JSONDecoder()
+    
+    buffer = ''
+    pos = 0
+    busqueda = 0         # desde dónde buscar el inicio del array
+    en_array = False     # ya se encontró el '[{' de apertura
+    confirmado = False   # ya se decodificó al menos un objeto
+    terminado = False    # se encontró el ']' de cierre
+    fin_stream = False
+    lote = []
+    
+    chunks = iter(chunks)
+    
+    while not terminado and not fin_stream:
+        chunk = next(chunks, None)
+        if chunk is None:
+            fin_stream = True
+            buffer += decoder.decode(b'', final=True)
+        else:
+            buffer += decoder.decode(chunk)
+        
+        if not en_array:
+            idx = buffer.find('[{', busqueda)
+            if idx == -1:
+                busqueda = max(len(buffer) - 1, 0)
+                continue
+            en_array = True
+            pos = idx + 1
+        
+        while True:
+            pos = _ESPACIOS.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ']':
+                terminado = True
+                break
+            separador = pos
+            if buffer[pos] == ',':
+                siguiente = _ESPACIOS.match(buffer, pos + 1).end()
+                if siguiente >= len(buffer):
+                    break  # esperar más bytes, pos queda en la coma
+                pos = siguiente
+            elif confirmado:
+                raise ValueError(f"Respuesta JSON malformada: se esperaba ',' o ']' y llegó {buffer[pos]!r}")
+            
+            try:
+                obj, pos = json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                pos = separador
+                break  # objeto incompleto (o el array no es JSON crudo); se retoma desde la coma
+            
+            confirmado = True
+            lote.append(obj)
+            if len(lote) >= tamano_lote:
+                yield lote
+                lote = []
+        
+        # Descartar lo ya decodificado; antes de confirmar se conserva todo para el fallback
+        if confirmado and pos > 0:
+            buffer = buffer[pos:]
+            pos = 0
+    
+    if terminado:
+        if lote:
+            yield lote
+        return
+    
+    if confirmado:
+        raise ValueError("Respuesta JSON incompleta o malformada")
+    
+    # Fallback: la respuesta no trae el array crudo, parsear completa
+    resultado = parse_soap_response(buffer, result_tag)
+    registros = _extraer_registros(resultado, ('ventas', 'data', 'resultado'))
+    for i in range(0, len(registros), tamano_lote):
+        yield registros[i:i + tamano_lote]
+
+
+# ============================================
+# TRANSFORMACIÓN COLUMNAR POR LOTES
+# ============================================
+
+# Tipos de campo del mapa registro SOAP -> columna
+CODIGO = 'codigo'               # Texto muy repetido (códigos, nombres de catálogo): se interna
+TEXTO = 'texto'                 # Valor tal cual
+TEXTO_OPCIONAL = 'opcional'     # Valor vacío -> NULL
+OBSERVACION = 'observacion'     # Sin espacios; vacío -> NULL
+NUMERO = 'numero'               # Decimal; ausente -> 0
+
+# (columna, claves SOAP en orden de preferencia, tipo)
+CAMPOS_PRODUCTOS = (
+    ('referencia', ('REFERENCIA', 'REFER'), TEXTO),
+    ('codigo', ('CODIGO',), TEXTO),
+    ('nombre', ('NOMBRE', 'NOMREF'), TEXTO),
+    ('unidad_medida', ('UNIDADMED', 'UNDMED'), CODIGO),
+    ('clase', ('CLASE',), CODIGO),
+    ('grupo', ('GRUPO',), CODIGO),
+    ('linea', ('LINEA',), CODIGO),
+    ('marca_codigo', ('MARCA',), CODIGO),  # Esto necesitará mapeo al código de marca
+)
+
+CAMPOS_VENTAS = (
+    ('tipo_movimiento', ('TIPMOV',), CODIGO),
+    ('prefijo', ('PREFIJO',), CODIGO),
+    ('numero_documento', ('NUMDOC',), TEXTO),
+    ('fecha', ('FECHA',), CODIGO),
+    ('hora', ('HORA',), TEXTO_OPCIONAL),
+    ('cedula_cliente', ('CEDULA',), TEXTO),
+    ('nombre_cliente', ('NOMCED',), TEXTO),
+    ('codigo_seccion', ('CODSEC',), CODIGO),
+    ('nombre_seccion', ('NOMSEC',), CODIGO),
+    ('bodega_codigo', ('BODEGA',), CODIGO),
+    ('referencia', ('REFER',), CODIGO),
+    ('cantidad', ('CANTID',), NUMERO),
+    ('valor_unitario', ('VALUND',), NUMERO),
+    ('valor_total', ('VALTOT',), NUMERO),
+    ('porcentaje_descuento', ('PORDES',), NUMERO),
+    ('valor_descuento', ('VALDES',), NUMERO),
+    ('valor_costo', ('VCOSTO',), NUMERO),
+    ('valor_utilidad', ('VALUTI',), NUMERO),
+    ('porcentaje_utilidad', ('PORUTI',), NUMERO),
+    ('porcentaje_iva', ('PORIVA',), NUMERO),
+    ('vendedor_codigo', ('VENDED',), CODIGO),
+    ('vendedor_nombre', ('NOMVEN',), CODIGO),
+)
+
+CAMPOS_INVENTARIO = (
+    ('bodega_codigo', ('BODEGA',), CODIGO),
+    ('referencia', ('REFERENCIA',), TEXTO),
+    ('cantidad', ('CANTIDAD',), NUMERO),
+    ('valor_costo', ('VCOSTO',), NUMERO),
+    ('valor_venta', ('VVENTA',), NUMERO),
+    ('observacion', ('OBSERV1',), OBSERVACION),
+)
+
+COLUMNAS_PRODUCTOS = tuple(c for c, _, _ in CAMPOS_PRODUCTOS)
+COLUMNAS_VENTAS = tuple(c for c, _, _ in CAMPOS_VENTAS)
+COLUMNAS_INVENTARIO = tuple(c for c, _, _ in CAMPOS_INVENTARIO)
+
+_MAX_TEXTOS_INTERNADOS = 200_000  # Textos distintos recordados por transformador
+
+
+class _DiccionarioTextos(dict):
+    """
+    Codificación por diccionario de textos: cada valor distinto se guarda una
+    sola vez (sys.intern) y las filas comparten la misma instancia
+    """
+    
+    def __missing__(self, valor):
+        if valor.__class__ is not str:
+            # Solo se recuerdan textos: 1 == 1.0 == True colisionarían como claves
+            return valor
+        if len(self) >= _MAX_TEXTOS_INTERNADOS:
+            self.clear()
+            self[None] = None
+        valor = self[valor] = sys.intern(valor)
+        return valor
+
+
+class _CacheCopy(dict):
+    """Texto -> texto escapado para COPY, una sola vez por valor distinto"""
+    
+    def __missing__(self, valor):
+        texto = _valor_copy(valor)
+        if valor.__class__ is str:
+            self[valor] = texto
+        return texto
+
+
+def _por_valor_unico(columna: list, convertir) -> list:
+    """
+    Convierte cada valor distinto de la columna una sola vez
+    
+    Precios, porcentajes y cantidades se repiten mucho dentro de una página;
+    las claves numéricas iguales (1 y 1.0) comparten conversión, lo que es
+    indistinto para una columna DECIMAL. Columnas casi sin repeticiones
+    (totales) se convierten directo, sin pasar por el diccionario.
+    """
+    unicos = set(columna)
+    if len(unicos) * 2 > len(columna):
+        return list(convertir(columna))
+    conversion = dict(zip(unicos, convertir(unicos)))
+    return list(map(conversion.__getitem__, columna))
+
+
+def _decimales(valores):
+    if set(map(type, valores)) == {int}:
+        return map(Decimal, valores)
+    return map(Decimal, map(str, valores))
+
+
+def _numeros_copy(valores):
+    """Texto para COPY; lo que no sea int/float se valida igual que Decimal(str())"""
+    if set(map(type, valores)) <= {int, float}:
+        return map(str, valores)
+    return map(str, _decimales(valores))
+
+
+class LoteColumnar:
+    """
+    Página de registros transformada a columnas (una lista por columna)
+    
+    Las columnas numéricas guardan el valor crudo y se convierten según el
+    destino: Decimal para execute_values, texto directo para COPY.
+    """
+    
+    __slots__ = ('columnas', 'tipos', 'datos', 'n', '_decimales')
+    
+    def __init__(self, columnas: tuple, tipos: tuple, datos: list, n: int):
+        self.columnas = columnas
+        self.tipos = tipos
+        self.datos = datos
+        self.n = n
+        self._decimales = None
+    
+    def __len__(self):
+        return self.n
+    
+    def _datos_decimales(self) -> list:
+        if self._decimales is None:
+            self._decimales = [
+                _por_valor_unico(datos, _decimales) if tipo == NUMERO else datos
+                for tipo, datos in zip(self.tipos, self.datos)
+            ]
+        return self._decimales
+    
+    def columna(self, nombre: str) -> list:
+        return self._datos_decimales()[self.columnas.index(nombre)]
+    
+    def seleccionar(self, indices: list) -> 'LoteColumnar':
+        """Sub-lote con las filas de `indices`"""
+        return LoteColumnar(self.columnas, self.tipos, [[datos[i] for i in indices] for datos in self.datos],
+                            len(indices))
+    
+    def filas(self, *constantes) -> list:
+        """
+        Tuplas en el orden de `columnas` para execute_values, opcionalmente
+        precedidas por valores constantes (ej. la fecha del snapshot)
+        """
+        with medir('transform'):
+            return list(zip(*(repeat(c, self.n) for c in constantes), *self._datos_decimales()))
+    
+    def lineas_copy(self):
+        """Líneas de COPY en formato texto, formateando columna por columna"""
+        with medir('transform'):
+            textos = [
+                _por_valor_unico(datos, _numeros_copy) if tipo == NUMERO
+                else list(map(_CacheCopy().__getitem__, datos))
+                for tipo, datos in zip(self.tipos, self.datos)
+            ]
+        return map(_linea_copy, zip(*textos))
+
+
+def _linea_copy(valores: tuple) -> str:
+    return '\t'.join(valores) + '\n'
+
+
+class TransformadorLote:
+    """
+    Convierte una página de registros SOAP en columnas según un mapa de campos
+    
+    Cada columna se resuelve en una pasada sobre la página (comprensiones y
+    map en vez de una función por fila). Las columnas CODIGO se internan y el
+    diccionario se conserva entre páginas: bodegas, referencias y vendedores
+    se repiten todo el día.
+    """
+    
+    def __init__(self, campos: tuple):
+        self.campos = campos
+        self.columnas = tuple(c for c, _, _ in campos)
+        self.tipos = tuple(t for _, _, t in campos)
+        self._textos = _DiccionarioTextos({None: None})
+    
+    def transformar(self, registros: list) -> LoteColumnar:
+        with medir('transform'):
+            return self._transformar(registros)
+    
+    def _transformar(self, registros: list) -> LoteColumnar:
+        texto = self._textos.__getitem__
+        datos = []
+        
+        for _, claves, tipo in self.campos:
+            if tipo == NUMERO:
+                datos.append([r.get(claves[0], 0) for r in registros])
+                continue
+            
+            crudos = [r.get(claves[0]) for r in registros]
+            for clave in claves[1:]:
+                crudos = [valor or r.get(clave) for valor, r in zip(crudos, registros)]
+            
+            if tipo == CODIGO:
+                crudos = list(map(texto, crudos))
+            elif tipo == TEXTO_OPCIONAL:
+                crudos = [valor or None for valor in crudos]
+            elif tipo == OBSERVACION:
+                crudos = [(valor or '').strip() or None for valor in crudos]
+            datos.append(crudos)
+        
+        return LoteColumnar(self.columnas, self.tipos, datos, len(registros))
+
+
+# Instancias compartidas (los diccionarios persisten mientras el contenedor siga vivo)
+TRANSFORMADOR_PRODUCTOS = TransformadorLote(CAMPOS_PRODUCTOS)
+TRANSFORMADOR_VENTAS = TransformadorLote(CAMPOS_VENTAS)
+TRANSFORMADOR_INVENTARIO = TransformadorLote(CAMPOS_INVENTARIO)
+
+
+# ============================================
+# FUNCIONES DE BASE DE DATOS
+# ============================================
+
+_secrets_client = None
+_secreto = {'valor': None, 'expira': 0.0}
+_lock_secreto = threading.Lock()
+
+
+def _obtener_secreto(refrescar: bool = False) -> dict:
+    """
+    Credenciales de la BD desde Secrets Manager, cacheadas DB_SECRET_TTL segundos
+    """
+    global _secrets_client
+    with _lock_secreto:
+        if refrescar or _secreto['valor'] is None or time.monotonic() >= _secreto['expira']:
+            if _secrets_client is None:
+                _secrets_client = boto3.client('secretsmanager')
+            response = _secrets_client.get_secret_value(SecretId=os.environ['DB_SECRET_ARN'])
+            _secreto['valor'] = json.loads(response['SecretString'])
+            _secreto['expira'] = time.monotonic() + DB_SECRET_TTL
+        return _secreto['valor']
+
+
+def get_db_connection():
+    """
+    Abre una conexión nueva a PostgreSQL usando credenciales de Secrets Manager
+    
+    Los handlers usan obtener_conexion(), que la reutiliza entre invocaciones.
+    """
+    # En desarrollo, usar variables de entorno
+    if os.environ.get('LOCAL_DEV'):
+        return psycopg2.connect(
+            host=os.environ['DB_HOST'],
+            port=os.environ.get('DB_PORT', 5432),
+            database=os.environ['DB_NAME'],
+            user=os.environ['DB_USER'],
+            password=os.environ['DB_PASSWORD']
+        )
+    
+    # En producción, usar Secrets Manager
+    def conectar(secret):
+        return psycopg2.connect(
+            host=secret['host'],
+            port=secret['port'],
+            database=secret['dbname'],
+            user=secret['username'],
+            password=secret['password']
+        )
+    
+    try:
+        return conectar(_obtener_secreto())
+    except psycopg2.OperationalError:
+        # Puede ser una rotación del secreto: reintentar una vez con el secreto fresco
+        logger.warning("Conexión rechazada con el secreto cacheado, refrescando")
+        return conectar(_obtener_secreto(refrescar=True))
+
+
+# ============================================
+# CONEXIONES REUTILIZABLES (WARM START)
+# ============================================
+
+_conexiones = threading.local()     # Por hilo: nombre -> conexión
+_adquisiciones = {'nueva': [0, 0.0], 'reutilizada': [0, 0.0]}  # origen -> [veces, segundos]
+_lock_adquisiciones = threading.Lock()
+
+
+def _conexion_sana(conn) -> bool:
+    """
+    Verifica que la conexión cacheada siga viva (la BD pudo cerrarla mientras
+    el contenedor estaba congelado) y la deja fuera de cualquier transacción
+    """
+    if conn.closed:
+        return False
+    try:
+        if conn.status != psycopg2.extensions.STATUS_READY:
+            conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def obtener_conexion(nombre: str = 'principal'):
+    """
+    Conexión a PostgreSQL reutilizada entre invocaciones del mismo contenedor
+    
+    Se cachea por hilo y por nombre, así que hilos distintos (o escritores en
+    paralelo con nombres distintos) nunca comparten conexión. Si la conexión
+    cacheada no pasa el chequeo, se descarta y se abre una nueva.
+    """
+    inicio = time.perf_counter()
+    cache = _conexiones.__dict__
+    conn = cache.get(nombre)
+    
+    if conn is not None and _conexion_sana(conn):
+        origen = 'reutilizada'
+    else:
+        if conn is not None:
+            logger.warning(f"Conexión '{nombre}' caída, reconectando")
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        conn = cache[nombre] = get_db_connection()
+        origen = 'nueva'
+    
+    segundos = time.perf_counter() - inicio
+    with _lock_adquisiciones:
+        _adquisiciones[origen][0] += 1
+        _adquisiciones[origen][1] += segundos
+    logger.info(f"Conexión '{nombre}' {origen} en {segundos * 1000:.1f} ms")
+    return conn
+
+
+def liberar_conexion(conn):
+    """
+    Devuelve la conexión al cache: descarta la transacción pendiente (si un
+    error la dejó abierta) pero no la cierra
+    """
+    if conn.closed:
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+
+
+def estadisticas_conexiones(reiniciar: bool = False) -> dict:
+    """
+    Latencia de adquisición de conexiones: nuevas (arranque en frío o
+    reconexión) vs reutilizadas (contenedor caliente)
+    """
+    with _lock_adquisiciones:
+        resumen = {
+            origen: {'veces': veces, 'ms_promedio': round(segundos / veces * 1000, 2) if veces else None}
+            for origen, (veces, segundos) in _adquisiciones.items()
+        }
+        if reiniciar:
+            for origen in _adquisiciones:
+                _adquisiciones[origen] = [0, 0.0]
+    return resumen
+
+
+# ============================================
+# CATÁLOGO DE PRODUCTOS (CACHE DE VALORES)
+# ============================================
+
+# Columnas que el upsert de productos actualiza (marca_codigo solo se inserta)
+COLUMNAS_ACTUALIZABLES_PRODUCTO = ('codigo', 'nombre', 'unidad_medida', 'clase', 'grupo', 'linea')
+
+
+def fusionar_producto(conocidos: tuple, valores: tuple) -> tuple:
+    """
+    Valores que quedan en la BD después del upsert de productos: un NULL
+    entrante conserva el valor guardado (mismo COALESCE que CONFLICTO_PRODUCTOS)
+    """
+    if conocidos is None:
+        return valores
+    return tuple(c if v is None else v for v, c in zip(valores, conocidos))
+
+
+class CatalogoProductos:
+    """
+    Valores actualizables (referencia -> tupla de COLUMNAS_ACTUALIZABLES_PRODUCTO)
+    de los productos que ya están en la BD
+    
+    Ventas e inventario traen en cada corrida las mismas referencias casi sin
+    cambios; comparando contra estos valores se descartan antes de llegar a la
+    BD. Un producto es pendiente solo si es nuevo o si algún valor no nulo
+    difiere del guardado: los NULL no pisan (ver fusionar_producto), así que
+    un registro de ventas incompleto no vuelve a escribirse. Se carga de la
+    tabla una vez y se mantiene caliente entre invocaciones del mismo
+    contenedor; pasados `ttl` segundos se recarga para recoger cambios hechos
+    fuera del colector.
+    """
+    
+    def __init__(self, ttl: int = PRODUCTOS_CACHE_TTL):
+        self.ttl = ttl
+        self._valores = None
+        self._expira = 0.0
+        self._lock = threading.Lock()
+        self._contadores = {'recibidos': 0, 'sin_cambios': 0, 'escritos': 0, 'cargas': 0}
+    
+    @property
+    def activo(self) -> bool:
+        return self.ttl > 0
+    
+    def _cargar(self, conn):
+        # Sin commit: la lectura queda en la transacción del escritor, que puede
+        # estar dentro del savepoint de _escribir_aislando o de un commit=False
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT referencia, {', '.join(COLUMNAS_ACTUALIZABLES_PRODUCTO)} FROM productos")
+            self._valores = {fila[0]: tuple(fila[1:]) for fila in cur.fetchall()}
+        self._expira = time.monotonic() + self.ttl
+        self._contadores['cargas'] += 1
+        logger.info(f"Catálogo de productos: {len(self._valores)} productos cargados")
+    
+    def pendientes(self, conn, referencias: list, valores: list) -> list:
+        """
+        Índices de los productos nuevos o con algún valor no nulo modificado
+        """
+        with self._lock:
+            if self._valores is None or time.monotonic() >= self._expira:
+                self._cargar(conn)
+            indices = []
+            for i, (referencia, fila) in enumerate(zip(referencias, valores)):
+                conocidos = self._valores.get(referencia)
+                if conocidos is None or fusionar_producto(conocidos, fila) != conocidos:
+                    indices.append(i)
+            self._contadores['recibidos'] += len(referencias)
+            self._contadores['sin_cambios'] += len(referencias) - len(indices)
+        return indices
+    
+    def confirmar(self, referencias: list, valores: list, escritos: int):
+        """Registra los valores ya confirmados en la BD"""
+        with self._lock:
+            if self._valores is not None:
+                for referencia, fila in zip(referencias, valores):
+                    self._valores[referencia] = fusionar_producto(self._valores.get(referencia), fila)
+            self._contadores['escritos'] += escritos
+    
+    def invalidar(self):
+        """Fuerza la recarga en el próximo uso (p.ej. tras un rollback)"""
+        with self._lock:
+            self._valores = None
+    
+    def estadisticas(self, reiniciar: bool = False) -> dict:
+        with self._lock:
+            resultado = dict(self._contadores, referencias=len(self._valores or ()))
+            if reiniciar:
+                self._contadores = dict.fromkeys(self._contadores, 0)
+        return resultado
+
+
+# Instancia compartida (persiste mientras el contenedor del Lambda siga vivo)
+catalogo_productos = CatalogoProductos()
+
+
+# ============================================
+# PREFILTRO DE DUPLICADOS DE VENTAS
+# ============================================
+
+# Hash de 64 bits de la clave única de ventas calculado en la BD: solo viajan
+# 8 bytes por fila al cargar el índice
+SQL_CLAVE_VENTA = "('x' || left(md5(prefijo || '|' || numero_documento || '|' || referencia), 16))::bit(64)::bigint"
+
+
+def clave_venta(prefijo, numero_documento, referencia) -> int:
+    """
+    Hash de 64 bits (con signo, como bigint) de (prefijo, numero_documento, referencia)
+    
+    Debe coincidir con SQL_CLAVE_VENTA.
+    """
+    texto = f"{prefijo}|{numero_documento}|{referencia}"
+    return int.from_bytes(hashlib.md5(texto.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+class IndiceVentas:
+    """
+    Claves de las ventas que ya están en la BD para la ventana de fechas de una
+    corrida
+    
+    El cron horario vuelve a pedir el día en curso y casi todas las filas ya
+    existen: ON CONFLICT las descarta, pero después de viajar y escribirse en
+    la BD. El índice es un arreglo ordenado de hashes de 64 bits (8 bytes por
+    venta, búsqueda binaria) más las claves insertadas durante la corrida.
+    Filas fuera de la ventana o con la clave incompleta pasan sin filtrar; una
+    colisión de hash (probabilidad ~n/2^64) descartaría una venta nueva.
+    """
+    
+    def __init__(self, fecha_inicio: str, fecha_fin: str):
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self._claves = array('q')
+        self._nuevas = set()
+        self._lock = threading.Lock()
+        self.recibidas = 0
+        self.filtradas = 0
+        self.insertadas = 0
+    
+    def cargar(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {SQL_CLAVE_VENTA} FROM ventas
+                WHERE fecha BETWEEN %s AND %s
+                  AND prefijo IS NOT NULL AND numero_documento IS NOT NULL AND referencia IS NOT NULL
+            """, (self.fecha_inicio, self.fecha_fin))
+            self._claves = array('q', sorted(c for c, in cur))
+        _confirmar(conn)
+        logger.info(f"Prefiltro de ventas {self.fecha_inicio} a {self.fecha_fin}: {len(self._claves)} claves cargadas "
+                    f"({self._claves.itemsize * len(self._claves) // 1024} KB)")
+    
+    def _contiene(self, clave: int) -> bool:
+        i = bisect_left(self._claves, clave)
+        return (i < len(self._claves) and self._claves[i] == clave) or clave in self._nuevas
+    
+    def filtrar(self, ventas: list) -> tuple:
+        """
+        Descarta las ventas cuya clave ya está en el índice
+        
+        Returns:
+            (ventas pendientes, claves a confirmar tras escribirlas)
+        """
+        pendientes = []
+        claves = []
+        with self._lock:
+            for v in ventas:
+                prefijo, documento, referencia = v.get('PREFIJO'), v.get('NUMDOC'), v.get('REFER')
+                if prefijo is None or documento is None or referencia is None or \
+                        not self.fecha_inicio <= str(v.get('FECHA') or '')[:10] <= self.fecha_fin:
+                    pendientes.append(v)
+                    continue
+                clave = clave_venta(prefijo, documento, referencia)
+                if self._contiene(clave):
+                    continue
+                pendientes.append(v)
+                claves.append(clave)
+            filtradas = len(ventas) - len(pendientes)
+            self.recibidas += len(ventas)
+            self.filtradas += filtradas
+        contar(filtradas=filtradas)
+        return pendientes, claves
+    
+    def confirmar(self, claves: list, insertadas: int):
+        """Agrega al índice las claves ya confirmadas en la BD"""
+        with self._lock:
+            self._nuevas.update(claves)
+            self.insertadas += insertadas
+    
+    def resumen(self) -> dict:
+        with self._lock:
+            return {'recibidas': self.recibidas, 'filtradas': self.filtradas,
+                    'enviadas': self.recibidas - self.filtradas, 'insertadas': self.insertadas}
+
+
+# Índice activo en el contexto actual (None = sin prefiltro)
+_indice_ventas = contextvars.ContextVar('indice_ventas', default=None)
+
+
+def ventana_prefiltro(event: dict) -> tuple:
+    """
+    Fechas que cubre el índice: el rango pedido o, sin rango explícito (ayer
+    por defecto, o el día en curso en modo incremental), de ayer a hoy
+    """
+    ayer = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    fecha_fin = event.get('fecha_fin', ayer)
+    fecha_inicio = event.get('fecha_inicio', fecha_fin)
+    if 'fecha_inicio' not in event and 'fecha_fin' not in event:
+        fecha_fin = datetime.now().strftime('%Y-%m-%d')
+    return fecha_inicio, fecha_fin
+
+
+def con_prefiltro(funcion):
+    """
+    Decorador de handler_ventas: con VENTAS_PREFILTRO (o event['prefiltro'])
+    carga el índice de claves de la ventana al empezar, lo deja activo para
+    insert_ventas durante la invocación y reporta filtradas vs. insertadas
+    """
+    @functools.wraps(funcion)
+    def envoltura(event, context):
+        if not event.get('prefiltro', VENTAS_PREFILTRO):
+            return funcion(event, context)
+        
+        indice = IndiceVentas(*ventana_prefiltro(event))
+        conn = None
+        try:
+            conn = obtener_conexion()
+            indice.cargar(conn)
+        except Exception as e:
+            # Sin índice la corrida sigue igual: ON CONFLICT descarta los duplicados
+            logger.warning(f"No se pudo cargar el prefiltro de ventas: {e}")
+            return funcion(event, context)
+        finally:
+            if conn is not None:
+                liberar_conexion(conn)
+        
+        token = _indice_ventas.set(indice)
+        try:
+            respuesta = funcion(event, context)
+        finally:
+            _indice_ventas.reset(token)
+        
+        resumen = indice.resumen()
+        logger.info(f"Prefiltro de ventas: {resumen['filtradas']} filtradas (ya en la BD), "
+                    f"{resumen['enviadas']} enviadas, {resumen['insertadas']} insertadas")
+        cuerpo = json.loads(respuesta['body'])
+        cuerpo['prefiltro'] = resumen
+        return dict(respuesta, body=json.dumps(cuerpo))
+    return envoltura
+
+
+# ============================================
+# VALIDACIÓN Y CUARENTENA
+# ============================================
+
+# Largo máximo de las columnas VARCHAR (schema_v2.sql; observacion en migration_v5)
+LONGITUDES_COLUMNAS = {
+    'referencia': 50, 'codigo': 20, 'unidad_medida': 20, 'clase': 10, 'grupo': 10, 'linea': 10,
+    'marca_codigo': 10, 'tipo_movimiento': 10, 'prefijo': 10, 'numero_documento': 20,
+    'cedula_cliente': 20, 'nombre_cliente': 200, 'codigo_seccion': 20, 'nombre_seccion': 100,
+    'bodega_codigo': 10, 'vendedor_codigo': 10, 'vendedor_nombre': 100, 'observacion': 50,
+}
+
+# Valor absoluto máximo por columna numérica: DECIMAL(15,5) salvo las indicadas
+LIMITES_NUMERICOS = {'porcentaje_descuento': 10 ** 5, 'porcentaje_utilidad': 10 ** 5, 'porcentaje_iva': 10 ** 3}
+LIMITE_NUMERICO = 10 ** 10
+
+_FECHA = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def _numero_valido(valor, limite) -> bool:
+    """Lo que Decimal(str()) acepta, finito y dentro de la precisión de la columna"""
+    if valor.__class__ not in (int, float):
+        if valor.__class__ is not str:
+            return False
+        try:
+            valor = Decimal(valor.strip())
+        except ArithmeticError:
+            return False
+        # Decimal('NaN') no se puede comparar (InvalidOperation)
+        if not valor.is_finite():
+            return False
+    return -limite < valor < limite     # float: NaN no cumple, infinito queda fuera del límite
+
+
+def _fecha_valida(valor) -> bool:
+    texto = str(valor or '')[:10]
+    if not _FECHA.fullmatch(texto):
+        return False
+    try:
+        datetime.strptime(texto, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+
+class ValidadorFilas:
+    """
+    Valida registros SOAP contra el mapa de campos de su tabla, columna por
+    columna: obligatorios, largo de textos, números que Decimal acepta y que
+    caben en la columna, fechas y bodegas que existen en almacenes
+    """
+    
+    def __init__(self, campos: tuple, obligatorias: tuple, clave: tuple):
+        self.campos = campos
+        self.obligatorias = obligatorias
+        self.clave = clave      # Claves SOAP que identifican el registro en cuarentena
+    
+    def validar(self, registros: list, almacenes: set) -> tuple:
+        """
+        Returns:
+            (registros válidos, [(registro, motivo)] rechazados)
+        """
+        motivos = {}
+        
+        def rechazar(indices, motivo):
+            for i in indices:
+                motivos.setdefault(i, motivo(i))
+        
+        for columna, claves, tipo in self.campos:
+            if tipo == NUMERO:
+                valores = [r.get(claves[0], 0) for r in registros]
+                limite = LIMITES_NUMERICOS.get(columna, LIMITE_NUMERICO)
+                if set(map(type, valores)) <= {int, float}:
+                    malos = [i for i, v in enumerate(valores) if not -limite < v < limite]
+                else:
+                    malos = [i for i, v in enumerate(valores) if not _numero_valido(v, limite)]
+                rechazar(malos, lambda i: f"{claves[0]} no numérico o fuera de rango: {valores[i]!r}")
+                continue
+            
+            valores = [r.get(claves[0]) for r in registros]
+            for clave in claves[1:]:
+                valores = [valor or r.get(clave) for valor, r in zip(valores, registros)]
+            
+            if columna in self.obligatorias:
+                rechazar([i for i, v in enumerate(valores) if v in (None, '')], lambda i: f"{claves[0]} vacío")
+            if columna in LONGITUDES_COLUMNAS:
+                largo = LONGITUDES_COLUMNAS[columna]
+                # La observación se guarda sin los espacios de los extremos
+                largo_de = (lambda v: len(str(v).strip())) if tipo == OBSERVACION else (lambda v: len(str(v)))
+                rechazar([i for i, v in enumerate(valores) if v is not None and largo_de(v) > largo],
+                         lambda i: f"{claves[0]} excede {largo} caracteres")
+            if columna == 'fecha':
+                rechazar([i for i, v in enumerate(valores) if not _fecha_valida(v)],
+                         lambda i: f"{claves[0]} no es una fecha: {valores[i]!r}")
+            if columna == 'bodega_codigo':
+                rechazar([i for i, v in enumerate(valores) if v is not None and v not in almacenes],
+                         lambda i: f"Bodega {valores[i]!r} no existe en almacenes")
+        
+        if not motivos:
+            return registros, []
+        validos = [r for i, r in enumerate(registros) if i not in motivos]
+        return validos, [(registros[i], motivo) for i, motivo in sorted(motivos.items())]
+
+
+VALIDADORES = {
+    'productos': ValidadorFilas(CAMPOS_PRODUCTOS, ('referencia',), ('REFERENCIA', 'REFER')),
+    'ventas': ValidadorFilas(CAMPOS_VENTAS, ('numero_documento', 'referencia', 'fecha'),
+                             ('PREFIJO', 'NUMDOC', 'REFER')),
+    'inventario': ValidadorFilas(CAMPOS_INVENTARIO, ('bodega_codigo', 'referencia'), ('BODEGA', 'REFERENCIA')),
+}
+
+_almacenes = {'codigos': None, 'expira': 0.0}
+_lock_almacenes = threading.Lock()
+
+
+def almacenes_validos(conn) -> set:
+    """
+    Códigos de almacenes (FK de ventas e inventario), cacheados ALMACENES_CACHE_TTL segundos
+    """
+    with _lock_almacenes:
+        if _almacenes['codigos'] is None or time.monotonic() >= _almacenes['expira']:
+            with conn.cursor() as cur:
+                cur.execute("SELECT codigo FROM almacenes")
+                _almacenes['codigos'] = {fila[0] for fila in cur.fetchall()}
+            _almacenes['expira'] = time.monotonic() + ALMACENES_CACHE_TTL
+        return _almacenes['codigos']
+
+
+def _registro_json(registro: dict) -> dict:
+    """json.loads acepta NaN/Infinity pero JSONB no: se guardan como texto"""
+    return {k: str(v) if v.__class__ is float and not math.isfinite(v) else v for k, v in registro.items()}
+
+
+def poner_en_cuarentena(conn, fuente: str, rechazados: list, commit: bool = True):
+    """
+    Guarda las filas rechazadas con su motivo en cuarentena_ingesta
+    """
+    clave = VALIDADORES[fuente].clave
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO cuarentena_ingesta (empresa, fuente, clave, motivo, registro) VALUES %s
+        """, [
+            (empresa_actual().empresa, fuente, '/'.join(str(r.get(c) or '') for c in clave), motivo[:500],
+             json.dumps(_registro_json(r), default=str))
+            for r, motivo in rechazados
+        ])
+    if commit:
+        _confirmar(conn)
+    contar(rechazadas=len(rechazados))
+    logger.warning(f"Cuarentena {fuente}: {len(rechazados)} filas rechazadas (p.ej. {rechazados[0][1]})")
+
+
+def _escribir_aislando(conn, registros: list, rechazados: list, escribir) -> int:
+    """
+    Ejecuta escribir(registros) dentro de un savepoint; si la BD rechaza el
+    lote, lo parte a la mitad hasta aislar las filas culpables, que se agregan
+    a `rechazados` con el error de la BD
+    """
+    if not registros:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute("SAVEPOINT escritura_validada")
+    try:
+        return escribir(registros)
+    except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+        with conn.cursor() as cur:
+            cur.execute("ROLLBACK TO SAVEPOINT escritura_validada")
+        if len(registros) == 1:
+            rechazados.append((registros[0], f"Rechazada por la BD: {(e.pgerror or str(e)).strip()}"))
+            return 0
+        mitad = len(registros) // 2
+        return (_escribir_aislando(conn, registros[:mitad], rechazados, escribir) +
+                _escribir_aislando(conn, registros[mitad:], rechazados, escribir))
+
+
+def validado(fuente: str):
+    """
+    Decorador de escritores (conn, registros, ...): con VALIDACION_FILAS las
+    filas inválidas se separan antes de escribir y van a cuarentena; una fila
+    que la BD rechace igual se aísla partiendo el lote. Las válidas se escriben
+    y confirman en lugar de revertir el lote completo.
+    """
+    def decorador(escribir):
+        firma = inspect.signature(escribir)
+        
+        @functools.wraps(escribir)
+        def envoltura(conn, registros, *args, **kwargs):
+            if not VALIDACION_FILAS or not registros:
+                return escribir(conn, registros, *args, **kwargs)
+            
+            # commit puede venir por posición o por nombre
+            argumentos = firma.bind(conn, registros, *args, **kwargs)
+            argumentos.apply_defaults()
+            commit = argumentos.arguments.get('commit', True)
+            
+            with medir('transform'):
+                validos, rechazados = VALIDADORES[fuente].validar(registros, almacenes_validos(conn))
+            n = _escribir_aislando(conn, validos, rechazados, lambda lote: escribir(conn, lote, *args, **kwargs))
+            if rechazados:
+                poner_en_cuarentena(conn, fuente, rechazados, commit)
+            return n
+        return envoltura
+    return decorador
+
+
+# ============================================
+# ESCRITURA EN BASE DE DATOS
+# ============================================
+
+def _usar_copy(filas: list) -> bool:
+    return bool(CARGA_COPY_MIN_FILAS) and len(filas) >= CARGA_COPY_MIN_FILAS
+
+
+# Upsert condicional: las filas idénticas no se reescriben ni cambian updated_at.
+# Un NULL entrante conserva el valor guardado, tanto en el SET como en la
+# comparación; si no, un registro incompleto y uno completo de la misma
+# referencia se pisarían alternadamente en cada corrida
+_COALESCE_PRODUCTO = {c: f"COALESCE(EXCLUDED.{c}, productos.{c})" for c in COLUMNAS_ACTUALIZABLES_PRODUCTO}
+
+CONFLICTO_PRODUCTOS = f"""
+ON CONFLICT (referencia) DO UPDATE SET
+    {', '.join(f'{c} = {v}' for c, v in _COALESCE_PRODUCTO.items())},
+    updated_at = CURRENT_TIMESTAMP
+WHERE ({', '.join('productos.' + c for c in COLUMNAS_ACTUALIZABLES_PRODUCTO)})
+    IS DISTINCT FROM ({', '.join(_COALESCE_PRODUCTO.values())})
+"""
+
+
+@validado('productos')
+def upsert_productos(conn, productos: list):
+    """
+    Inserta productos nuevos y actualiza solo los que cambiaron
+    
+    Con el catálogo en cache, los productos sin valores nuevos no se envían; el
+    resto pasa por un upsert condicional (IS DISTINCT FROM) donde los NULL no
+    pisan lo guardado.
+    
+    Returns:
+        Número de productos insertados o modificados
+    """
+    if not productos:
+        return 0
+    
+    lote = TRANSFORMADOR_PRODUCTOS.transformar(productos)
+    
+    if catalogo_productos.activo:
+        referencias = lote.columna('referencia')
+        with medir('transform'):
+            valores = list(zip(*(
+                [None if v is None else str(v) for v in lote.columna(c)] for c in COLUMNAS_ACTUALIZABLES_PRODUCTO
+            )))
+        indices = catalogo_productos.pendientes(conn, referencias, valores)
+        if not indices:
+            return 0
+        if len(indices) < len(lote):
+            lote = lote.seleccionar(indices)
+            referencias = [referencias[i] for i in indices]
+            valores = [valores[i] for i in indices]
+    
+    try:
+        if _usar_copy(lote):
+            n = copy_upsert_productos(conn, productos, lote)
+        else:
+            query = f"""
+            INSERT INTO productos ({', '.join(COLUMNAS_PRODUCTOS)})
+            VALUES %s
+            {CONFLICTO_PRODUCTOS}
+            RETURNING referencia
+            """
+            with medir('db_write'), conn.cursor() as cur:
+                n = len(execute_values(cur, query, lote.filas(), fetch=True))
+            _confirmar(conn)
+    except psycopg2.Error:
+        catalogo_productos.invalidar()
+        raise
+    
+    if catalogo_productos.activo:
+        catalogo_productos.confirmar(referencias, valores, n)
+    return n
+
+
+def insert_ventas(conn, ventas: list, commit: bool = True):
+    """
+    Inserta ventas en la base de datos (evita duplicados)
+    
+    Con un IndiceVentas activo las ventas ya cargadas se descartan antes de
+    escribir. El prefiltro se aplica una sola vez por lote, fuera de la
+    validación: si la BD rechaza filas, la partición del lote no lo repite.
+    
+    Args:
+        commit: False para dejar la escritura dentro de la transacción del llamador
+    """
+    indice = _indice_ventas.get()
+    if indice is not None:
+        ventas, claves = indice.filtrar(ventas)
+    
+    n = _escribir_ventas(conn, ventas, commit)
+    
+    if indice is not None:
+        indice.confirmar(claves, n)
+    return n
+
+
+@validado('ventas')
+def _escribir_ventas(conn, ventas: list, commit: bool = True) -> int:
+    if not ventas:
+        return 0
+    if _usar_copy(ventas):
+        return copy_insert_ventas(conn, ventas, commit)
+    return _insert_ventas_values(conn, ventas, commit)
+
+
+def _insert_ventas_values(conn, ventas: list, commit: bool = True) -> int:
+    """INSERT ... ON CONFLICT DO NOTHING con execute_values"""
+    query = """
+    INSERT INTO ventas (
+        tipo_movimiento, prefijo, numero_documento, fecha, hora,
+        cedula_cliente, nombre_cliente, codigo_seccion, nombre_seccion,
+        bodega_codigo, referencia, cantidad, valor_unitario, valor_total,
+        porcentaje_descuento, valor_descuento, valor_costo, valor_utilidad,
+        porcentaje_utilidad, porcentaje_iva, vendedor_codigo, vendedor_nombre
+    ) VALUES %s
+    ON CONFLICT (prefijo, numero_documento, referencia) DO NOTHING
+    """
+    
+    values = TRANSFORMADOR_VENTAS.transformar(ventas).filas()
+    
+    with medir('db_write'), conn.cursor() as cur:
+        execute_values(cur, query, values)
+    
+    if commit:
+        _confirmar(conn)
+    return len(values)
+
+
+QUERY_INVENTARIO_ACTUAL = """
+INSERT INTO inventario_actual (bodega_codigo, referencia, cantidad, valor_costo, valor_venta, observacion)
+VALUES %s
+ON CONFLICT (bodega_codigo, referencia) DO UPDATE SET
+    cantidad = EXCLUDED.cantidad,
+    valor_costo = EXCLUDED.valor_costo,
+    valor_venta = EXCLUDED.valor_venta,
+    observacion = EXCLUDED.observacion,
+    ultima_actualizacion = CURRENT_TIMESTAMP
+"""
+
+QUERY_INVENTARIO_SNAPSHOT = """
+INSERT INTO inventario_snapshot (fecha_snapshot, bodega_codigo, referencia, cantidad, valor_costo, valor_venta, observacion)
+VALUES %s
+ON CONFLICT (fecha_snapshot, bodega_codigo, referencia) DO UPDATE SET
+    cantidad = EXCLUDED.cantidad,
+    valor_costo = EXCLUDED.valor_costo,
+    valor_venta = EXCLUDED.valor_venta,
+    observacion = EXCLUDED.observacion
+"""
+
+
+@validado('inventario')
+def upsert_inventario(conn, inventario: list, fecha_snapshot: str, commit: bool = True):
+    """
+    Inserta o actualiza snapshot de inventario
+    
+    Args:
+        commit: False para dejar la escritura dentro de la transacción del llamador
+    """
+    if not inventario:
+        return 0
+    
+    if _usar_copy(inventario):
+        return copy_upsert_inventario(conn, inventario, fecha_snapshot, commit)
+    
+    lote = TRANSFORMADOR_INVENTARIO.transformar(inventario)
+    values_actual = lote.filas()
+    values_snapshot = lote.filas(fecha_snapshot)
+    
+    with medir('db_write'), conn.cursor() as cur:
+        execute_values(cur, QUERY_INVENTARIO_ACTUAL, values_actual)
+        execute_values(cur, QUERY_INVENTARIO_SNAPSHOT, values_snapshot)
+    
+    if commit:
+        _confirmar(conn)
+    return len(values_actual)
+
+
+# ============================================
+# REGISTRO COMPARTIDO DE PRODUCTOS
+# ============================================
+
+class RegistroProductos:
+    """
+    Escritor único de productos para pipelines que corren en paralelo
+    
+    Ventas e inventario traen las mismas referencias; en vez de que cada lado
+    haga su propio upsert (y compitan por los locks de las mismas filas de
+    productos), ambos pasan por este registro: las escrituras se serializan y
+    cada referencia se escribe solo cuando aporta algo nuevo en la corrida.
+    
+    Los registros de una misma referencia se fusionan columna a columna: un
+    valor vacío nunca reemplaza a uno conocido y lo que trae inventario
+    (REFERENCIA) prevalece sobre lo que trae ventas (REFER).
+    """
+    
+    def __init__(self):
+        self._productos = {}    # referencia -> {columna: (valor, prioridad)}
+        self._lock = threading.Lock()
+        self.recibidos = 0
+        self.escritos = 0
+    
+    @staticmethod
+    def _fusionar(actual: dict, registro: dict) -> bool:
+        """
+        Fusiona `registro` en `actual` (modificándolo)
+        
+        Returns:
+            True si alguna columna cambió
+        """
+        prioridad = 2 if registro.get('REFERENCIA') else 1
+        cambio = False
+        for columna, claves, _ in CAMPOS_PRODUCTOS:
+            valor = next((registro[k] for k in claves if k in registro), None)
+            if valor is None or (isinstance(valor, str) and not valor.strip()):
+                continue
+            conocido = actual.get(columna)
+            if conocido is None or (prioridad > conocido[1] and valor != conocido[0]):
+                actual[columna] = (valor, prioridad)
+                cambio = True
+        return cambio
+    
+    def escribir(self, conn, productos: list) -> int:
+        """
+        Escribe los productos nuevos o que completan/corrigen lo ya escrito
+        en esta corrida
+        
+        Returns:
+            Número de productos escritos
+        """
+        with self._lock:
+            self.recibidos += len(productos)
+            cambiados, anteriores = {}, {}
+            for p in productos:
+                referencia = p.get('REFERENCIA') or p.get('REFER')
+                if not referencia:
+                    continue
+                actual = self._productos.get(referencia)
+                fusion = dict(actual) if actual else {}
+                if self._fusionar(fusion, p) or actual is None:
+                    anteriores.setdefault(referencia, actual)
+                    self._productos[referencia] = cambiados[referencia] = fusion
+            if not cambiados:
+                return 0
+            registros = [
+                {claves[0]: fusion[columna][0] for columna, claves, _ in CAMPOS_PRODUCTOS if columna in fusion}
+                for fusion in cambiados.values()
+            ]
+            try:
+                n = upsert_productos(conn, registros)
+            except Exception:
+                # Lo no confirmado se vuelve a intentar con el próximo lote
+                for referencia, actual in anteriores.items():
+                    if actual is None:
+                        self._productos.pop(referencia, None)
+                    else:
+                        self._productos[referencia] = actual
+                raise
+            self.escritos += n
+            return n
+    
+    def resumen(self) -> dict:
+        return {'recibidos': self.recibidos, 'referencias': len(self._productos), 'escritos': self.escritos}
+
+
+# Registro activo en el contexto actual (None = cada handler escribe por su cuenta)
+_registro_productos = contextvars.ContextVar('registro_productos', default=None)
+
+
+def guardar_productos(conn, productos: list) -> int:
+    """
+    Upsert de productos, a través del registro compartido si hay uno activo
+    """
+    registro = _registro_productos.get()
+    if registro is None:
+        return upsert_productos(conn, productos)
+    return registro.escribir(conn, productos)
+
+
+# ============================================
+# CARGA MASIVA (COPY + STAGING)
+# ============================================
+
+_ESCAPE_COPY = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _valor_copy(valor) -> str:
+    """Formatea un valor para COPY en formato texto"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, str):
+        return valor.translate(_ESCAPE_COPY)
+    return str(valor)
+
+
+class _FuenteCopy:
+    """
+    Objeto tipo archivo que entrega las líneas de COPY a medida que psycopg2
+    las lee, sin materializar el lote completo como un solo string
+    """
+    
+    def __init__(self, lineas):
+        self._lineas = iter(lineas)
+        self._pendiente = ''
+    
+    def read(self, size: int = -1) -> str:
+        partes = [self._pendiente]
+        largo = len(self._pendiente)
+        for linea in self._lineas:
+            partes.append(linea)
+            largo += len(linea)
+            if 0 < size <= largo:
+                break
+        texto = ''.join(partes)
+        if size < 0:
+            self._pendiente = ''
+            return texto
+        self._pendiente = texto[size:]
+        return texto[:size]
+
+
+def _copy_staging(cur, plantilla: str, lote: LoteColumnar) -> str:
+    """
+    Carga el lote con COPY FROM STDIN en una tabla temporal de la sesión con
+    la estructura de `plantilla` (las stg_* de migration_v4)
+    
+    Cada conexión tiene su propia staging: cargas concurrentes (empresas,
+    tramos, bodegas) no se bloquean entre sí aunque el llamador deje la
+    transacción abierta (commit=False). La columna `orden` numera las filas en
+    el orden del lote para elegir entre duplicados: gana la última, como en los
+    dict por clave de los demás caminos.
+    
+    Returns:
+        Nombre de la tabla temporal
+    """
+    tabla = f"tmp_{plantilla}"
+    cur.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {tabla} (LIKE {plantilla}, orden BIGSERIAL)
+        ON COMMIT DELETE ROWS
+    """)
+    cur.execute(f"TRUNCATE {tabla}")
+    cur.copy_expert(f"COPY {tabla} ({', '.join(lote.columnas)}) FROM STDIN", _FuenteCopy(lote.lineas_copy()))
+    return tabla
+
+
+def copy_upsert_productos(conn, productos: list, lote: LoteColumnar = None) -> int:
+    """
+    Carga productos vía COPY a stg_productos y los fusiona en productos
+    
+    Args:
+        lote: productos ya transformados (y filtrados por el catálogo)
+    
+    Returns:
+        Número de productos insertados o modificados
+    """
+    columnas = ', '.join(COLUMNAS_PRODUCTOS)
+    with medir('db_write'), conn.cursor() as cur:
+        staging = _copy_staging(cur, 'stg_productos', lote or TRANSFORMADOR_PRODUCTOS.transformar(productos))
+        cur.execute(f"""
+            INSERT INTO productos ({columnas})
+            SELECT DISTINCT ON (referencia) {columnas}
+            FROM {staging}
+            WHERE referencia IS NOT NULL
+            ORDER BY referencia, orden DESC
+            {CONFLICTO_PRODUCTOS}
+        """)
+        n = cur.rowcount
+        cur.execute(f"TRUNCATE {staging}")
+    
+    _confirmar(conn)
+    return n
+
+
+def copy_insert_ventas(conn, ventas: list, commit: bool = True) -> int:
+    """
+    Carga ventas vía COPY a stg_ventas y las fusiona en ventas
+    
+    El anti-join contra ventas descarta en bloque las filas ya existentes;
+    ON CONFLICT DO NOTHING queda como respaldo para duplicados dentro del lote.
+    
+    Args:
+        commit: False para dejar la escritura dentro de la transacción del llamador
+    
+    Returns:
+        Número de ventas realmente insertadas (sin contar duplicados)
+    """
+    columnas = ', '.join(COLUMNAS_VENTAS)
+    with medir('db_write'), conn.cursor() as cur:
+        staging = _copy_staging(cur, 'stg_ventas', TRANSFORMADOR_VENTAS.transformar(ventas))
+        cur.execute(f"""
+            INSERT INTO ventas ({columnas})
+            SELECT {columnas}
+            FROM {staging} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM ventas v
+                WHERE v.prefijo = s.prefijo
+                  AND v.numero_documento = s.numero_documento
+                  AND v.referencia = s.referencia
+            )
+            ON CONFLICT (prefijo, numero_documento, referencia) DO NOTHING
+        """)
+        n = cur.rowcount
+        cur.execute(f"TRUNCATE {staging}")
+    
+    if commit:
+        _confirmar(conn)
+    return n
+
+
+def copy_upsert_inventario(conn, inventario: list, fecha_snapshot: str, commit: bool = True) -> int:
+    """
+    Carga inventario vía COPY a stg_inventario y lo fusiona en
+    inventario_actual e inventario_snapshot con dos sentencias set-based
+    """
+    columnas = ', '.join(COLUMNAS_INVENTARIO)
+    lote = TRANSFORMADOR_INVENTARIO.transformar(inventario)
+    with medir('db_write'), conn.cursor() as cur:
+        staging = _copy_staging(cur, 'stg_inventario', lote)
+        cur.execute(f"""
+            INSERT INTO inventario_actual ({columnas})
+            SELECT DISTINCT ON (bodega_codigo, referencia) {columnas}
+            FROM {staging}
+            ORDER BY bodega_codigo, referencia, orden DESC
+            ON CONFLICT (bodega_codigo, referencia) DO UPDATE SET
+                cantidad = EXCLUDED.cantidad,
+                valor_costo = EXCLUDED.valor_costo,
+                valor_venta = EXCLUDED.valor_venta,
+                observacion = EXCLUDED.observacion,
+                ultima_actualizacion = CURRENT_TIMESTAMP
+        """)
+        cur.execute(f"""
+            INSERT INTO inventario_snapshot (fecha_snapshot, {columnas})
+            SELECT DISTINCT ON (bodega_codigo, referencia) %s::date, {columnas}
+            FROM {staging}
+            ORDER BY bodega_codigo, referencia, orden DESC
+            ON CONFLICT (fecha_snapshot, bodega_codigo, referencia) DO UPDATE SET
+                cantidad = EXCLUDED.cantidad,
+                valor_costo = EXCLUDED.valor_costo,
+                valor_venta = EXCLUDED.valor_venta,
+                observacion = EXCLUDED.observacion
+        """, (fecha_snapshot,))
+        cur.execute(f"TRUNCATE {staging}")
+    
+    if commit:
+        _confirmar(conn)
+    return len(lote)
+
+
+# ============================================
+# SINCRONIZACIÓN DELTA DE INVENTARIO
+# ============================================
+
+_ESCALA_NUMERIC = Decimal('0.00001')  # DECIMAL(15,5)
+
+
+def _texto_numeric(valor) -> str:
+    """Representa un valor como lo devuelve PostgreSQL para DECIMAL(15,5)::text"""
+    if valor is None:
+        return ''
+    valor = Decimal(valor).quantize(_ESCALA_NUMERIC, rounding=ROUND_HALF_UP)
+    return str(valor if valor else Decimal(0).quantize(_ESCALA_NUMERIC))
+
+
+def huella_inventario(cantidad, valor_costo, valor_venta, observacion) -> str:
+    """
+    Huella de una fila de inventario (cantidad/valor_costo/valor_venta/observacion)
+    
+    Debe coincidir con la huella calculada en SQL por SincronizadorDelta._cargar.
+    """
+    texto = '|'.join((
+        _texto_numeric(cantidad), _texto_numeric(valor_costo), _texto_numeric(valor_venta), observacion or ''
+    ))
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()[:16]
+
+
+class SincronizadorDelta:
+    """
+    Sincronización delta de inventario_actual e inventario_snapshot
+    
+    Carga una vez la huella de cada (bodega, referencia) ya sincronizada y, por
+    cada página del feed, escribe solo las filas nuevas o modificadas. Al
+    finalizar una corrida completa pone en cero las filas que salieron del feed.
+    """
+    
+    def __init__(self, conn, fecha_snapshot: str, bodega: str = None):
+        self.fecha_snapshot = fecha_snapshot
+        self.bodega = bodega
+        self.huellas = {}   # (bodega, referencia) -> (huella_actual, huella_snapshot, actual_no_cero, snapshot_no_cero)
+        self.vistos = set()
+        self.nuevos = 0
+        self.cambiados = 0
+        self.sin_cambios = 0
+        self.eliminados = 0
+        self._cargar(conn)
+    
+    def _cargar(self, conn):
+        huella = """left(md5(
+            coalesce({t}.cantidad::text, '') || '|' || coalesce({t}.valor_costo::text, '') || '|' ||
+            coalesce({t}.valor_venta::text, '') || '|' || coalesce({t}.observacion, '')
+        ), 16)"""
+        filtro_bodega = "WHERE bodega_codigo = %(bodega)s" if self.bodega else ""
+        query = f"""
+            SELECT
+                bodega_codigo, referencia,
+                CASE WHEN a.referencia IS NOT NULL THEN {huella.format(t='a')} END,
+                CASE WHEN s.referencia IS NOT NULL THEN {huella.format(t='s')} END,
+                COALESCE(a.cantidad <> 0, FALSE),
+                COALESCE(s.cantidad <> 0, FALSE)
+            FROM (SELECT * FROM inventario_actual {filtro_bodega}) a
+            FULL JOIN (
+                SELECT * FROM inventario_snapshot
+                WHERE fecha_snapshot = %(fecha)s {filtro_bodega.replace('WHERE', 'AND')}
+            ) s USING (bodega_codigo, referencia)
+        """
+        with conn.cursor() as cur:
+            cur.execute(query, {'fecha': self.fecha_snapshot, 'bodega': self.bodega})
+            for bodega, referencia, h_actual, h_snapshot, actual_no_cero, snapshot_no_cero in cur:
+                self.huellas[(bodega, referencia)] = (h_actual, h_snapshot, actual_no_cero, snapshot_no_cero)
+        _confirmar(conn)
+        logger.info(f"Delta inventario: {len(self.huellas)} huellas cargadas")
+    
+    def procesar(self, conn, inventario: list, commit: bool = True) -> int:
+        """
+        Escribe solo las filas nuevas o modificadas de una página del feed
+        
+        Con VALIDACION_FILAS la escritura pasa por _escribir_aislando: una fila
+        que la BD rechace va a cuarentena y las huellas en memoria solo se
+        actualizan con las filas que quedaron escritas.
+        
+        Args:
+            commit: False para dejar la escritura dentro de la transacción del llamador
+        
+        Returns:
+            Número de filas escritas (inventario_actual)
+        """
+        rechazados = []
+        if VALIDACION_FILAS:
+            inventario, rechazados = VALIDADORES['inventario'].validar(inventario, almacenes_validos(conn))
+        
+        filas = TRANSFORMADOR_INVENTARIO.transformar(inventario).filas()
+        # Comparación de huellas: se mide como parte de la transformación
+        with medir('transform'):
+            entradas = [(registro, fila, huella_inventario(*fila[2:])) for registro, fila in zip(inventario, filas)]
+        
+        if VALIDACION_FILAS:
+            rechazados_bd = []
+            escritas = _escribir_aislando(conn, entradas, rechazados_bd, lambda lote: self._escribir(conn, lote))
+            if rechazados_bd:
+                descartadas = {id(entrada) for entrada, _ in rechazados_bd}
+                entradas = [entrada for entrada in entradas if id(entrada) not in descartadas]
+                rechazados += [(entrada[0], motivo) for entrada, motivo in rechazados_bd]
+            if rechazados:
+                poner_en_cuarentena(conn, 'inventario', rechazados, commit)
+                # Vinieron en el feed: finalizar no debe ponerlas en cero
+                self.vistos.update((r.get('BODEGA'), r.get('REFERENCIA')) for r, _ in rechazados)
+        else:
+            escritas = self._escribir(conn, entradas)
+        
+        self._registrar(entradas)
+        if commit:
+            _confirmar(conn)
+        return escritas
+    
+    def _escribir(self, conn, entradas: list) -> int:
+        """
+        Escribe las filas cuya huella difiere de la conocida, sin tocar las
+        huellas en memoria (un savepoint puede deshacer la escritura)
+        """
+        values_actual = []
+        values_snapshot = []
+        pendientes = {}     # Huellas de este lote: una clave repetida se escribe una vez
+        
+        with medir('transform'):
+            for _, fila, huella in entradas:
+                clave = (fila[0], fila[1])
+                previa = pendientes.get(clave) or self.huellas.get(clave)
+                if previa is None or previa[0] != huella:
+                    values_actual.append(fila)
+                if previa is None or previa[1] != huella:
+                    values_snapshot.append((self.fecha_snapshot,) + fila)
+                pendientes[clave] = (huella, huella)
+        
+        with medir('db_write'), conn.cursor() as cur:
+            if values_actual:
+                execute_values(cur, QUERY_INVENTARIO_ACTUAL, values_actual)
+            if values_snapshot:
+                execute_values(cur, QUERY_INVENTARIO_SNAPSHOT, values_snapshot)
+        return len(values_actual)
+    
+    def _registrar(self, entradas: list):
+        """Actualiza huellas y contadores con las filas ya escritas"""
+        with medir('transform'):
+            for _, fila, huella in entradas:
+                clave = (fila[0], fila[1])
+                previa = self.huellas.get(clave)
+                self.vistos.add(clave)
+                
+                if previa is None or previa[0] is None:
+                    self.nuevos += 1
+                elif previa[0] != huella:
+                    self.cambiados += 1
+                else:
+                    self.sin_cambios += 1
+                
+                self.huellas[clave] = (huella, huella, fila[2] != 0, fila[2] != 0)
+    
+    def finalizar(self, conn, completo: bool = True, commit: bool = True) -> int:
+        """
+        Pone en cero las filas que ya no vienen en el feed
+        
+        Solo se ejecuta si la corrida fue completa y trajo datos: un feed vacío o
+        truncado dejaría en cero inventario que sí existe.
+        """
+        if not completo or not self.vistos:
+            logger.warning("Delta inventario: feed incompleto o vacío, no se ponen en cero filas ausentes")
+            return 0
+        
+        ausentes_actual = []
+        ausentes_snapshot = []
+        for clave, (_, _, actual_no_cero, snapshot_no_cero) in self.huellas.items():
+            if clave in self.vistos:
+                continue
+            if actual_no_cero:
+                ausentes_actual.append(clave)
+            if snapshot_no_cero:
+                ausentes_snapshot.append(clave)
+        
+        with medir('db_write'), conn.cursor() as cur:
+            if ausentes_actual:
+                execute_values(cur, """
+                    UPDATE inventario_actual i SET cantidad = 0, ultima_actualizacion = CURRENT_TIMESTAMP
+                    FROM (VALUES %s) AS v(bodega_codigo, referencia)
+                    WHERE i.bodega_codigo = v.bodega_codigo AND i.referencia = v.referencia
+                """, ausentes_actual)
+            if ausentes_snapshot:
+                execute_values(cur, """
+                    UPDATE inventario_snapshot i SET cantidad = 0
+                    FROM (VALUES %s) AS v(bodega_codigo, referencia, fecha_snapshot)
+                    WHERE i.fecha_snapshot = v.fecha_snapshot::date
+                      AND i.bodega_codigo = v.bodega_codigo AND i.referencia = v.referencia
+                """, [clave + (self.fecha_snapshot,) for clave in ausentes_snapshot])
+        
+        if commit:
+            _confirmar(conn)
+        
+        self.eliminados = len(ausentes_actual)
+        logger.info(f"Delta inventario: {self.eliminados} filas ausentes del feed puestas en cero")
+        return self.eliminados
+    
+    def resumen(self) -> dict:
+        return {
+            'nuevos': self.nuevos,
+            'cambiados': self.cambiados,
+            'sin_cambios': self.sin_cambios,
+            'eliminados': self.eliminados
+        }
+
+
+def _feed_inventario_completo(n_items: int) -> bool:
+    """El feed se cortó si se llenaron todas las páginas permitidas"""
+    return n_items < INVENTARIO_MAX_PAGINAS * INVENTARIO_FILAS_POR_PAGINA
+
+
+# ============================================
+# WATERMARK DE VENTAS
+# ============================================
+
+def _normalizar_hora(hora) -> str:
+    """
+    'HH:MM:SS' con ceros a la izquierda ('9:5' -> '09:05:00'), para que las
+    horas se comparen bien como texto
+    
+    HORA puede venir sin relleno, con fracción de segundos o como datetime ISO.
+    """
+    hora = str(hora or '')
+    if 'T' in hora:
+        hora = hora.split('T', 1)[1]
+    partes = [p.split('.', 1)[0].strip() for p in hora.split(':')[:3] if p.strip()]
+    partes += ['0'] * (3 - len(partes))
+    return ':'.join(p.zfill(2)[-2:] for p in partes)
+
+
+def _clave_watermark(v: dict) -> tuple:
+    """
+    (fecha, hora, prefijo, documento) normalizados de un registro de venta
+    
+    FECHA/HORA pueden venir como 'YYYY-MM-DD' / 'HH:MM:SS' o como datetime ISO.
+    """
+    fecha = str(v.get('FECHA') or '')[:10]
+    return (fecha, _normalizar_hora(v.get('HORA')), str(v.get('PREFIJO') or ''), str(v.get('NUMDOC') or ''))
+
+
+def leer_watermark(conn, empresa: str, fuente: str = 'ventas'):
+    """
+    Último (fecha, hora, prefijo, documento) ingerido, o None si no hay watermark
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT ultima_fecha, ultima_hora, ultimo_prefijo, ultimo_documento
+            FROM extraccion_watermark
+            WHERE empresa = %s AND fuente = %s
+        """, (empresa, fuente))
+        fila = cur.fetchone()
+    _confirmar(conn)
+    
+    if not fila:
+        return None
+    fecha, hora, prefijo, documento = fila
+    return (fecha.isoformat(), hora.strftime('%H:%M:%S') if hora else '00:00:00', prefijo or '', documento or '')
+
+
+def guardar_watermark(conn, empresa: str, clave: tuple, filas: int, fuente: str = 'ventas'):
+    """
+    Avanza el watermark (nunca lo retrocede)
+    """
+    fecha, hora, prefijo, documento = clave
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO extraccion_watermark (empresa, fuente, ultima_fecha, ultima_hora, ultimo_prefijo,
+                                              ultimo_documento, filas_ultima_corrida, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (empresa, fuente) DO UPDATE SET
+                ultima_fecha = EXCLUDED.ultima_fecha,
+                ultima_hora = EXCLUDED.ultima_hora,
+                ultimo_prefijo = EXCLUDED.ultimo_prefijo,
+                ultimo_documento = EXCLUDED.ultimo_documento,
+                filas_ultima_corrida = EXCLUDED.filas_ultima_corrida,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE (extraccion_watermark.ultima_fecha, extraccion_watermark.ultima_hora)
+                <= (EXCLUDED.ultima_fecha, EXCLUDED.ultima_hora)
+        """, (empresa, fuente, fecha, hora, prefijo, documento, filas))
+    _confirmar(conn)
+
+
+def filtrar_posteriores_watermark(ventas: list, watermark: tuple) -> list:
+    """
+    Registros del segundo del watermark en adelante, según (fecha, hora)
+    
+    El segundo del watermark se vuelve a enviar completo: prefijo y documento
+    no ordenan los documentos de un mismo segundo ('10' < '9' como texto), así
+    que no sirven para descartar. ON CONFLICT descarta lo ya ingerido. Los
+    documentos que llegan tarde con una hora anterior los recoge la
+    reconciliación programada.
+    """
+    if not watermark:
+        return ventas
+    desde = watermark[:2]
+    return [v for v in ventas if _clave_watermark(v)[:2] >= desde]
+
+
+# ============================================
+# DIVISIÓN ADAPTATIVA DE RANGOS DE VENTAS
+# ============================================
+
+class RangoDemasiadoGrande(Exception):
+    """El rango devolvió más filas de las permitidas por llamada"""
+
+
+def _dias_rango(inicio: str, fin: str) -> int:
+    return (datetime.strptime(fin, '%Y-%m-%d') - datetime.strptime(inicio, '%Y-%m-%d')).days + 1
+
+
+def _sumar_dias(fecha: str, dias: int) -> str:
+    return (datetime.strptime(fecha, '%Y-%m-%d') + timedelta(days=dias)).strftime('%Y-%m-%d')
+
+
+def leer_granularidad(conn, empresa: str, fecha_inicio: str, fecha_fin: str) -> dict:
+    """
+    Días por llamada aprendidos por mes ('YYYY-MM' -> dias)
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT periodo, dias_por_llamada FROM ventas_granularidad
+            WHERE empresa = %s AND periodo BETWEEN %s AND %s
+        """, (empresa, fecha_inicio[:7], fecha_fin[:7]))
+        granularidad = dict(cur.fetchall())
+    _confirmar(conn)
+    return granularidad
+
+
+def guardar_granularidad(conn, empresa: str, aprendido: dict):
+    """
+    Guarda por mes los días por llamada y el máximo de filas por día observado
+    """
+    if not aprendido:
+        return
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO ventas_granularidad (empresa, periodo, dias_por_llamada, max_filas_dia, updated_at)
+            VALUES %s
+            ON CONFLICT (empresa, periodo) DO UPDATE SET
+                dias_por_llamada = EXCLUDED.dias_por_llamada,
+                max_filas_dia = GREATEST(ventas_granularidad.max_filas_dia, EXCLUDED.max_filas_dia),
+                updated_at = CURRENT_TIMESTAMP
+        """, [(empresa, periodo, d['dias'], d['max_filas_dia'], datetime.now()) for periodo, d in aprendido.items()])
+    _confirmar(conn)
+
+
+def planificar_rangos(fecha_inicio: str, fecha_fin: str, granularidad: dict) -> list:
+    """
+    Parte el rango según la granularidad aprendida
+    
+    Sin historial se intenta el rango completo en una llamada. Con historial se
+    corta en los límites de mes, usando los días por llamada de cada mes.
+    """
+    if not granularidad:
+        return [(fecha_inicio, fecha_fin)]
+    
+    rangos = []
+    inicio = fecha_inicio
+    while inicio <= fecha_fin:
+        dia = datetime.strptime(inicio, '%Y-%m-%d')
+        siguiente_mes = (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+        fin_mes = (siguiente_mes - timedelta(days=1)).strftime('%Y-%m-%d')
+        dias = granularidad.get(inicio[:7], 31)
+        fin = min(_sumar_dias(inicio, dias - 1), fin_mes, fecha_fin)
+        rangos.append((inicio, fin))
+        inicio = _sumar_dias(fin, 1)
+    return rangos
+
+
+def iter_ventas_adaptativo(fecha_inicio: str, fecha_fin: str, granularidad: dict = None,
+                           max_filas: int = VENTAS_MAX_FILAS_POR_LLAMADA,
+                           timeout: int = VENTAS_TIMEOUT_ADAPTATIVO,
+                           aprendido: dict = None):
+    """
+    Extrae ventas partiendo el rango a la mitad cuando una llamada excede el
+    timeout o devuelve más de `max_filas` filas, hasta llegar a días sueltos
+    
+    Args:
+        granularidad: días por llamada aprendidos por mes (plan inicial)
+        aprendido: dict que se completa con la granularidad observada por mes
+    
+    Yields:
+        (fecha_inicio, fecha_fin, ventas) por cada sub-rango exitoso, en orden
+    """
+    pendientes = list(reversed(planificar_rangos(fecha_inicio, fecha_fin, granularidad or {})))
+    fallidos = {}           # mes -> menor rango (días) que hubo que partir
+    
+    while pendientes:
+        inicio, fin = pendientes.pop()
+        dias = _dias_rango(inicio, fin)
+        
+        try:
+            with pagina_ingesta(f"{inicio}..{fin}"):
+                resultado = call_soap_ventas(inicio, fin, empresa_actual().token, timeout=timeout)
+            ventas = _extraer_registros(resultado, ('ventas', 'data', 'resultado'))
+            if len(ventas) > max_filas and dias > 1:
+                raise RangoDemasiadoGrande(f"{len(ventas)} filas")
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                MemoryError, RangoDemasiadoGrande) as e:
+            if dias == 1:
+                raise
+            ventas = None
+            mitad = _sumar_dias(inicio, dias // 2 - 1)
+            logger.warning(f"Rango {inicio} a {fin} partido en dos ({type(e).__name__}: {e})")
+            pendientes.append((_sumar_dias(mitad, 1), fin))
+            pendientes.append((inicio, mitad))
+            fallidos[inicio[:7]] = min(fallidos.get(inicio[:7], dias), dias)
+            continue
+        
+        if len(ventas) > max_filas:
+            logger.warning(f"Día {inicio} con {len(ventas)} filas supera el máximo por llamada ({max_filas})")
+        
+        if aprendido is not None:
+            periodo = aprendido.setdefault(inicio[:7], {'dias': 0, 'max_filas_dia': 0, 'max_filas': 0})
+            periodo['max_filas_dia'] = max(periodo['max_filas_dia'], len(ventas) // dias)
+            periodo['max_filas'] = max(periodo['max_filas'], len(ventas))
+            periodo['dias'] = max(periodo['dias'], dias)
+        
+        yield inicio, fin, ventas
+    
+    if aprendido is not None:
+        for periodo, datos in aprendido.items():
+            if periodo in fallidos:
+                # El mayor rango exitoso por debajo del menor que hubo que partir
+                datos['dias'] = max(1, min(datos['dias'], fallidos[periodo] - 1))
+            elif datos['max_filas'] < max_filas // 4:
+                # Sin particiones y con holgura: se amplía el rango para la próxima vez
+                datos['dias'] = min(datos['dias'] * 2, 31)
+
+
+# ============================================
+# VENTAS POR TRAMOS EN PARALELO
+# ============================================
+
+def planificar_tramos(fecha_inicio: str, fecha_fin: str, dias: int = VENTAS_TRAMO_DIAS) -> list:
+    """
+    Parte el rango en tramos consecutivos de `dias` días (el último puede ser menor)
+    """
+    dias = max(1, dias)
+    tramos = []
+    inicio = fecha_inicio
+    while inicio <= fecha_fin:
+        fin = min(_sumar_dias(inicio, dias - 1), fecha_fin)
+        tramos.append((inicio, fin))
+        inicio = _sumar_dias(fin, 1)
+    return tramos
+
+
+def _tramo_ventas(inicio: str, fin: str) -> list:
+    with pagina_ingesta(f"{inicio}..{fin}"):
+        resultado = call_soap_ventas(inicio, fin, empresa_actual().token)
+    return _extraer_registros(resultado, ('ventas', 'data', 'resultado'))
+
+
+def iter_ventas_tramos(fecha_inicio: str, fecha_fin: str, dias: int = VENTAS_TRAMO_DIAS,
+                       concurrencia: int = VENTAS_TRAMOS_CONCURRENCIA, errores: dict = None,
+                       restantes: list = None):
+    """
+    Descarga los tramos del rango con hasta `concurrencia` llamadas en vuelo
+    
+    Los tramos se entregan en el orden en que terminan, no por fecha, para que
+    el llamador escriba cada uno mientras los demás siguen descargando.
+    
+    Args:
+        errores: dict que se completa con (inicio, fin) -> error de los tramos
+            fallidos; sin él, el primer error se propaga
+        restantes: lista que se completa con los tramos no pedidos porque venció
+            el plazo de la invocación; sin ella no se mira el plazo
+    
+    Yields:
+        (fecha_inicio, fecha_fin, ventas) por cada tramo exitoso
+    """
+    tramos = list(reversed(planificar_tramos(fecha_inicio, fecha_fin, dias)))
+    concurrencia = max(1, concurrencia)
+    pool = ThreadPoolExecutor(max_workers=concurrencia)
+    en_vuelo = {}   # future -> (inicio, fin)
+    
+    try:
+        while tramos or en_vuelo:
+            while tramos and len(en_vuelo) < concurrencia:
+                if restantes is not None and plazo_vencido():
+                    logger.warning(f"Plazo por vencer: {len(tramos)} tramos quedan para la continuación")
+                    restantes.extend(reversed(tramos))
+                    tramos.clear()
+                    break
+                inicio, fin = tramos.pop()
+                en_vuelo[pool.submit(contextvars.copy_context().run, _tramo_ventas, inicio, fin)] = (inicio, fin)
+            
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                inicio, fin = en_vuelo.pop(futuro)
+                try:
+                    ventas = futuro.result()
+                except Exception as e:
+                    if errores is None:
+                        raise
+                    logger.error(f"Tramo {inicio} a {fin} falló: {e}")
+                    errores[(inicio, fin)] = str(e)
+                    continue
+                yield inicio, fin, ventas
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ============================================
+# CUADRE DE VENTAS POR AGREGADOS
+# ============================================
+
+def agregados_ventas(ventas: list) -> dict:
+    """
+    (fecha, bodega) -> [filas, SUM cantidad, SUM valor_total] de registros de la API
+    
+    Cada clave (prefijo, numero_documento, referencia) cuenta una vez, con los
+    valores de su primera aparición: lo mismo que deja ON CONFLICT DO NOTHING.
+    """
+    unicas = list({(v.get('PREFIJO'), v.get('NUMDOC'), v.get('REFER')): v for v in reversed(ventas)}.values())
+    agregados = {}
+    if not unicas:
+        return agregados
+    
+    with medir('transform'):
+        lote = TRANSFORMADOR_VENTAS.transformar(unicas)
+        for fecha, bodega, cantidad, valor in zip(lote.columna('fecha'), lote.columna('bodega_codigo'),
+                                                  lote.columna('cantidad'), lote.columna('valor_total')):
+            grupo = agregados.setdefault((str(fecha)[:10], bodega), [0, Decimal(0), Decimal(0)])
+            grupo[0] += 1
+            grupo[1] += cantidad
+            grupo[2] += valor
+    return agregados
+
+
+def agregados_bd(conn, fecha_inicio: str, fecha_fin: str) -> dict:
+    """
+    (fecha, bodega) -> [filas, SUM cantidad, SUM valor_total] de la tabla ventas
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT fecha, bodega_codigo, count(*), coalesce(sum(cantidad), 0), coalesce(sum(valor_total), 0)
+            FROM ventas
+            WHERE fecha BETWEEN %s AND %s
+            GROUP BY fecha, bodega_codigo
+        """, (fecha_inicio, fecha_fin))
+        agregados = {(fecha.isoformat(), bodega): [n, cantidad, valor] for fecha, bodega, n, cantidad, valor in cur}
+    _confirmar(conn)
+    return agregados
+
+
+def descuadres(api: dict, bd: dict, tolerancia: Decimal = VENTAS_CUADRE_TOLERANCIA) -> dict:
+    """
+    Bodegas cuyos agregados no coinciden entre la API y la BD
+    
+    Returns:
+        bodega -> {'filas' | 'cantidad' | 'valor_total': [api, bd]}
+    """
+    cero = [0, Decimal(0), Decimal(0)]
+    diferencias = {}
+    for clave in sorted(api.keys() | bd.keys(), key=str):
+        a, b = api.get(clave, cero), bd.get(clave, cero)
+        if a[0] != b[0] or abs(a[1] - b[1]) > tolerancia or abs(a[2] - b[2]) > tolerancia:
+            diferencias[clave[1]] = {'filas': [a[0], b[0]], 'cantidad': [str(a[1]), str(b[1])],
+                                     'valor_total': [str(a[2]), str(b[2])]}
+    return diferencias
+
+
+def recargar_ventas_bodegas(conn, fecha: str, bodegas: list, ventas: list) -> tuple:
+    """
+    Reemplaza las ventas de un día en `bodegas` (None = ventas sin bodega) por
+    las de la API
+    
+    El borrado, la carga y la cuarentena se confirman juntos; los productos van
+    antes, en su propia transacción. Con VALIDACION_FILAS las filas de la API
+    que no validan van a cuarentena y su versión en la BD no se borra.
+    
+    Returns:
+        (ventas borradas, ventas insertadas)
+    """
+    seleccion = set(bodegas)
+    ventas = [v for v in ventas if v.get('BODEGA') in seleccion]
+    productos_unicos = {v.get('REFER'): v for v in ventas if v.get('REFER')}.values()
+    guardar_productos(conn, list(productos_unicos))
+    
+    rechazados = []
+    if VALIDACION_FILAS and ventas:
+        with medir('transform'):
+            ventas, rechazados = VALIDADORES['ventas'].validar(ventas, almacenes_validos(conn))
+    conservar = [
+        tuple(None if r.get(c) is None else str(r.get(c)) for c in ('PREFIJO', 'NUMDOC', 'REFER'))
+        for r, _ in rechazados
+    ]
+    
+    # bodega_codigo = ANY() nunca coincide con NULL: las ventas sin bodega van aparte
+    query = """
+        DELETE FROM ventas
+        WHERE fecha = %s
+          AND (bodega_codigo = ANY(%s) OR (%s AND bodega_codigo IS NULL))
+    """
+    parametros = [fecha, [b for b in seleccion if b is not None], None in seleccion]
+    if conservar:
+        query += """
+          AND NOT EXISTS (
+              SELECT 1 FROM unnest(%s::text[], %s::text[], %s::text[]) AS c(prefijo, numero_documento, referencia)
+              WHERE (c.prefijo, c.numero_documento, c.referencia)
+                  IS NOT DISTINCT FROM (ventas.prefijo, ventas.numero_documento, ventas.referencia)
+          )
+        """
+        parametros.extend(map(list, zip(*conservar)))
+    
+    try:
+        with medir('db_write'), conn.cursor() as cur:
+            cur.execute(query, parametros)
+            borradas = cur.rowcount
+        # Sin prefiltro: las ventas recién borradas están en el índice
+        insertadas = _escribir_ventas(conn, ventas, commit=False)
+        if rechazados:
+            poner_en_cuarentena(conn, 'ventas', rechazados, commit=False)
+        _confirmar(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    return borradas, insertadas
+
+
+# ============================================
+# FUNCIONES DE EXTRACCIÓN
+# ============================================
+
+def _extraer_registros(resultado, claves: tuple) -> list:
+    """
+    Obtiene la lista de registros de una respuesta SOAP ya parseada
+    """
+    # La respuesta puede venir en diferentes formatos
+    if isinstance(resultado, list):
+        return resultado
+    elif isinstance(resultado, dict):
+        # Buscar el array de registros en la respuesta
+        for clave in claves:
+            if clave in resultado:
+                return resultado[clave]
+    
+    logger.warning(f"Formato de respuesta no reconocido: {type(resultado)}")
+    return []
+
+
+def extraer_ventas(fecha_inicio: str, fecha_fin: str, hora_inicio: str = '00:00:00') -> list:
+    """
+    Extrae ventas de la API SOAP
+    """
+    resultado = call_soap_ventas(fecha_inicio, fecha_fin, empresa_actual().token, hora_inicio)
+    return _extraer_registros(resultado, ('ventas', 'data', 'resultado'))
+
+
+def extraer_ventas_lotes(fecha_inicio: str, fecha_fin: str, tamano_lote: int = VENTAS_LOTE_STREAMING,
+                         hora_inicio: str = '00:00:00'):
+    """
+    Extrae ventas de la API SOAP en lotes (modo streaming)
+    """
+    yield from call_soap_ventas_stream(fecha_inicio, fecha_fin, empresa_actual().token, tamano_lote, hora_inicio)
+
+
+def _pagina_inventario(fecha: str, bodega: str, pagina: int, filas: int) -> list:
+    """
+    Descarga una página de inventario y devuelve sus items
+    """
+    with pagina_ingesta(f"{bodega}:{pagina}" if bodega else pagina):
+        resultado = call_soap_inventario(fecha, bodega, empresa_actual().token, pagina, filas)
+        items = _extraer_registros(resultado, ('inventario', 'data', 'resultado'))
+        contar(filas=len(items))
+    return items
+
+
+def iter_paginas_inventario(fecha: str, bodega: str = "", concurrencia: int = None,
+                            filas: int = INVENTARIO_FILAS_POR_PAGINA, pagina_inicio: int = 1):
+    """
+    Recorre las páginas de inventario en orden
+    
+    Con concurrencia > 1 mantiene hasta `concurrencia` páginas en vuelo en un pool
+    de hilos; la primera página corta o vacía marca el total de páginas y las
+    solicitudes posteriores se descartan.
+    
+    Args:
+        pagina_inicio: primera página a pedir (continuación de una corrida)
+    
+    Yields:
+        (pagina, items) en orden de página
+    """
+    concurrencia = max(1, concurrencia or INVENTARIO_CONCURRENCIA)
+    
+    if concurrencia == 1:
+        for pagina in range(pagina_inicio, INVENTARIO_MAX_PAGINAS + 1):
+            items = _pagina_inventario(fecha, bodega, pagina, filas)
+            if not items:
+                return
+            yield pagina, items
+            # Si vienen menos items que el tamaño de página, es la última
+            if len(items) < filas:
+                return
+        logger.warning(f"Se alcanzó el límite de {INVENTARIO_MAX_PAGINAS} páginas")
+        return
+    
+    pool = ThreadPoolExecutor(max_workers=concurrencia)
+    pendientes = {}             # pagina -> future
+    siguiente = pagina_inicio   # próxima página a solicitar
+    ultima = None               # última página, conocida al recibir una página corta
+    pagina = pagina_inicio      # próxima página a entregar
+    
+    try:
+        while ultima is None or pagina <= ultima:
+            while (len(pendientes) < concurrencia and siguiente <= INVENTARIO_MAX_PAGINAS
+                   and (ultima is None or siguiente <= ultima)):
+                pendientes[siguiente] = pool.submit(contextvars.copy_context().run, _pagina_inventario,
+                                                    fecha, bodega, siguiente, filas)
+                siguiente += 1
+            
+            if pagina not in pendientes:
+                logger.warning(f"Se alcanzó el límite de {INVENTARIO_MAX_PAGINAS} páginas")
+                return
+            
+            items = pendientes.pop(pagina).result()
+            if len(items) < filas:
+                ultima = pagina
+                for p in [p for p in pendientes if p > ultima]:
+                    pendientes.pop(p).cancel()
+            
+            if items:
+                yield pagina, items
+            pagina += 1
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def extraer_inventario(fecha: str, concurrencia: int = None) -> list:
+    """
+    Extrae inventario de todas las bodegas (con paginación)
+    """
+    todos_los_items = []
+    
+    for pagina, items in iter_paginas_inventario(fecha, "", concurrencia):
+        todos_los_items.extend(items)
+        logger.info(f"Página {pagina}: {len(items)} items extraídos")
+    
+    return todos_los_items
+
+
 # ============================================
-# FUNCIONES SOAP
+# PIPELINE DE INVENTARIO
 # ============================================
 
-def call_soap_ventas(fecha_inicio: str, fecha_fin: str, token: str) -> dict:
+_FIN_PIPELINE = object()
+
+
+def pipeline_inventario(conn, fecha: str, concurrencia: int = None, tamano_cola: int = INVENTARIO_PIPELINE_COLA,
+                        delta: SincronizadorDelta = None, pagina_inicio: int = 1) -> dict:
     """
-    Llama a la API SOAP de ventas
+    Descarga y guarda inventario página por página en paralelo
     
-    Args:
-        fecha_inicio: Fecha inicio formato 'YYYY-MM-DD'
-        fecha_fin: Fecha fin formato 'YYYY-MM-DD'
-        token: Token de autenticación
+    Un hilo productor descarga páginas hacia una cola acotada mientras el hilo
+    actual transforma y escribe la página anterior. El tiempo total tiende a
+    max(descarga, escritura) y en memoria solo hay `tamano_cola` + 1 páginas.
+    Con `delta` cada página se escribe vía SincronizadorDelta.procesar.
+    
+    Si el plazo de la invocación vence se detiene después de la última página
+    confirmada y devuelve 'siguiente_pagina' para continuar desde ahí.
     
     Returns:
-        dict con los datos de ventas
+        dict con paginas, items, inventario y productos procesados
     """
+    cola = queue.Queue(maxsize=tamano_cola)
+    detener = threading.Event()
     
-    # Convertir fechas al formato esperado por la API
-    fecha_ini_dt = f"{fecha_inicio}T00:00:00"
-    fecha_fin_dt = f"{fecha_fin}T23:59:59"
+    def entregar(elemento) -> bool:
+        while not detener.is_set():
+            try:
+                cola.put(elemento, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
     
-    soap_body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <GenerarInfoVentas xmlns="http://tempuri.org/">
-      <strPar_Empresa>{EMPRESA}</strPar_Empresa>
-      <datPar_FecIni>{fecha_ini_dt}</datPar_FecIni>
-      <datPar_FecFin>{fecha_fin_dt}</datPar_FecFin>
-      <objPar_Objeto>{token}</objPar_Objeto>
-    </GenerarInfoVentas>
-  </soap:Body>
-</soap:Envelope>"""
-
-    headers = {
-        'Content-Type': 'text/xml; charset=utf-8',
-        'SOAPAction': 'http://tempuri.org/GenerarInfoVentas',
-        'User-Agent': 'StockIQ/1.0'
-    }
+    def productor():
+        try:
+            for pagina, items in iter_paginas_inventario(fecha, "", concurrencia, pagina_inicio=pagina_inicio):
+                if not entregar((pagina, items)):
+                    return
+            entregar(_FIN_PIPELINE)
+        except Exception as e:
+            entregar(e)
     
-    logger.info(f"Llamando API Ventas: {fecha_inicio} a {fecha_fin}")
+    hilo = threading.Thread(target=contextvars.copy_context().run, args=(productor,),
+                            name='inventario-productor', daemon=True)
+    hilo.start()
     
-    session = get_http_session()
-    response = session.post(VENTAS_API_URL, data=soap_body.encode('utf-8'), headers=headers, timeout=300)
-    response.raise_for_status()
+    totales = {'paginas': 0, 'items': 0, 'inventario': 0, 'productos': 0}
+    try:
+        while True:
+            elemento = cola.get()
+            if elemento is _FIN_PIPELINE:
+                break
+            if isinstance(elemento, Exception):
+                raise elemento
+            
+            pagina, items = elemento
+            
+            with pagina_ingesta(pagina):
+                # Productos de la página primero (FK de inventario)
+                productos_unicos = {i.get('REFERENCIA'): i for i in items if i.get('REFERENCIA')}.values()
+                totales['productos'] += guardar_productos(conn, list(productos_unicos))
+                if delta:
+                    totales['inventario'] += delta.procesar(conn, items)
+                else:
+                    totales['inventario'] += upsert_inventario(conn, items, fecha)
+            totales['paginas'] += 1
+            totales['items'] += len(items)
+            
+            logger.info(f"Página {pagina}: {len(items)} items guardados")
+            guardar_checkpoint('inventario', {'fecha': fecha, 'pagina_inicio': pagina + 1}, totales, conn=conn)
+            
+            # Una página corta es la última: no hace falta continuación
+            if len(items) == INVENTARIO_FILAS_POR_PAGINA and plazo_vencido():
+                logger.warning(f"Plazo por vencer: inventario se detiene después de la página {pagina}")
+                totales['siguiente_pagina'] = pagina + 1
+                break
+    finally:
+        # Si la escritura falla, el productor se detiene en su siguiente entrega
+        detener.set()
     
-    # Parsear respuesta XML y extraer JSON
-    return parse_soap_response(response.text, 'GenerarInfoVentasResult')
+    return totales
 
 
-def call_soap_inventario(fecha: str, bodega: str, token: str, pagina: int = 1, filas: int = 1000) -> dict:
+# ============================================
+# INVENTARIO POR BODEGA (SHARDS)
+# ============================================
+
+# Hilos persistentes: cada uno conserva su conexión 'bodega' entre invocaciones
+_ejecutor_bodegas = ThreadPoolExecutor(max_workers=INVENTARIO_BODEGAS_CONCURRENCIA, thread_name_prefix='bodega')
+
+
+def listar_bodegas_activas(conn) -> list:
     """
-    Llama a la API SOAP de inventario
+    Códigos de los almacenes activos
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT codigo FROM almacenes WHERE activo ORDER BY codigo")
+        bodegas = [fila[0] for fila in cur.fetchall()]
+    _confirmar(conn)
+    return bodegas
+
+
+def cargar_bodega(fecha: str, bodega: str, delta: bool = False) -> dict:
+    """
+    Descarga y guarda el inventario de una bodega en una sola transacción
     
-    Args:
-        fecha: Fecha formato 'YYYY-MM-DD'
-        bodega: Código de bodega (vacío para todas)
-        token: Token de autenticación
-        pagina: Número de página
-        filas: Registros por página
+    Los productos se escriben antes (y se confirman aparte) a través del
+    RegistroProductos activo, para que bodegas en paralelo no se bloqueen en
+    las mismas filas de productos. Si algo falla, se revierte solo esta bodega.
     
     Returns:
-        dict con los datos de inventario
+        dict con items descargados, filas escritas, productos y segundos
     """
+    inicio = time.perf_counter()
+    items = []
+    for _, pagina in iter_paginas_inventario(fecha, bodega, concurrencia=1):
+        items.extend(pagina)
     
-    fecha_dt = f"{fecha}T00:00:00"
-    
-    soap_body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <GenerarInformacionInventarios xmlns="http://tempuri.org/">
-      <datPar_Fecha>{fecha_dt}</datPar_Fecha>
-      <strPar_Bodega>{bodega}</strPar_Bodega>
-      <bolPar_ConSaldo>true</bolPar_ConSaldo>
-      <bolPar_ConImg>false</bolPar_ConImg>
-      <strPar_Basedatos>{BASE_DATOS}</strPar_Basedatos>
-      <strPar_Token>{token}</strPar_Token>
-      <strError></strError>
-      <intPar_Filas>{filas}</intPar_Filas>
-      <intPar_Pagina>{pagina}</intPar_Pagina>
-      <intPar_LisPre>1</intPar_LisPre>
-      <bolPar_ConSer>false</bolPar_ConSer>
-    </GenerarInformacionInventarios>
-  </soap:Body>
-</soap:Envelope>"""
-
-    headers = {
-        'Content-Type': 'text/xml; charset=utf-8',
-        'SOAPAction': 'http://tempuri.org/GenerarInformacionInventarios',
-        'User-Agent': 'StockIQ/1.0'
-    }
-    
-    logger.info(f"Llamando API Inventario: {fecha}, Bodega: {bodega or 'TODAS'}, Página: {pagina}")
-    
-    session = get_http_session()
-    response = session.post(INVENTARIO_API_URL, data=soap_body.encode('utf-8'), headers=headers, timeout=300)
-    response.raise_for_status()
+    resultado = {'items': len(items), 'inventario': 0, 'productos': 0}
+    if items:
+        conn = obtener_conexion('bodega')
+        try:
+            productos_unicos = {i.get('REFERENCIA'): i for i in items if i.get('REFERENCIA')}.values()
+            resultado['productos'] = guardar_productos(conn, list(productos_unicos))
+            
+            if delta:
+                sincronizador = SincronizadorDelta(conn, fecha, bodega)
+                resultado['inventario'] = sincronizador.procesar(conn, items, commit=False)
+                sincronizador.finalizar(conn, _feed_inventario_completo(len(items)), commit=False)
+                resultado['delta'] = sincronizador.resumen()
+            else:
+                resultado['inventario'] = upsert_inventario(conn, items, fecha, commit=False)
+            _confirmar(conn)
+        finally:
+            liberar_conexion(conn)
     
-    return parse_soap_response(response.text, 'GenerarInformacionInventariosResult')
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
 
 
-def parse_soap_response(xml_text: str, result_tag: str) -> dict:
+def inventario_por_bodegas(fecha: str, bodegas: list, delta: bool = False) -> dict:
     """
-    Parsea la respuesta SOAP y extrae el JSON del resultado
+    Carga cada bodega en paralelo (hasta INVENTARIO_BODEGAS_CONCURRENCIA a la
+    vez); una bodega lenta o con error no frena ni revierte a las demás
+    
+    Returns:
+        dict bodega -> resultado de cargar_bodega, o {'error': ...}
     """
-    try:
-        # Caso especial: la API de ventas devuelve JSON seguido de XML
-        # Buscar si hay un array JSON al inicio o en medio del texto
-        if '[{' in xml_text:
-            # Encontrar el inicio del JSON array
-            start_idx = xml_text.find('[{')
-            # Encontrar el final del JSON array (último }])
-            end_idx = xml_text.rfind('}]') + 2
-            
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = xml_text[start_idx:end_idx]
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    pass
-        
-        # Intento estándar: parsear como XML SOAP
-        # Remover namespaces para facilitar el parseo
-        xml_clean = xml_text.replace('xmlns=', 'xmlns_original=')
-        root = ET.fromstring(xml_clean)
-        
-        # Buscar el tag de resultado en cualquier nivel
-        for elem in root.iter():
-            if result_tag in elem.tag:
-                # El contenido puede ser JSON string
-                if elem.text:
-                    try:
-                        return json.loads(elem.text)
-                    except json.JSONDecodeError:
-                        return {'raw': elem.text}
-        
-        logger.warning(f"No se encontró el tag {result_tag} en la respuesta")
-        return {'error': 'Tag no encontrado', 'xml': xml_text[:500]}
-        
-    except ET.ParseError as e:
-        # Si falla el parseo XML, intentar extraer JSON directamente
-        if '[{' in xml_text:
-            start_idx = xml_text.find('[{')
-            end_idx = xml_text.rfind('}]') + 2
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = xml_text[start_idx:end_idx]
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    pass
-        
-        logger.error(f"Error parseando XML: {e}")
-        return {'error': str(e), 'xml': xml_text[:500]}
+    registro = RegistroProductos()
+    
+    def cargar(bodega):
+        # Con el plazo por vencer las bodegas que no empezaron quedan para la continuación
+        if plazo_vencido():
+            return {'pendiente': True}
+        _registro_productos.set(registro)
+        return cargar_bodega(fecha, bodega, delta)
+    
+    futuros = {
+        bodega: _ejecutor_bodegas.submit(contextvars.copy_context().run, cargar, bodega)
+        for bodega in bodegas
+    }
+    resultados = {}
+    for bodega, futuro in futuros.items():
+        try:
+            resultados[bodega] = futuro.result()
+            logger.info(f"Bodega {bodega}: {resultados[bodega]}")
+        except Exception as e:
+            logger.error(f"Bodega {bodega}: error, se revierte solo esta bodega: {e}", exc_info=True)
+            resultados[bodega] = {'error': str(e)}
+        # Solo las bodegas confirmadas salen del checkpoint: las que fallaron o
+        # no empezaron siguen pendientes
+        completadas = {b for b, r in resultados.items() if 'error' not in r and not r.get('pendiente')}
+        guardar_checkpoint('inventario', {'fecha': fecha, 'bodegas': [b for b in bodegas if b not in completadas]},
+                           {'bodegas': len(completadas), 'bodegas_con_error': sum('error' in r for r in resultados.values())})
+    return resultados
 
 
 # ============================================
-# FUNCIONES DE BASE DE DATOS
+# SPOOL DE PÁGINAS EN DISCO
 # ============================================
 
-def get_db_connection():
+class SpoolIngesta:
     """
-    Obtiene conexión a PostgreSQL usando credenciales de Secrets Manager
-    """
-    # En desarrollo, usar variables de entorno
-    if os.environ.get('LOCAL_DEV'):
-        return psycopg2.connect(
-            host=os.environ['DB_HOST'],
-            port=os.environ.get('DB_PORT', 5432),
-            database=os.environ['DB_NAME'],
-            user=os.environ['DB_USER'],
-            password=os.environ['DB_PASSWORD']
-        )
+    Cola en disco (SQLite) de páginas descargadas pendientes de cargar
     
-    # En producción, usar Secrets Manager
-    secrets_client = boto3.client('secretsmanager')
-    secret_arn = os.environ['DB_SECRET_ARN']
-    
-    response = secrets_client.get_secret_value(SecretId=secret_arn)
-    secret = json.loads(response['SecretString'])
-    
-    return psycopg2.connect(
-        host=secret['host'],
-        port=secret['port'],
-        database=secret['dbname'],
-        user=secret['username'],
-        password=secret['password']
-    )
-
-
-def upsert_productos(conn, productos: list):
+    La descarga encola cada página apenas llega y un drenador las carga en
+    lotes grandes; si la BD está lenta o caída, lo descargado queda en disco y
+    la siguiente corrida lo carga sin volver a pedirlo a la API.
+    
+    Limitación: con el SPOOL_DIR por defecto (/tmp) las páginas solo
+    sobreviven mientras viva el contenedor del Lambda. Una corrida que cae en
+    otro contenedor (o tras un arranque en frío) no ve lo pendiente y lo vuelve
+    a pedir a la API. Para que sobreviva entre contenedores, SPOOL_DIR debe
+    apuntar a un sistema de archivos compartido (EFS montado en el Lambda).
+    
+    Cada página tiene una empresa y una clave (operación + parámetros): volver
+    a descargarla reemplaza la versión pendiente, y cada empresa toma y cuenta
+    solo sus propias páginas. Una página se borra del spool solo después
+    del commit de su carga, así que puede cargarse más de una vez (al menos una
+    vez); los escritores son idempotentes (ON CONFLICT).
     """
-    Inserta o actualiza productos en la base de datos
+    
+    def __init__(self, directorio: str):
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta = os.path.join(directorio, 'spool.db')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.ruta, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        columnas = [fila[1] for fila in self._db.execute("PRAGMA table_info(paginas)")]
+        if columnas and 'empresa' not in columnas:
+            self._migrar_sin_empresa()
+        self._db.execute(self._TABLA.format(nombre='paginas'))
+    
+    _TABLA = """
+        CREATE TABLE IF NOT EXISTS {nombre} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            empresa TEXT NOT NULL,
+            fuente TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            filas INTEGER NOT NULL,
+            contenido BLOB NOT NULL,
+            encolada REAL NOT NULL,
+            UNIQUE (empresa, clave)
+        )
     """
-    if not productos:
-        return 0
     
-    query = """
-    INSERT INTO productos (referencia, codigo, nombre, unidad_medida, clase, grupo, linea, marca_codigo)
-    VALUES %s
-    ON CONFLICT (referencia) DO UPDATE SET
-        codigo = EXCLUDED.codigo,
-        nombre = EXCLUDED.nombre,
-        unidad_medida = EXCLUDED.unidad_medida,
-        clase = EXCLUDED.clase,
-        grupo = EXCLUDED.grupo,
-        linea = EXCLUDED.linea,
-        updated_at = CURRENT_TIMESTAMP
-    """
-    
-    # Preparar datos
-    values = []
-    for p in productos:
-        values.append((
-            p.get('REFERENCIA') or p.get('REFER'),
-            p.get('CODIGO'),
-            p.get('NOMBRE') or p.get('NOMREF'),
-            p.get('UNIDADMED') or p.get('UNDMED'),
-            p.get('CLASE'),
-            p.get('GRUPO'),
-            p.get('LINEA'),
-            p.get('MARCA')  # Esto necesitará mapeo al código de marca
-        ))
+    def _migrar_sin_empresa(self):
+        """Spool anterior a la clave por empresa: sus páginas son de la empresa por defecto"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(self._TABLA.format(nombre='paginas_empresa'))
+            self._db.execute("""
+                INSERT INTO paginas_empresa (id, empresa, fuente, clave, fecha, filas, contenido, encolada)
+                SELECT id, ?, fuente, clave, fecha, filas, contenido, encolada FROM paginas
+            """, (EMPRESA,))
+            self._db.execute("DROP TABLE paginas")
+            self._db.execute("ALTER TABLE paginas_empresa RENAME TO paginas")
+            self._db.execute("COMMIT")
+        except sqlite3.Error:
+            self._db.execute("ROLLBACK")
+            raise
     
-    with conn.cursor() as cur:
-        execute_values(cur, query, values)
+    def encolar(self, empresa: str, fuente: str, clave: str, fecha: str, registros: list):
+        contenido = gzip.compress(json.dumps(registros, default=str).encode('utf-8'), compresslevel=1)
+        with self._lock:
+            # Re-encolar una clave la mueve al final con el contenido nuevo
+            self._db.execute("""
+                INSERT OR REPLACE INTO paginas (empresa, fuente, clave, fecha, filas, contenido, encolada)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (empresa, fuente, clave, fecha, len(registros), contenido, time.time()))
     
-    conn.commit()
-    return len(values)
+    def tomar(self, empresa: str, fuente: str, max_filas: int = SPOOL_LOTE_FILAS) -> list:
+        """
+        Páginas pendientes más antiguas de la empresa hasta juntar `max_filas`
+        filas (al menos una página)
+        
+        Returns:
+            list de (id, fecha, registros)
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT id, fecha, filas, contenido FROM paginas WHERE empresa = ? AND fuente = ? ORDER BY id",
+                (empresa, fuente))
+            paginas = []
+            filas = 0
+            for id_pagina, fecha, n, contenido in cursor:
+                if paginas and filas + n > max_filas:
+                    break
+                paginas.append((id_pagina, fecha, contenido))
+                filas += n
+            cursor.close()
+        return [(i, fecha, json.loads(gzip.decompress(contenido))) for i, fecha, contenido in paginas]
+    
+    def confirmar(self, ids: list):
+        """Borra las páginas ya cargadas (después del commit en la BD)"""
+        with self._lock:
+            self._db.executemany("DELETE FROM paginas WHERE id = ?", [(i,) for i in ids])
+    
+    def pendientes(self, empresa: str, fuente: str = None) -> dict:
+        with self._lock:
+            filas = self._db.execute("""
+                SELECT fuente, COUNT(*), COALESCE(SUM(filas), 0) FROM paginas
+                WHERE empresa = ? AND (? IS NULL OR fuente = ?) GROUP BY fuente
+            """, (empresa, fuente, fuente)).fetchall()
+        return {f: {'paginas': n, 'filas': total} for f, n, total in filas}
 
 
-def insert_ventas(conn, ventas: list):
-    """
-    Inserta ventas en la base de datos (evita duplicados)
+_spool = None
+_lock_spool = threading.Lock()
+
+
+def abrir_spool() -> SpoolIngesta:
+    """Spool compartido (se abre una vez por contenedor)"""
+    global _spool
+    with _lock_spool:
+        if _spool is None:
+            _spool = SpoolIngesta(SPOOL_DIR)
+        return _spool
+
+
+def cargar_desde_spool(conn, spool: SpoolIngesta, fuente: str, max_filas: int = SPOOL_LOTE_FILAS) -> dict:
     """
-    if not ventas:
-        return 0
+    Carga todas las páginas pendientes de `fuente` de la empresa actual, en
+    lotes de hasta `max_filas` filas (varias páginas por escritura)
     
-    query = """
-    INSERT INTO ventas (
-        tipo_movimiento, prefijo, numero_documento, fecha, hora,
-        cedula_cliente, nombre_cliente, codigo_seccion, nombre_seccion,
-        bodega_codigo, referencia, cantidad, valor_unitario, valor_total,
-        porcentaje_descuento, valor_descuento, valor_costo, valor_utilidad,
-        porcentaje_utilidad, porcentaje_iva, vendedor_codigo, vendedor_nombre
-    ) VALUES %s
-    ON CONFLICT (prefijo, numero_documento, referencia) DO NOTHING
+    Returns:
+        dict con lotes, paginas, filas, escritas y productos
     """
+    totales = {'lotes': 0, 'paginas': 0, 'filas': 0, 'escritas': 0, 'productos': 0}
+    empresa = empresa_actual().empresa
     
-    values = []
-    for v in ventas:
-        # Parsear hora
-        hora = None
-        if v.get('HORA'):
-            try:
-                hora = v['HORA']
-            except:
-                pass
+    while True:
+        paginas = spool.tomar(empresa, fuente, max_filas)
+        if not paginas:
+            return totales
         
-        values.append((
-            v.get('TIPMOV'),
-            v.get('PREFIJO'),
-            v.get('NUMDOC'),
-            v.get('FECHA'),
-            hora,
-            v.get('CEDULA'),
-            v.get('NOMCED'),
-            v.get('CODSEC'),
-            v.get('NOMSEC'),
-            v.get('BODEGA'),
-            v.get('REFER'),
-            Decimal(str(v.get('CANTID', 0))),
-            Decimal(str(v.get('VALUND', 0))),
-            Decimal(str(v.get('VALTOT', 0))),
-            Decimal(str(v.get('PORDES', 0))),
-            Decimal(str(v.get('VALDES', 0))),
-            Decimal(str(v.get('VCOSTO', 0))),
-            Decimal(str(v.get('VALUTI', 0))),
-            Decimal(str(v.get('PORUTI', 0))),
-            Decimal(str(v.get('PORIVA', 0))),
-            v.get('VENDED'),
-            v.get('NOMVEN')
-        ))
-    
-    with conn.cursor() as cur:
-        execute_values(cur, query, values)
-    
-    conn.commit()
-    return len(values)
+        if fuente == 'ventas':
+            grupos = {None: ([i for i, _, _ in paginas], [r for _, _, registros in paginas for r in registros])}
+        else:
+            # Inventario: una escritura por fecha de snapshot
+            grupos = {}
+            for id_pagina, fecha, registros in paginas:
+                ids, filas = grupos.setdefault(fecha, ([], []))
+                ids.append(id_pagina)
+                filas.extend(registros)
+        
+        for fecha, (ids, registros) in grupos.items():
+            if fuente == 'ventas':
+                productos_unicos = {v.get('REFER'): v for v in registros if v.get('REFER')}.values()
+                totales['productos'] += guardar_productos(conn, list(productos_unicos))
+                totales['escritas'] += insert_ventas(conn, registros)
+            else:
+                # Una página re-descargada puede repetir claves: gana la última
+                registros = list({(i.get('BODEGA'), i.get('REFERENCIA')): i for i in registros}.values())
+                productos_unicos = {i.get('REFERENCIA'): i for i in registros if i.get('REFERENCIA')}.values()
+                totales['productos'] += guardar_productos(conn, list(productos_unicos))
+                totales['escritas'] += upsert_inventario(conn, registros, fecha)
+            spool.confirmar(ids)
+            totales['paginas'] += len(ids)
+            totales['filas'] += len(registros)
+        
+        totales['lotes'] += 1
+        logger.info(f"Spool {fuente}: lote {totales['lotes']} cargado ({len(paginas)} páginas)")
 
 
-def upsert_inventario(conn, inventario: list, fecha_snapshot: str):
+# Hilos persistentes de los drenadores (uno por empresa y fuente en paralelo):
+# cada uno conserva su conexión 'spool' entre invocaciones
+_ejecutor_spool = ThreadPoolExecutor(max_workers=2 * max(EMPRESAS_CONCURRENCIA, 1), thread_name_prefix='spool')
+
+
+def ingestar_con_spool(fuente: str, paginas, spool: SpoolIngesta) -> dict:
     """
-    Inserta o actualiza snapshot de inventario
+    Encola las páginas a medida que se descargan mientras el drenador las carga
+    en paralelo; la latencia SOAP y el throughput de la BD quedan desacoplados
+    
+    Args:
+        paginas: iterable de (clave, fecha, registros)
+    
+    Returns:
+        dict con recibidas, la carga del drenador, su error (si hubo) y lo que
+        quedó pendiente en el spool
     """
-    if not inventario:
-        return 0
+    terminar = threading.Event()
+    empresa = empresa_actual().empresa
     
-    query_actual = """
-    INSERT INTO inventario_actual (bodega_codigo, referencia, cantidad, valor_costo, valor_venta, observacion)
-    VALUES %s
-    ON CONFLICT (bodega_codigo, referencia) DO UPDATE SET
-        cantidad = EXCLUDED.cantidad,
-        valor_costo = EXCLUDED.valor_costo,
-        valor_venta = EXCLUDED.valor_venta,
-        observacion = EXCLUDED.observacion,
-        ultima_actualizacion = CURRENT_TIMESTAMP
-    """
-    
-    query_snapshot = """
-    INSERT INTO inventario_snapshot (fecha_snapshot, bodega_codigo, referencia, cantidad, valor_costo, valor_venta, observacion)
-    VALUES %s
-    ON CONFLICT (fecha_snapshot, bodega_codigo, referencia) DO UPDATE SET
-        cantidad = EXCLUDED.cantidad,
-        valor_costo = EXCLUDED.valor_costo,
-        valor_venta = EXCLUDED.valor_venta,
-        observacion = EXCLUDED.observacion
-    """
-    
-    values_actual = []
-    values_snapshot = []
-    
-    for i in inventario:
-        bodega = i.get('BODEGA')
-        referencia = i.get('REFERENCIA')
-        cantidad = Decimal(str(i.get('CANTIDAD', 0)))
-        valor_costo = Decimal(str(i.get('VCOSTO', 0)))
-        valor_venta = Decimal(str(i.get('VVENTA', 0)))
-        observacion = (i.get('OBSERV1') or '').strip() or None
-        
-        values_actual.append((bodega, referencia, cantidad, valor_costo, valor_venta, observacion))
-        values_snapshot.append((fecha_snapshot, bodega, referencia, cantidad, valor_costo, valor_venta, observacion))
+    def drenar() -> dict:
+        totales = {'lotes': 0, 'paginas': 0, 'filas': 0, 'escritas': 0, 'productos': 0}
+        conn = obtener_conexion('spool')
+        try:
+            while True:
+                # Tras el fin de la descarga se hace una última pasada completa
+                ultima = terminar.is_set()
+                parcial = cargar_desde_spool(conn, spool, fuente)
+                for clave, valor in parcial.items():
+                    totales[clave] += valor
+                if ultima:
+                    return totales
+                if not parcial['paginas']:
+                    terminar.wait(0.2)
+        finally:
+            liberar_conexion(conn)
     
-    with conn.cursor() as cur:
-        execute_values(cur, query_actual, values_actual)
-        execute_values(cur, query_snapshot, values_snapshot)
+    drenador = _ejecutor_spool.submit(contextvars.copy_context().run, drenar)
+    recibidas = 0
+    try:
+        for clave, fecha, registros in paginas:
+            spool.encolar(empresa, fuente, clave, fecha, registros)
+            recibidas += len(registros)
+    finally:
+        terminar.set()
+        try:
+            carga, error = drenador.result(), None
+        except Exception as e:
+            logger.error(f"Spool {fuente}: la carga falló, las páginas quedan pendientes: {e}", exc_info=True)
+            carga, error = None, e
     
-    conn.commit()
-    return len(values_actual)
+    return {
+        'recibidas': recibidas,
+        'carga': carga,
+        'error': error,
+        'pendientes': spool.pendientes(empresa, fuente).get(fuente, {'paginas': 0, 'filas': 0})
+    }
 
 
 # ============================================
-# FUNCIONES DE EXTRACCIÓN
+# CHECKPOINTS Y CONTINUACIÓN
 # ============================================
 
-def extraer_ventas(fecha_inicio: str, fecha_fin: str) -> list:
-    """
-    Extrae ventas de la API SOAP
+def guardar_checkpoint(fuente: str, reanudar: dict, progreso: dict, estado: str = 'en_curso', conn=None):
     """
-    resultado = call_soap_ventas(fecha_inicio, fecha_fin, API_TOKEN)
+    Registra en checkpoints_ingesta desde dónde se reanudaría la corrida
     
-    # La respuesta puede venir en diferentes formatos
-    if isinstance(resultado, list):
-        return resultado
-    elif isinstance(resultado, dict):
-        # Buscar el array de ventas en la respuesta
-        if 'ventas' in resultado:
-            return resultado['ventas']
-        elif 'data' in resultado:
-            return resultado['data']
-        elif 'resultado' in resultado:
-            return resultado['resultado']
-    
-    logger.warning(f"Formato de respuesta ventas no reconocido: {type(resultado)}")
-    return []
+    Se llama después de cada lote confirmado. Solo con plazo (en Lambda); un
+    fallo al registrar no detiene la corrida.
+    
+    Args:
+        reanudar: parámetros del evento para continuar desde el último lote confirmado
+        estado: 'en_curso' | 'continuado' | 'completado' | 'error'
+        conn: conexión del llamador (por defecto, la del hilo)
+    """
+    plazo = plazo_actual()
+    if not plazo.activo:
+        return
+    propia = conn is None
+    try:
+        if propia:
+            conn = obtener_conexion()
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO checkpoints_ingesta (empresa, fuente, corrida, estado, continuacion, reanudar, progreso)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (empresa, fuente, corrida) DO UPDATE SET
+                    estado = EXCLUDED.estado,
+                    continuacion = EXCLUDED.continuacion,
+                    reanudar = EXCLUDED.reanudar,
+                    progreso = EXCLUDED.progreso,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (empresa_actual().empresa, fuente, plazo.corrida, estado, plazo.continuacion,
+                  json.dumps(reanudar, default=str), json.dumps(progreso, default=str)))
+        _confirmar(conn)
+    except Exception as e:
+        # Incluye no poder conectarse (BD caída, secreto inaccesible): conn sigue en None
+        if conn is not None and not propia:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        logger.warning(f"No se pudo registrar el checkpoint de {fuente}: {e}")
+    finally:
+        if propia and conn is not None:
+            liberar_conexion(conn)
 
 
-def extraer_inventario(fecha: str) -> list:
+def evento_continuacion(event: dict, tipo: str, reanudar: dict) -> dict:
     """
-    Extrae inventario de todas las bodegas (con paginación)
+    Evento que retoma la corrida: el evento original con los parámetros de
+    reanudación, la misma corrida y, con varias empresas, solo la actual
     """
-    todos_los_items = []
-    pagina = 1
-    filas_por_pagina = 1000
+    plazo = plazo_actual()
+    evento = {k: v for k, v in event.items() if k != 'empresas'}
+    evento.update(reanudar)
+    evento.update(tipo=tipo, corrida=plazo.corrida, continuacion=plazo.continuacion + 1)
+    if _empresa_actual.get() is not None:
+        evento['empresas'] = [empresa_actual().configuracion()]
+    return evento
+
+
+def continuable(tipo: str):
+    """
+    Decorador de handlers con plazo
     
-    while True:
-        resultado = call_soap_inventario(fecha, "", API_TOKEN, pagina, filas_por_pagina)
-        
-        items = []
-        if isinstance(resultado, list):
-            items = resultado
-        elif isinstance(resultado, dict):
-            if 'inventario' in resultado:
-                items = resultado['inventario']
-            elif 'data' in resultado:
-                items = resultado['data']
-            elif 'resultado' in resultado:
-                items = resultado['resultado']
-        
-        if not items:
-            break
-        
-        todos_los_items.extend(items)
-        logger.info(f"Página {pagina}: {len(items)} items extraídos")
-        
-        # Si vienen menos items que el tamaño de página, es la última
-        if len(items) < filas_por_pagina:
-            break
-        
-        pagina += 1
-        
-        # Límite de seguridad
-        if pagina > 100:
-            logger.warning("Se alcanzó el límite de 100 páginas")
-            break
+    Si el plazo ya venció no empieza y devuelve el evento completo como
+    continuación. Si el handler se detuvo antes de terminar (body['reanudar']),
+    agrega a la respuesta el evento de continuación (body['evento_continuacion']). En ambos casos deja el
+    estado final en checkpoints_ingesta.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(event, context):
+            if plazo_vencido():
+                logger.warning(f"Plazo agotado antes de empezar {tipo}: queda para la continuación")
+                respuesta = {
+                    'statusCode': 200,
+                    'body': json.dumps({'message': 'Plazo agotado antes de empezar', 'reanudar': {}})
+                }
+            else:
+                respuesta = funcion(event, context)
+            
+            cuerpo = json.loads(respuesta['body'])
+            reanudar = cuerpo.pop('reanudar', None)
+            if reanudar is not None:
+                cuerpo['evento_continuacion'] = evento_continuacion(event, tipo, reanudar)
+                respuesta = dict(respuesta, body=json.dumps(cuerpo))
+            
+            estado = 'error' if respuesta['statusCode'] != 200 else 'continuado' if reanudar is not None else 'completado'
+            progreso = {k: v for k, v in cuerpo.items() if isinstance(v, (int, float, str))}
+            guardar_checkpoint(tipo, reanudar or {}, progreso, estado)
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def _continuaciones(resultados: dict) -> list:
+    """Eventos de continuación en las respuestas de los handlers (anidadas por empresa)"""
+    eventos = []
+    for resultado in resultados.values():
+        if not isinstance(resultado, dict):
+            continue
+        if 'body' in resultado:
+            evento = json.loads(resultado['body']).get('evento_continuacion')
+            if evento:
+                eventos.append(evento)
+        else:
+            eventos.extend(_continuaciones(resultado))
+    return eventos
+
+
+_cliente_lambda = None
+
+
+def invocar_continuaciones(context, eventos: list) -> list:
+    """
+    Re-invoca este mismo Lambda en forma asíncrona con cada evento de
+    continuación (requiere lambda:InvokeFunction sobre la función)
     
-    return todos_los_items
+    Returns:
+        list con tipo, número de continuación y si se invocó
+    """
+    global _cliente_lambda
+    
+    funcion = getattr(context, 'invoked_function_arn', None)
+    resumen = []
+    for evento in eventos:
+        estado = {'tipo': evento['tipo'], 'continuacion': evento['continuacion'], 'invocado': False}
+        if not (CONTINUACION_AUTOMATICA and funcion):
+            pass
+        elif evento['continuacion'] > CONTINUACION_MAX:
+            logger.error(f"Continuación de {evento['tipo']} descartada: se superó CONTINUACION_MAX ({CONTINUACION_MAX})")
+            estado['error'] = 'CONTINUACION_MAX'
+        else:
+            try:
+                if _cliente_lambda is None:
+                    _cliente_lambda = boto3.client('lambda')
+                _cliente_lambda.invoke(FunctionName=funcion, InvocationType='Event',
+                                       Payload=json.dumps(evento, default=str).encode('utf-8'))
+                estado['invocado'] = True
+                logger.info(f"Continuación {evento['continuacion']} de {evento['tipo']} invocada")
+            except Exception as e:
+                logger.error(f"No se pudo invocar la continuación de {evento['tipo']}: {e}", exc_info=True)
+                estado['error'] = str(e)
+        resumen.append(estado)
+    return resumen
 
 
 # ============================================
 # HANDLERS LAMBDA
 # ============================================
 
+@con_metricas('ventas')
+@continuable('ventas')
+@con_prefiltro
 def handler_ventas(event, context):
     """
     Handler para extraer ventas
@@ -474,10 +4015,38 @@ def handler_ventas(event, context):
     # Obtener rango de fechas (por defecto: ayer)
     fecha_fin = event.get('fecha_fin', (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))
     fecha_inicio = event.get('fecha_inicio', fecha_fin)
+    streaming = event.get('streaming', VENTAS_STREAMING)
+    
+    # Incremental solo cuando no se pide un rango explícito
+    if event.get('incremental', VENTAS_INCREMENTAL) and 'fecha_inicio' not in event and 'fecha_fin' not in event:
+        return handler_ventas_incremental(streaming, event.get('tamano_lote', VENTAS_LOTE_STREAMING),
+                                          event.get('ventana'), event.get('maximo'))
+    
+    if event.get('adaptativo', VENTAS_ADAPTATIVO):
+        return handler_ventas_adaptativo(fecha_inicio, fecha_fin)
+    
+    if event.get('tramos', VENTAS_TRAMOS):
+        return handler_ventas_tramos(fecha_inicio, fecha_fin, event.get('tramo_dias', VENTAS_TRAMO_DIAS),
+                                     event.get('concurrencia_tramos', VENTAS_TRAMOS_CONCURRENCIA))
+    
+    if event.get('spool', SPOOL):
+        return handler_ventas_spool(fecha_inicio, fecha_fin, streaming, event.get('tamano_lote', VENTAS_LOTE_STREAMING))
+    
+    # Con plazo (Lambda) un rango de varios días se parte en tramos, que se
+    # detienen y reanudan entre tramos; un solo día es una respuesta SOAP
+    # indivisible. Con streaming los tramos se leen de a uno (memoria acotada)
+    if streaming:
+        return handler_ventas_streaming(fecha_inicio, fecha_fin, event.get('tamano_lote', VENTAS_LOTE_STREAMING),
+                                        event.get('tramo_dias', VENTAS_TRAMO_DIAS))
+    
+    if plazo_actual().activo and fecha_inicio != fecha_fin:
+        return handler_ventas_tramos(fecha_inicio, fecha_fin, event.get('tramo_dias', VENTAS_TRAMO_DIAS),
+                                     event.get('concurrencia_tramos', VENTAS_TRAMOS_CONCURRENCIA))
     
     try:
         # Extraer ventas
         ventas = extraer_ventas(fecha_inicio, fecha_fin)
+        contar(filas=len(ventas))
         logger.info(f"Ventas extraídas: {len(ventas)}")
         
         if not ventas:
@@ -491,11 +4060,11 @@ def handler_ventas(event, context):
             }
         
         # Conectar a BD y guardar
-        conn = get_db_connection()
+        conn = obtener_conexion()
         try:
             # Extraer productos únicos y guardarlos primero
             productos_unicos = {v.get('REFER'): v for v in ventas if v.get('REFER')}.values()
-            n_productos = upsert_productos(conn, list(productos_unicos))
+            n_productos = guardar_productos(conn, list(productos_unicos))
             logger.info(f"Productos actualizados: {n_productos}")
             
             # Guardar ventas
@@ -503,7 +4072,7 @@ def handler_ventas(event, context):
             logger.info(f"Ventas insertadas: {n_ventas}")
             
         finally:
-            conn.close()
+            liberar_conexion(conn)
         
         return {
             'statusCode': 200,
@@ -525,6 +4094,500 @@ def handler_ventas(event, context):
         }
 
 
+def handler_ventas_streaming(fecha_inicio: str, fecha_fin: str, tamano_lote: int, dias: int = VENTAS_TRAMO_DIAS):
+    """
+    Extrae y guarda ventas lote por lote a medida que llega la respuesta SOAP
+    
+    Con plazo (Lambda) el rango se pide en tramos de `dias` días, uno a la vez,
+    con un checkpoint tras cada tramo; con el plazo por vencer no se piden más
+    tramos y se reanuda desde el siguiente.
+    """
+    n_procesadas = 0
+    n_ventas = 0
+    n_productos = 0
+    n_lotes = 0
+    reanudar = None
+    rangos = planificar_tramos(fecha_inicio, fecha_fin, dias) if plazo_actual().activo else [(fecha_inicio, fecha_fin)]
+    
+    try:
+        conn = obtener_conexion()
+        try:
+            for i, (inicio, fin) in enumerate(rangos):
+                if i and plazo_vencido():
+                    logger.warning(f"Plazo por vencer: ventas (streaming) se detiene antes de {inicio}")
+                    reanudar = {'fecha_inicio': inicio, 'fecha_fin': fecha_fin}
+                    break
+                
+                for lote in extraer_ventas_lotes(inicio, fin, tamano_lote):
+                    n_lotes += 1
+                    n_procesadas += len(lote)
+                    
+                    with pagina_ingesta(n_lotes, len(lote)):
+                        # Productos del lote primero (FK de ventas)
+                        productos_unicos = {v.get('REFER'): v for v in lote if v.get('REFER')}.values()
+                        n_productos += guardar_productos(conn, list(productos_unicos))
+                        n_ventas += insert_ventas(conn, lote)
+                    
+                    logger.info(f"Lote {n_lotes}: {len(lote)} ventas (acumulado {n_procesadas})")
+                
+                if fin < fecha_fin:
+                    guardar_checkpoint('ventas', {'fecha_inicio': _sumar_dias(fin, 1), 'fecha_fin': fecha_fin},
+                                       {'tramos': i + 1, 'ventas_insertadas': n_ventas}, conn=conn)
+        finally:
+            liberar_conexion(conn)
+        
+        logger.info(f"Ventas insertadas: {n_ventas} en {n_lotes} lotes")
+        
+        if not n_procesadas and reanudar is None:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'No hay ventas para el período',
+                    'fecha_inicio': fecha_inicio,
+                    'fecha_fin': fecha_fin
+                })
+            }
+        
+        cuerpo = {
+            'message': 'Extracción completada',
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'ventas_procesadas': n_procesadas,
+            'ventas_insertadas': n_ventas,
+            'productos_actualizados': n_productos,
+            'lotes': n_lotes
+        }
+        if reanudar:
+            cuerpo['reanudar'] = reanudar
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps(cuerpo)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en extracción de ventas (streaming): {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def handler_ventas_adaptativo(fecha_inicio: str, fecha_fin: str):
+    """
+    Extrae ventas con división adaptativa del rango y guarda cada sub-rango
+    apenas llega; al final persiste la granularidad aprendida por mes. Con el
+    plazo por vencer se detiene después del último sub-rango guardado.
+    """
+    n_procesadas = 0
+    n_ventas = 0
+    n_productos = 0
+    rangos = []
+    reanudar = None
+    
+    try:
+        conn = obtener_conexion()
+        try:
+            granularidad = leer_granularidad(conn, empresa_actual().empresa, fecha_inicio, fecha_fin)
+            aprendido = {}
+            
+            for inicio, fin, ventas in iter_ventas_adaptativo(fecha_inicio, fecha_fin, granularidad, aprendido=aprendido):
+                rangos.append(f"{inicio} a {fin}")
+                n_procesadas += len(ventas)
+                
+                with pagina_ingesta(f"{inicio}..{fin}", len(ventas)):
+                    productos_unicos = {v.get('REFER'): v for v in ventas if v.get('REFER')}.values()
+                    n_productos += guardar_productos(conn, list(productos_unicos))
+                    n_ventas += insert_ventas(conn, ventas)
+                
+                logger.info(f"Rango {inicio} a {fin}: {len(ventas)} ventas")
+                
+                if fin < fecha_fin:
+                    siguiente = {'fecha_inicio': _sumar_dias(fin, 1), 'fecha_fin': fecha_fin}
+                    guardar_checkpoint('ventas', siguiente, {'rangos': len(rangos), 'ventas_insertadas': n_ventas},
+                                       conn=conn)
+                    if plazo_vencido():
+                        logger.warning(f"Plazo por vencer: ventas se detiene después de {fin}")
+                        reanudar = siguiente
+                        break
+            
+            guardar_granularidad(conn, empresa_actual().empresa, aprendido)
+        finally:
+            liberar_conexion(conn)
+        
+        cuerpo = {
+            'message': 'Extracción completada' if n_procesadas else 'No hay ventas para el período',
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'ventas_procesadas': n_procesadas,
+            'ventas_insertadas': n_ventas,
+            'productos_actualizados': n_productos,
+            'rangos': rangos
+        }
+        if reanudar:
+            cuerpo['reanudar'] = reanudar
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps(cuerpo)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en extracción adaptativa de ventas: {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def handler_ventas_tramos(fecha_inicio: str, fecha_fin: str, dias: int, concurrencia: int):
+    """
+    Descarga el rango en tramos paralelos y guarda cada tramo apenas llega,
+    mientras los demás siguen descargando. Un tramo fallido no detiene al resto;
+    la respuesta es 500 con los tramos a reintentar (los guardados no se repiten:
+    la escritura es idempotente). Con el plazo por vencer no se piden más
+    tramos y se reanuda desde el primero sin guardar.
+    """
+    n_procesadas = 0
+    n_ventas = 0
+    n_productos = 0
+    tramos = []
+    errores = {}
+    restantes = []
+    plan = planificar_tramos(fecha_inicio, fecha_fin, dias)
+    guardados = set()
+    
+    def primer_pendiente():
+        return next((inicio for inicio, fin in plan if (inicio, fin) not in guardados), None)
+    
+    try:
+        conn = obtener_conexion()
+        try:
+            for inicio, fin, ventas in iter_ventas_tramos(fecha_inicio, fecha_fin, dias, concurrencia, errores,
+                                                          restantes):
+                tramos.append(f"{inicio} a {fin}")
+                n_procesadas += len(ventas)
+                
+                with pagina_ingesta(f"{inicio}..{fin}", len(ventas)):
+                    productos_unicos = {v.get('REFER'): v for v in ventas if v.get('REFER')}.values()
+                    n_productos += guardar_productos(conn, list(productos_unicos))
+                    n_ventas += insert_ventas(conn, ventas)
+                
+                logger.info(f"Tramo {inicio} a {fin}: {len(ventas)} ventas")
+                guardados.add((inicio, fin))
+                # Sin tramos pendientes no hay desde dónde reanudar: el estado final lo deja continuable
+                pendiente = primer_pendiente()
+                if pendiente is not None:
+                    guardar_checkpoint('ventas', {'fecha_inicio': pendiente, 'fecha_fin': fecha_fin},
+                                       {'tramos': len(guardados), 'ventas_insertadas': n_ventas}, conn=conn)
+        finally:
+            liberar_conexion(conn)
+        
+        cuerpo = {
+            'message': 'Extracción completada' if n_procesadas else 'No hay ventas para el período',
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'ventas_procesadas': n_procesadas,
+            'ventas_insertadas': n_ventas,
+            'productos_actualizados': n_productos,
+            'tramos': sorted(tramos)
+        }
+        if restantes:
+            # Desde el primer tramo sin guardar (incluye los fallidos anteriores)
+            cuerpo['reanudar'] = {'fecha_inicio': primer_pendiente(), 'fecha_fin': fecha_fin}
+        if errores:
+            cuerpo['error'] = f"{len(errores)} tramos con error"
+            cuerpo['tramos_con_error'] = {f"{inicio} a {fin}": error for (inicio, fin), error in sorted(errores.items())}
+        
+        return {
+            'statusCode': 500 if errores else 200,
+            'body': json.dumps(cuerpo)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en extracción de ventas por tramos: {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def _respuesta_spool(resultado: dict, base: dict, claves: tuple) -> dict:
+    """
+    Respuesta de un handler con spool: 500 si la carga falló (lo descargado
+    queda en el spool para la siguiente corrida)
+    """
+    carga = resultado['carga'] or {}
+    cuerpo = dict(base, **{
+        claves[0]: resultado['recibidas'],
+        claves[1]: carga.get('escritas', 0),
+        'productos_actualizados': carga.get('productos', 0),
+        'lotes_cargados': carga.get('lotes', 0),
+        'en_spool': resultado['pendientes']
+    })
+    if resultado['error'] is not None:
+        cuerpo['error'] = str(resultado['error'])
+        return {'statusCode': 500, 'body': json.dumps(cuerpo)}
+    cuerpo['message'] = 'Extracción completada' if resultado['recibidas'] else 'Sin datos nuevos; spool drenado'
+    return {'statusCode': 200, 'body': json.dumps(cuerpo)}
+
+
+def handler_ventas_spool(fecha_inicio: str, fecha_fin: str, streaming: bool, tamano_lote: int):
+    """
+    Extrae ventas hacia el spool en disco mientras el drenador las carga en lotes
+    
+    Con plazo (Lambda) el rango se pide día por día y, con el plazo por
+    vencer, no se piden más días: se reanuda desde el siguiente.
+    """
+    reanudar = {}
+    
+    def paginas():
+        rangos = planificar_tramos(fecha_inicio, fecha_fin, 1) if plazo_actual().activo else [(fecha_inicio, fecha_fin)]
+        for i, (inicio, fin) in enumerate(rangos):
+            if i and plazo_vencido():
+                logger.warning(f"Plazo por vencer: ventas (spool) se detiene antes de {inicio}")
+                reanudar.update(fecha_inicio=inicio, fecha_fin=fecha_fin)
+                return
+            base = f"ventas:{empresa_actual().empresa}:{inicio}:{fin}"
+            if streaming:
+                for n, lote in enumerate(extraer_ventas_lotes(inicio, fin, tamano_lote), 1):
+                    with pagina_ingesta(n, len(lote)):
+                        yield f"{base}:{n}", inicio, lote
+            else:
+                ventas = extraer_ventas(inicio, fin)
+                contar(filas=len(ventas))
+                yield base, inicio, ventas
+    
+    try:
+        resultado = ingestar_con_spool('ventas', paginas(), abrir_spool())
+        logger.info(f"Ventas (spool): {resultado}")
+        base = {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+        if reanudar:
+            base['reanudar'] = reanudar
+        return _respuesta_spool(resultado, base, ('ventas_procesadas', 'ventas_insertadas'))
+    except Exception as e:
+        logger.error(f"Error en extracción de ventas (spool): {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def handler_ventas_incremental(streaming: bool = False, tamano_lote: int = VENTAS_LOTE_STREAMING,
+                               ventana: list = None, maximo: list = None):
+    """
+    Extrae solo las ventas posteriores al watermark de la empresa
+    
+    Pide a la API la ventana [watermark, hoy 23:59:59], descarta lo ya ingerido
+    y avanza el watermark cuando terminó de leer la respuesta: nada garantiza
+    que GenerarInfoVentas entregue las filas en orden de hora, así que avanzarlo
+    al máximo de un lote intermedio descartaría las filas anteriores de los
+    lotes sin leer. Tras cada lote queda un checkpoint; una corrida detenida
+    por el plazo se reanuda con la misma ventana (ON CONFLICT descarta lo ya
+    escrito).
+    
+    Args:
+        ventana: (fecha, hora) de inicio de la corrida que se reanuda
+        maximo: clave de watermark más alta que esa corrida ya escribió
+    """
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    
+    try:
+        conn = obtener_conexion()
+        try:
+            if ventana:
+                watermark = tuple(ventana)
+                logger.info(f"Ventas incrementales: reanudando la ventana desde {watermark[0]} {watermark[1]}")
+            else:
+                watermark = leer_watermark(conn, empresa_actual().empresa)
+            # Sin watermark se arranca desde el inicio del día
+            fecha_inicio, hora_inicio = watermark[:2] if watermark else (hoy, '00:00:00')
+            logger.info(f"Ventas incrementales desde {fecha_inicio} {hora_inicio} (watermark: {watermark})")
+            
+            if streaming:
+                lotes = extraer_ventas_lotes(fecha_inicio, hoy, tamano_lote, hora_inicio)
+            else:
+                lotes = [extraer_ventas(fecha_inicio, hoy, hora_inicio)]
+            
+            n_recibidas = 0
+            n_nuevas = 0
+            n_ventas = 0
+            n_productos = 0
+            maximo = tuple(maximo) if maximo else watermark
+            reanudar = None
+            
+            for lote in lotes:
+                n_recibidas += len(lote)
+                contar(filas=len(lote))
+                nuevas = filtrar_posteriores_watermark(lote, watermark)
+                if not nuevas:
+                    continue
+                
+                productos_unicos = {v.get('REFER'): v for v in nuevas if v.get('REFER')}.values()
+                n_productos += guardar_productos(conn, list(productos_unicos))
+                n_ventas += insert_ventas(conn, nuevas)
+                n_nuevas += len(nuevas)
+                
+                maximo_lote = max(_clave_watermark(v) for v in nuevas)
+                maximo = max(maximo, maximo_lote) if maximo else maximo_lote
+                
+                if streaming:
+                    # Checkpoint del lote confirmado: el watermark no se mueve hasta leer todo
+                    reanudar = {'ventana': [fecha_inicio, hora_inicio], 'maximo': list(maximo)}
+                    guardar_checkpoint('ventas', reanudar, {'ventas_nuevas': n_nuevas}, conn=conn)
+                    if plazo_vencido():
+                        logger.warning(f"Plazo por vencer: ventas incrementales se detienen en {maximo} "
+                                       f"sin avanzar el watermark")
+                        break
+                    reanudar = None
+            
+            if reanudar is None and maximo and maximo != watermark:
+                guardar_watermark(conn, empresa_actual().empresa, maximo, n_nuevas)
+        finally:
+            liberar_conexion(conn)
+        
+        logger.info(f"Ventas incrementales: {n_recibidas} recibidas, {n_nuevas} nuevas, watermark {maximo}")
+        
+        cuerpo = {
+            'message': 'Extracción incremental completada',
+            'desde': f"{fecha_inicio} {hora_inicio}",
+            'ventas_recibidas': n_recibidas,
+            'ventas_nuevas': n_nuevas,
+            'ventas_insertadas': n_ventas,
+            'productos_actualizados': n_productos,
+            'watermark': list(maximo) if maximo else None
+        }
+        if reanudar is not None:
+            cuerpo['reanudar'] = reanudar
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps(cuerpo)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en extracción incremental de ventas: {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def handler_reconciliacion_ventas(event, context):
+    """
+    Reconciliación programada: vuelve a pedir los últimos días completos para
+    recoger documentos que llegaron tarde (con hora anterior al watermark)
+    """
+    dias = int(event.get('dias', VENTAS_RECONCILIACION_DIAS))
+    fecha_fin = datetime.now().strftime('%Y-%m-%d')
+    fecha_inicio = (datetime.now() - timedelta(days=dias - 1)).strftime('%Y-%m-%d')
+    
+    logger.info(f"Reconciliación de ventas: {fecha_inicio} a {fecha_fin}")
+    
+    # ON CONFLICT DO NOTHING descarta lo ya ingerido; solo entran los faltantes
+    return handler_ventas({
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'streaming': event.get('streaming', VENTAS_STREAMING)
+    }, context)
+
+
+@con_metricas('cuadre_ventas')
+@continuable('cuadre_ventas')
+def handler_cuadre_ventas(event, context):
+    """
+    Cuadre de ventas por agregados: descarga el rango por días (en paralelo),
+    compara por día y bodega filas, SUM cantidad y SUM valor_total contra la
+    tabla ventas y recarga solo los días y bodegas que no cuadran. Con
+    reparar=False solo reporta. Por defecto revisa los VENTAS_CUADRE_DIAS días
+    hasta ayer.
+    """
+    fecha_fin = event.get('fecha_fin', (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))
+    fecha_inicio = event.get('fecha_inicio', _sumar_dias(fecha_fin, 1 - VENTAS_CUADRE_DIAS))
+    reparar = event.get('reparar', True)
+    tolerancia = Decimal(str(event.get('tolerancia', VENTAS_CUADRE_TOLERANCIA)))
+    
+    logger.info(f"Cuadre de ventas: {fecha_inicio} a {fecha_fin} (reparar: {reparar})")
+    
+    revisados = set()
+    descuadrados = {}
+    recargados = {}
+    n_borradas = 0
+    n_insertadas = 0
+    errores = {}
+    restantes = []
+    plan = [inicio for inicio, _ in planificar_tramos(fecha_inicio, fecha_fin, 1)]
+    
+    def primer_pendiente():
+        return next((dia for dia in plan if dia not in revisados), None)
+    
+    try:
+        conn = obtener_conexion()
+        try:
+            bd = agregados_bd(conn, fecha_inicio, fecha_fin)
+            for dia, _, ventas in iter_ventas_tramos(fecha_inicio, fecha_fin, 1,
+                                                     event.get('concurrencia_tramos', VENTAS_TRAMOS_CONCURRENCIA),
+                                                     errores, restantes):
+                contar(filas=len(ventas))
+                api = {clave: v for clave, v in agregados_ventas(ventas).items() if clave[0] == dia}
+                diferencias = descuadres(api, {clave: v for clave, v in bd.items() if clave[0] == dia}, tolerancia)
+                
+                # La tabla ventas no distingue empresa: con varias, una bodega sin
+                # ventas en la API puede ser de otra empresa y no se borra
+                bodegas = [b for b, d in diferencias.items() if d['filas'][0] or _empresa_actual.get() is None]
+                if diferencias:
+                    descuadrados[dia] = diferencias
+                    logger.warning(f"Ventas {dia}: {len(diferencias)} bodegas no cuadran ({', '.join(map(str, diferencias))})")
+                if reparar and bodegas:
+                    with pagina_ingesta(dia, len(ventas)):
+                        borradas, insertadas = recargar_ventas_bodegas(conn, dia, bodegas, ventas)
+                    n_borradas += borradas
+                    n_insertadas += insertadas
+                    recargados[dia] = bodegas
+                    logger.info(f"Ventas {dia} recargadas en {len(bodegas)} bodegas: "
+                                f"{borradas} borradas, {insertadas} insertadas")
+                
+                revisados.add(dia)
+                pendiente = primer_pendiente()
+                if pendiente is not None:
+                    guardar_checkpoint('cuadre_ventas', {'fecha_inicio': pendiente, 'fecha_fin': fecha_fin},
+                                       {'dias_revisados': len(revisados), 'dias_descuadrados': len(descuadrados)},
+                                       conn=conn)
+        finally:
+            liberar_conexion(conn)
+        
+        cuerpo = {
+            'message': 'Cuadre completado',
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'dias_revisados': len(revisados),
+            'dias_descuadrados': len(descuadrados),
+            'recargados': dict(sorted(recargados.items())),
+            'ventas_borradas': n_borradas,
+            'ventas_insertadas': n_insertadas,
+            'descuadres': dict(sorted(descuadrados.items()))
+        }
+        if restantes:
+            cuerpo['reanudar'] = {'fecha_inicio': primer_pendiente(), 'fecha_fin': fecha_fin}
+        if errores:
+            cuerpo['error'] = f"{len(errores)} días sin revisar por error"
+            cuerpo['dias_con_error'] = {inicio: error for (inicio, _), error in sorted(errores.items())}
+        
+        return {
+            'statusCode': 500 if errores else 200,
+            'body': json.dumps(cuerpo)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en cuadre de ventas: {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+@con_metricas('inventario')
+@continuable('inventario')
 def handler_inventario(event, context):
     """
     Handler para extraer inventario
@@ -533,10 +4596,22 @@ def handler_inventario(event, context):
     
     # Fecha del snapshot (por defecto: hoy)
     fecha = event.get('fecha', datetime.now().strftime('%Y-%m-%d'))
+    pipeline = event.get('pipeline', INVENTARIO_PIPELINE)
+    delta = event.get('delta', INVENTARIO_DELTA)
+    
+    if event.get('por_bodega', INVENTARIO_POR_BODEGA):
+        return handler_inventario_bodegas(fecha, event.get('bodegas'), delta)
+    
+    if event.get('spool', SPOOL):
+        return handler_inventario_spool(fecha, event.get('concurrencia'), event.get('pagina_inicio', 1))
+    
+    # Con plazo (Lambda) va por el pipeline, que se detiene y reanuda entre páginas
+    if pipeline or plazo_actual().activo:
+        return handler_inventario_pipeline(fecha, event.get('concurrencia'), delta, event.get('pagina_inicio', 1))
     
     try:
         # Extraer inventario
-        inventario = extraer_inventario(fecha)
+        inventario = extraer_inventario(fecha, event.get('concurrencia'))
         logger.info(f"Items de inventario extraídos: {len(inventario)}")
         
         if not inventario:
@@ -549,29 +4624,40 @@ def handler_inventario(event, context):
             }
         
         # Conectar a BD y guardar
-        conn = get_db_connection()
+        conn = obtener_conexion()
         try:
             # Extraer productos únicos y guardarlos primero
             productos_unicos = {i.get('REFERENCIA'): i for i in inventario if i.get('REFERENCIA')}.values()
-            n_productos = upsert_productos(conn, list(productos_unicos))
+            n_productos = guardar_productos(conn, list(productos_unicos))
             logger.info(f"Productos actualizados: {n_productos}")
             
             # Guardar inventario
-            n_inventario = upsert_inventario(conn, inventario, fecha)
+            sincronizador = None
+            if delta:
+                sincronizador = SincronizadorDelta(conn, fecha)
+                n_inventario = sincronizador.procesar(conn, inventario)
+                sincronizador.finalizar(conn, _feed_inventario_completo(len(inventario)))
+                logger.info(f"Inventario delta: {sincronizador.resumen()}")
+            else:
+                n_inventario = upsert_inventario(conn, inventario, fecha)
             logger.info(f"Inventario actualizado: {n_inventario}")
             
         finally:
-            conn.close()
+            liberar_conexion(conn)
+        
+        resultado = {
+            'message': 'Extracción completada',
+            'fecha': fecha,
+            'items_procesados': len(inventario),
+            'items_actualizados': n_inventario,
+            'productos_actualizados': n_productos
+        }
+        if sincronizador:
+            resultado['delta'] = sincronizador.resumen()
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Extracción completada',
-                'fecha': fecha,
-                'items_procesados': len(inventario),
-                'items_actualizados': n_inventario,
-                'productos_actualizados': n_productos
-            })
+            'body': json.dumps(resultado)
         }
         
     except Exception as e:
@@ -582,19 +4668,260 @@ def handler_inventario(event, context):
         }
 
 
-def handler(event, context):
+def handler_inventario_spool(fecha: str, concurrencia: int = None, pagina_inicio: int = 1):
+    """
+    Extrae inventario hacia el spool en disco mientras el drenador lo carga en
+    lotes (sin sincronización delta: el drenador puede mezclar corridas). Con
+    el plazo por vencer deja de pedir páginas y se reanuda desde la siguiente.
+    
+    Args:
+        pagina_inicio: primera página (continuación de una corrida detenida por el plazo)
+    """
+    reanudar = {}
+    
+    def paginas():
+        for pagina, items in iter_paginas_inventario(fecha, "", concurrencia, pagina_inicio=pagina_inicio):
+            yield f"inventario:{empresa_actual().base_datos}:{fecha}::{pagina}", fecha, items
+            # Una página corta es la última: no hace falta continuación
+            if len(items) == INVENTARIO_FILAS_POR_PAGINA and plazo_vencido():
+                logger.warning(f"Plazo por vencer: inventario (spool) se detiene después de la página {pagina}")
+                reanudar.update(fecha=fecha, pagina_inicio=pagina + 1)
+                return
+    
+    try:
+        resultado = ingestar_con_spool('inventario', paginas(), abrir_spool())
+        logger.info(f"Inventario (spool): {resultado}")
+        base = {'fecha': fecha}
+        if reanudar:
+            base['reanudar'] = reanudar
+        return _respuesta_spool(resultado, base, ('items_procesados', 'items_actualizados'))
+    except Exception as e:
+        logger.error(f"Error en extracción de inventario (spool): {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def handler_inventario_pipeline(fecha: str, concurrencia: int = None, delta: bool = False, pagina_inicio: int = 1):
+    """
+    Extrae y guarda inventario con descarga y escritura solapadas
+    
+    Args:
+        pagina_inicio: primera página (continuación de una corrida detenida por el plazo)
+    """
+    try:
+        conn = obtener_conexion()
+        try:
+            sincronizador = SincronizadorDelta(conn, fecha) if delta else None
+            totales = pipeline_inventario(conn, fecha, concurrencia, delta=sincronizador, pagina_inicio=pagina_inicio)
+            if sincronizador:
+                # Los ceros de lo que salió del feed solo se aplican con el feed completo en una invocación
+                completo = pagina_inicio == 1 and 'siguiente_pagina' not in totales
+                sincronizador.finalizar(conn, completo and _feed_inventario_completo(totales['items']))
+                logger.info(f"Inventario delta: {sincronizador.resumen()}")
+        finally:
+            liberar_conexion(conn)
+        
+        logger.info(f"Inventario actualizado: {totales['inventario']} en {totales['paginas']} páginas")
+        
+        if not totales['items']:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'No hay datos de inventario',
+                    'fecha': fecha
+                })
+            }
+        
+        resultado = {
+            'message': 'Extracción completada',
+            'fecha': fecha,
+            'items_procesados': totales['items'],
+            'items_actualizados': totales['inventario'],
+            'productos_actualizados': totales['productos'],
+            'paginas': totales['paginas']
+        }
+        if sincronizador:
+            resultado['delta'] = sincronizador.resumen()
+        if 'siguiente_pagina' in totales:
+            resultado['reanudar'] = {'fecha': fecha, 'pagina_inicio': totales['siguiente_pagina']}
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps(resultado)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en extracción de inventario (pipeline): {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def handler_inventario_bodegas(fecha: str, bodegas: list = None, delta: bool = False):
+    """
+    Extrae y guarda inventario bodega por bodega, en paralelo y con una
+    transacción por bodega (por defecto, todos los almacenes activos)
+    """
+    try:
+        if not bodegas:
+            conn = obtener_conexion()
+            try:
+                bodegas = listar_bodegas_activas(conn)
+            finally:
+                liberar_conexion(conn)
+        
+        logger.info(f"Inventario por bodega: {len(bodegas)} bodegas")
+        resultados = inventario_por_bodegas(fecha, bodegas, delta)
+        
+        pendientes = [b for b, r in resultados.items() if r.get('pendiente')]
+        exitosas = {b: r for b, r in resultados.items() if 'error' not in r and not r.get('pendiente')}
+        fallidas = {b: r['error'] for b, r in resultados.items() if 'error' in r}
+        
+        resultado = {
+            'message': 'Extracción completada' if not fallidas else 'Extracción completada con errores',
+            'fecha': fecha,
+            'items_procesados': sum(r['items'] for r in exitosas.values()),
+            'items_actualizados': sum(r['inventario'] for r in exitosas.values()),
+            'productos_actualizados': sum(r['productos'] for r in exitosas.values()),
+            'bodegas': resultados,
+            'bodegas_con_error': sorted(fallidas)
+        }
+        if pendientes:
+            # Las fallidas se reintentan en la continuación; sin bodegas
+            # pendientes no se continúa solo por ellas (un error persistente
+            # encadenaría invocaciones sin fin)
+            resultado['reanudar'] = {'fecha': fecha, 'bodegas': pendientes + sorted(fallidas)}
+        
+        return {
+            # Solo se reporta error si no se pudo cargar ninguna bodega
+            'statusCode': 500 if fallidas and not exitosas and not pendientes else 200,
+            'body': json.dumps(resultado)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en extracción de inventario (por bodega): {e}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+# Hilos persistentes: cada uno conserva su conexión (obtener_conexion es por
+# hilo) entre invocaciones del mismo contenedor. Dos por empresa en paralelo:
+# con menos, la segunda empresa esperaría a que termine la primera.
+_ejecutor_ambos = ThreadPoolExecutor(max_workers=2 * max(EMPRESAS_CONCURRENCIA, 1), thread_name_prefix='colector')
+
+
+def ejecutar_ambos_concurrente(event, context) -> dict:
+    """
+    Ejecuta ventas e inventario en paralelo: hosts SOAP distintos y tablas
+    distintas salvo productos, que se escribe a través de un RegistroProductos
+    compartido (una escritura deduplicada en vez de dos upserts compitiendo)
+    """
+    registro = RegistroProductos()
+    
+    def ejecutar(funcion):
+        _registro_productos.set(registro)
+        return funcion(event, context)
+    
+    futuros = {
+        nombre: _ejecutor_ambos.submit(contextvars.copy_context().run, ejecutar, funcion)
+        for nombre, funcion in (('ventas', handler_ventas), ('inventario', handler_inventario))
+    }
+    resultados = {nombre: futuro.result() for nombre, futuro in futuros.items()}
+    resultados['productos'] = registro.resumen()
+    logger.info(f"Productos (registro compartido): {resultados['productos']}")
+    return resultados
+
+
+def ejecutar_tipo(event, context) -> dict:
     """
-    Handler principal - puede ejecutar ventas, inventario o ambos
+    Ejecuta ventas, inventario, ambos, la reconciliación o el cuadre para la
+    empresa del contexto actual
     """
     tipo = event.get('tipo', 'ambos')
+    resultados = {}
+    
+    if tipo == 'ambos' and event.get('concurrente', AMBOS_CONCURRENTE):
+        resultados.update(ejecutar_ambos_concurrente(event, context))
+    else:
+        if tipo in ['ventas', 'ambos']:
+            resultados['ventas'] = handler_ventas(event, context)
+        
+        if tipo in ['inventario', 'ambos']:
+            resultados['inventario'] = handler_inventario(event, context)
+    
+    if tipo == 'reconciliacion_ventas':
+        resultados['reconciliacion_ventas'] = handler_reconciliacion_ventas(event, context)
+    
+    if tipo == 'cuadre_ventas':
+        resultados['cuadre_ventas'] = handler_cuadre_ventas(event, context)
     
+    return resultados
+
+
+# Hilos persistentes, uno por empresa en paralelo (cada uno con su conexión)
+_ejecutor_empresas = ThreadPoolExecutor(max_workers=EMPRESAS_CONCURRENCIA, thread_name_prefix='empresa')
+
+
+def ejecutar_empresas(event, context, empresas: list) -> dict:
+    """
+    Colecta varias empresas en la misma invocación, EMPRESAS_CONCURRENCIA a la
+    vez. Cada empresa corre con su ConfigEmpresa en el contexto: sus propias
+    métricas, watermarks y límite de llamadas SOAP. El error de una empresa no
+    detiene a las demás.
+    
+    cargar_empresas admite por ahora una sola empresa por base de datos (ver
+    EMPRESAS_CONFIG).
+    """
+    def ejecutar(empresa: ConfigEmpresa):
+        _empresa_actual.set(empresa)
+        return ejecutar_tipo(event, context)
+    
+    futuros = {
+        empresa.empresa: _ejecutor_empresas.submit(contextvars.copy_context().run, ejecutar, empresa)
+        for empresa in empresas
+    }
     resultados = {}
+    for nombre, futuro in futuros.items():
+        try:
+            resultados[nombre] = futuro.result()
+        except Exception as e:
+            logger.error(f"Error colectando empresa {nombre}: {e}", exc_info=True)
+            resultados[nombre] = {'error': str(e)}
+    return resultados
+
+
+def handler(event, context):
+    """
+    Handler principal - puede ejecutar ventas, inventario o ambos, para la
+    empresa por defecto o la de event['empresas'] / EMPRESAS_CONFIG
+    """
+    soap_client.estadisticas(reiniciar=True)
+    soap_client.limites(reiniciar=True)
+    estadisticas_conexiones(reiniciar=True)
+    catalogo_productos.estadisticas(reiniciar=True)
+    _plazo_actual.set(PlazoEjecucion(context, event.get('corrida'), event.get('continuacion', 0)))
+    
+    empresas = cargar_empresas(event.get('empresas', EMPRESAS_CONFIG))
+    if empresas:
+        resultados = {'empresas': ejecutar_empresas(event, context, empresas)}
+    else:
+        resultados = ejecutar_tipo(event, context)
     
-    if tipo in ['ventas', 'ambos']:
-        resultados['ventas'] = handler_ventas(event, context)
+    continuaciones = _continuaciones(resultados)
+    if continuaciones:
+        resultados['continuaciones'] = invocar_continuaciones(context, continuaciones)
     
-    if tipo in ['inventario', 'ambos']:
-        resultados['inventario'] = handler_inventario(event, context)
+    resultados['soap'] = soap_client.estadisticas()
+    if soap_client.adaptativo:
+        resultados['limites_soap'] = soap_client.limites()
+    resultados['conexiones'] = estadisticas_conexiones()
+    resultados['catalogo_productos'] = catalogo_productos.estadisticas()
+    logger.info(f"Estadísticas SOAP: {resultados['soap']}")
     
     return {
         'statusCode': 200,
@@ -1,144 +1,299 @@
 #!/usr/bin/env python3
 """
-Script para carga histórica de ventas
-Carga ventas desde enero 2025 hasta hoy, mes por mes
+Motor de carga histórica (backfill) de ventas
+Carga ventas por rangos de días con un pool de workers, limita la tasa de
+llamadas a la API SOAP (token bucket) y registra cada rango en la tabla
+backfill_rangos, de modo que una ejecución interrumpida se reanuda donde quedó
+y los rangos fallidos se reintentan automáticamente. Con --cuadre no recarga
+los rangos: compara agregados por día y bodega contra la API y recarga solo
+lo que no cuadre.
+
+Requiere database/migration_v7_backfill.sql. Ejecutar desde la raíz del proyecto:
+    python backend/lambdas/data_collector/load_historical.py --desde 2025-01-01 --workers 4
+    python backend/lambdas/data_collector/load_historical.py --desde 2025-01-01 --cuadre
 """
 
 import os
 import sys
-from datetime import datetime, timedelta
-from calendar import monthrange
+import json
 import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 # Configurar entorno
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # ============================================
-# CONFIGURACIÓN - EDITAR ESTOS VALORES
+# CONFIGURACIÓN
 # ============================================
 
 from dotenv import load_dotenv
 load_dotenv()
 
-DB_CONFIG = {
-    'host': os.environ.get('DB_HOST', ''),
-    'port': os.environ.get('DB_PORT', '5432'),
-    'name': os.environ.get('DB_NAME', ''),
-    'user': os.environ.get('DB_USER', ''),
-    'password': os.environ.get('DB_PASSWORD', '')
-}
-
 FECHA_INICIO = '2025-01-01'
 
 os.environ['LOCAL_DEV'] = 'true'
 
-from handler import handler_ventas
+from handler import handler_ventas, handler_cuadre_ventas, get_db_connection, soap_client, EMPRESA
 
 
-def generar_rangos_semanales(fecha_inicio: str, fecha_fin: str):
+def generar_rangos(fecha_inicio: str, fecha_fin: str, dias: int = 7):
     """
-    Genera rangos de fechas semana por semana (7 días)
+    Genera rangos de fechas de `dias` días (por defecto semana por semana)
     """
     inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d')
     fin = datetime.strptime(fecha_fin, '%Y-%m-%d')
-    
+
     rangos = []
     current = inicio
-    
+
     while current <= fin:
-        # Fin de la semana (6 días después)
-        semana_fin = current + timedelta(days=6)
-        
+        # Fin del rango
+        rango_fin = current + timedelta(days=dias - 1)
+
         # No pasar de la fecha fin
-        if semana_fin > fin:
-            semana_fin = fin
-        
+        if rango_fin > fin:
+            rango_fin = fin
+
         rangos.append({
             'inicio': current.strftime('%Y-%m-%d'),
-            'fin': semana_fin.strftime('%Y-%m-%d'),
-            'periodo': f"{current.strftime('%Y-%m-%d')} a {semana_fin.strftime('%Y-%m-%d')}"
+            'fin': rango_fin.strftime('%Y-%m-%d'),
+            'periodo': f"{current.strftime('%Y-%m-%d')} a {rango_fin.strftime('%Y-%m-%d')}",
+            'intentos': 0
         })
-        
-        # Siguiente semana
-        current = semana_fin + timedelta(days=1)
-    
+
+        # Siguiente rango
+        current = rango_fin + timedelta(days=1)
+
     return rangos
 
 
+# ============================================
+# LIMITADOR DE TASA
+# ============================================
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: `tasa` llamadas por segundo con ráfagas de hasta
+    `capacidad` llamadas
+
+    Se instala en el cliente SOAP (soap_client.tasa): cada llamada HTTP toma un
+    token, así que un rango partido en tramos o sub-rangos paga una por llamada.
+    """
+
+    def __init__(self, tasa: float, capacidad: int):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._tokens = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        """Bloquea hasta que haya un token disponible"""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.tasa
+            time.sleep(espera)
+
+
+# ============================================
+# CHECKPOINTS
+# ============================================
+
+def dias_completados(conn, empresa: str) -> set:
+    """
+    Días ya cubiertos por rangos completados (independiente del tamaño de rango)
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT fecha_inicio, fecha_fin FROM backfill_rangos
+            WHERE empresa = %s AND fuente = 'ventas' AND estado = 'completado'
+        """, (empresa,))
+        filas = cur.fetchall()
+    conn.commit()
+
+    dias = set()
+    for inicio, fin in filas:
+        dia = inicio
+        while dia <= fin:
+            dias.add(dia.strftime('%Y-%m-%d'))
+            dia += timedelta(days=1)
+    return dias
+
+
+def registrar_rango(conn, empresa: str, rango: dict, estado: str, filas: int = None,
+                    segundos: float = None, error: str = None):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO backfill_rangos (empresa, fuente, fecha_inicio, fecha_fin, estado, intentos,
+                                         filas, segundos, error, updated_at)
+            VALUES (%s, 'ventas', %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (empresa, fuente, fecha_inicio, fecha_fin) DO UPDATE SET
+                estado = EXCLUDED.estado,
+                intentos = EXCLUDED.intentos,
+                filas = EXCLUDED.filas,
+                segundos = EXCLUDED.segundos,
+                error = EXCLUDED.error,
+                updated_at = CURRENT_TIMESTAMP
+        """, (empresa, rango['inicio'], rango['fin'], estado, rango['intentos'], filas,
+              round(segundos, 2) if segundos is not None else None, error))
+    conn.commit()
+
+
+# ============================================
+# WORKER
+# ============================================
+
+def cargar_rango(rango: dict, espera: float, adaptativo: bool = False,
+                 tramos: bool = False, cuadre: bool = False) -> dict:
+    """
+    Carga un rango (después de `espera` segundos si es un reintento); con
+    `cuadre` solo recarga los días y bodegas que no cuadran
+    """
+    if espera:
+        time.sleep(espera)
+
+    inicio = time.perf_counter()
+    if cuadre:
+        resultado = handler_cuadre_ventas({'fecha_inicio': rango['inicio'], 'fecha_fin': rango['fin']}, None)
+    else:
+        resultado = handler_ventas({
+            'fecha_inicio': rango['inicio'],
+            'fecha_fin': rango['fin'],
+            'adaptativo': adaptativo,
+            'tramos': tramos
+        }, None)
+    body = json.loads(resultado['body'])
+
+    if 'error' in body:
+        raise RuntimeError(body['error'])
+
+    return {
+        'ventas': body.get('ventas_insertadas', 0),
+        'productos': body.get('productos_actualizados', 0),
+        'segundos': time.perf_counter() - inicio
+    }
+
+
+def formato_duracion(segundos: float) -> str:
+    segundos = int(segundos)
+    return f"{segundos // 3600:d}:{segundos % 3600 // 60:02d}:{segundos % 60:02d}"
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Carga histórica de ventas (reanudable)')
+    parser.add_argument('--desde', default=FECHA_INICIO, help='Fecha inicio YYYY-MM-DD')
+    parser.add_argument('--hasta', default=datetime.now().strftime('%Y-%m-%d'), help='Fecha fin YYYY-MM-DD')
+    parser.add_argument('--dias-por-rango', type=int, default=7)
+    parser.add_argument('--workers', type=int, default=4, help='Rangos cargando en paralelo')
+    parser.add_argument('--tasa', type=float, default=0.5, help='Llamadas SOAP por segundo')
+    parser.add_argument('--rafaga', type=int, default=2, help='Llamadas SOAP seguidas permitidas')
+    parser.add_argument('--reintentos', type=int, default=3, help='Intentos por rango antes de darlo por fallido')
+    parser.add_argument('--recargar', action='store_true', help='Ignorar checkpoints y recargar todo')
+    parser.add_argument('--adaptativo', action='store_true',
+                        help='Partir automáticamente los rangos que excedan el timeout o el máximo de filas')
+    parser.add_argument('--tramos', action='store_true',
+                        help='Descargar cada rango en tramos diarios paralelos (VENTAS_TRAMOS_CONCURRENCIA por rango)')
+    parser.add_argument('--cuadre', action='store_true',
+                        help='Comparar agregados por día y bodega y recargar solo lo que no cuadre '
+                             '(revisa también los rangos completados)')
+    args = parser.parse_args()
+
     print("\n" + "#" * 60)
-    print("# CARGA HISTÓRICA DE VENTAS (SEMANAL)")
+    print("# CARGA HISTÓRICA DE VENTAS")
     print("#" * 60)
-    
-    # Verificar password
-    if DB_CONFIG['password'] == 'TU_PASSWORD_AQUI':
-        print("\n⚠️  ERROR: Debes configurar el password de la BD")
-        print("   Edita este archivo y cambia 'TU_PASSWORD_AQUI'")
-        return
-    
-    # Generar rangos semanales
-    fecha_fin = datetime.now().strftime('%Y-%m-%d')
-    rangos = generar_rangos_semanales(FECHA_INICIO, fecha_fin)
-    
-    print(f"\n📅 Período: {FECHA_INICIO} a {fecha_fin}")
-    print(f"📦 Total de semanas a cargar: {len(rangos)}")
+
+    conn = get_db_connection()
+
+    # Generar rangos y descartar los ya completados
+    rangos = generar_rangos(args.desde, args.hasta, args.dias_por_rango)
+    completados = set() if args.recargar or args.cuadre else dias_completados(conn, EMPRESA)
+    pendientes = [
+        r for r in rangos
+        if not all(dia['inicio'] in completados for dia in generar_rangos(r['inicio'], r['fin'], 1))
+    ]
+
+    print(f"\n📅 Período: {args.desde} a {args.hasta}")
+    print(f"📦 Rangos: {len(rangos)} ({len(rangos) - len(pendientes)} ya completados, {len(pendientes)} pendientes)")
+    print(f"⚙️  Workers: {args.workers} | Tasa: {args.tasa}/s (ráfaga {args.rafaga}) | Reintentos: {args.reintentos}")
     print("\n" + "-" * 50)
-    
-    # Confirmar
-    respuesta = input("\n¿Deseas continuar con la carga? (s/n): ")
-    if respuesta.lower() != 's':
-        print("Cancelado.")
-        return
-    
-    # Cargar semana por semana
+
+    # Un token por llamada SOAP, no por rango
+    soap_client.tasa = TokenBucket(args.tasa, args.rafaga)
+    total = len(pendientes)
+    terminados = 0
     total_ventas = 0
     total_productos = 0
-    errores = []
-    
-    for i, rango in enumerate(rangos, 1):
-        print(f"\n[{i}/{len(rangos)}] Cargando {rango['periodo']}...")
-        
-        try:
-            resultado = handler_ventas({
-                'fecha_inicio': rango['inicio'],
-                'fecha_fin': rango['fin']
-            }, None)
-            
-            import json
-            body = json.loads(resultado['body'])
-            
-            if 'error' in body:
-                print(f"    ❌ Error: {body['error'][:100]}")
-                errores.append(rango['periodo'])
-            else:
-                ventas = body.get('ventas_insertadas', 0)
-                productos = body.get('productos_actualizados', 0)
-                total_ventas += ventas
-                total_productos += productos
-                print(f"    ✅ Ventas: {ventas:,} | Productos: {productos}")
-            
-            # Pausa para no saturar la API
-            time.sleep(1)
-            
-        except Exception as e:
-            print(f"    ❌ Error: {e}")
-            errores.append(rango['periodo'])
-    
+    fallidos = []
+    inicio = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            en_vuelo = {}
+            for rango in pendientes:
+                rango['intentos'] = 1
+                en_vuelo[pool.submit(cargar_rango, rango, 0, args.adaptativo, args.tramos,
+                                         args.cuadre)] = rango
+
+            while en_vuelo:
+                listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    rango = en_vuelo.pop(futuro)
+                    try:
+                        r = futuro.result()
+                    except Exception as e:
+                        error = str(e)[:500]
+                        if rango['intentos'] < args.reintentos:
+                            # Reintento con backoff exponencial
+                            espera = 2 ** rango['intentos']
+                            print(f"    ⚠️  {rango['periodo']}: {error[:100]} (reintento {rango['intentos']} en {espera}s)")
+                            rango['intentos'] += 1
+                            registrar_rango(conn, EMPRESA, rango, 'reintentando', error=error)
+                            en_vuelo[pool.submit(cargar_rango, rango, espera, args.adaptativo,
+                                                         args.tramos, args.cuadre)] = rango
+                            continue
+
+                        registrar_rango(conn, EMPRESA, rango, 'error', error=error)
+                        fallidos.append((rango['periodo'], error))
+                        terminados += 1
+                        print(f"    ❌ {rango['periodo']}: {error[:100]}")
+                    else:
+                        registrar_rango(conn, EMPRESA, rango, 'completado', r['ventas'], r['segundos'])
+                        total_ventas += r['ventas']
+                        total_productos += r['productos']
+                        terminados += 1
+
+                    # Progreso en vivo: throughput y ETA
+                    transcurrido = time.perf_counter() - inicio
+                    eta = transcurrido / terminados * (total - terminados)
+                    print(f"[{terminados}/{total}] {rango['periodo']} | "
+                          f"{total_ventas:,} ventas | {total_ventas / transcurrido:,.0f} ventas/s | "
+                          f"ETA {formato_duracion(eta)}")
+    finally:
+        conn.close()
+
     # Resumen final
     print("\n" + "=" * 60)
     print("RESUMEN FINAL")
     print("=" * 60)
+    print(f"  ⏱️  Duración: {formato_duracion(time.perf_counter() - inicio)}")
     print(f"  ✅ Total ventas cargadas: {total_ventas:,}")
     print(f"  ✅ Total productos: {total_productos:,}")
-    
-    if errores:
-        print(f"  ❌ Semanas con error: {len(errores)}")
-        for e in errores[:5]:  # Mostrar solo las primeras 5
-            print(f"      - {e}")
-        if len(errores) > 5:
-            print(f"      ... y {len(errores) - 5} más")
+
+    if fallidos:
+        print(f"  ❌ Rangos con error: {len(fallidos)} (se reintentan en la próxima ejecución)")
+        for periodo, error in fallidos:
+            print(f"      - {periodo}: {error[:100]}")
     else:
-        print(f"  ✅ Todas las semanas cargadas correctamente")
+        print(f"  ✅ Todos los rangos cargados correctamente")
 
 
 if __name__ == "__main__":
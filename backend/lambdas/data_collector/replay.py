@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Re-ingesta offline desde el archivo de respuestas SOAP
+Lee las respuestas crudas guardadas con SOAP_ARCHIVO y las vuelve a cargar a
+PostgreSQL sin acceso a la red: reprocesa después de un error de parseo o de
+carga, y da una entrada determinística para medir el camino de ingesta.
+
+Ejecutar desde la raíz del proyecto:
+    python backend/lambdas/data_collector/replay.py --archivo ./archivo_soap --listar
+    python backend/lambdas/data_collector/replay.py --archivo ./archivo_soap --todo
+    python backend/lambdas/data_collector/replay.py --archivo s3://bucket/soap \
+        --evento '{"tipo": "ventas", "fecha_inicio": "2025-03-01", "fecha_fin": "2025-03-07"}'
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# Agregar el directorio al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ['LOCAL_DEV'] = 'true'
+
+
+def configurar(archivo: str):
+    """El handler lee la configuración del archivo al importarse"""
+    os.environ['SOAP_ARCHIVO'] = archivo
+    os.environ['SOAP_REPLAY'] = 'true'
+
+
+def listar(handler):
+    for operacion in ('GenerarInfoVentas', 'GenerarInformacionInventarios'):
+        entradas = sorted(handler.soap_client.archivo.entradas(operacion), key=lambda e: json.dumps(e['parametros']))
+        print(f"\n{operacion}: {len(entradas)} respuestas")
+        for e in entradas:
+            print(f"  {json.dumps(e['parametros'], sort_keys=True)}  {e['bytes']:>12,} bytes  {e['capturado']}")
+
+
+def reingestar_todo(handler):
+    """
+    Vuelve a cargar cada respuesta archivada de la empresa configurada
+    """
+    archivo = handler.soap_client.archivo
+    conn = handler.get_db_connection()
+    totales = {'ventas': 0, 'inventario': 0, 'productos': 0, 'omitidas': 0}
+    inicio = time.perf_counter()
+
+    try:
+        for entrada in archivo.entradas('GenerarInfoVentas'):
+            p = entrada['parametros']
+            if p['empresa'] != handler.EMPRESA:
+                totales['omitidas'] += 1
+                continue
+            resultado = handler.call_soap_ventas(p['fecha_inicio'], p['fecha_fin'], '', p['hora_inicio'], p['hora_fin'])
+            ventas = handler._extraer_registros(resultado, ('ventas', 'data', 'resultado'))
+            productos_unicos = {v.get('REFER'): v for v in ventas if v.get('REFER')}.values()
+            totales['productos'] += handler.guardar_productos(conn, list(productos_unicos))
+            totales['ventas'] += handler.insert_ventas(conn, ventas)
+            print(f"  ventas {p['fecha_inicio']} {p['hora_inicio']} a {p['fecha_fin']} {p['hora_fin']}: {len(ventas):,}")
+
+        # Inventario: páginas de cada (fecha, bodega) en orden
+        paginas = {}
+        for entrada in archivo.entradas('GenerarInformacionInventarios'):
+            p = entrada['parametros']
+            if p['base_datos'] != handler.BASE_DATOS:
+                totales['omitidas'] += 1
+                continue
+            paginas.setdefault((p['fecha'], p['bodega']), []).append(p)
+
+        for (fecha, bodega), grupo in sorted(paginas.items()):
+            n_items = 0
+            for p in sorted(grupo, key=lambda p: p['pagina']):
+                items = handler._extraer_registros(
+                    handler.call_soap_inventario(fecha, bodega, '', p['pagina'], p['filas']),
+                    ('inventario', 'data', 'resultado')
+                )
+                productos_unicos = {i.get('REFERENCIA'): i for i in items if i.get('REFERENCIA')}.values()
+                totales['productos'] += handler.guardar_productos(conn, list(productos_unicos))
+                totales['inventario'] += handler.upsert_inventario(conn, items, fecha)
+                n_items += len(items)
+            print(f"  inventario {fecha} bodega {bodega or 'TODAS'}: {len(grupo)} páginas, {n_items:,} items")
+    finally:
+        conn.close()
+
+    totales['segundos'] = round(time.perf_counter() - inicio, 2)
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-ingesta desde el archivo de respuestas SOAP')
+    parser.add_argument('--archivo', default=os.environ.get('SOAP_ARCHIVO'),
+                        help='Directorio local o s3://bucket/prefijo')
+    accion = parser.add_mutually_exclusive_group(required=True)
+    accion.add_argument('--listar', action='store_true', help='Mostrar las respuestas archivadas')
+    accion.add_argument('--todo', action='store_true', help='Re-ingestar todas las respuestas archivadas')
+    accion.add_argument('--evento', help='Evento JSON para el handler (se resuelve contra el archivo)')
+    args = parser.parse_args()
+
+    if not args.archivo:
+        parser.error('Falta --archivo (o SOAP_ARCHIVO)')
+
+    configurar(args.archivo)
+    import handler
+
+    if args.listar:
+        listar(handler)
+    elif args.todo:
+        print(json.dumps(reingestar_todo(handler), indent=2))
+    else:
+        resultado = handler.handler(json.loads(args.evento), None)
+        print(json.dumps(json.loads(resultado['body']), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
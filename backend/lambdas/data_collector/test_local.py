@@ -3,6 +3,9 @@
 Script para probar el Data Collector localmente
 Ejecutar desde la raíz del proyecto:
     python backend/lambdas/data_collector/test_local.py
+
+Para no llamar a las APIs reales, levantar fake_soap_server.py y exportar
+VENTAS_API_URL / INVENTARIO_API_URL apuntando a él.
 """
 
 import os
@@ -0,0 +1,126 @@
+"""
+Archivo de respuestas SOAP: captura, deduplicación y replay sin red
+"""
+
+import gzip
+
+import pytest
+
+import handler as colector
+
+PARAMETROS = {'empresa': 'PRUEBA', 'fecha_inicio': '2025-03-01', 'fecha_fin': '2025-03-01'}
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    return colector.abrir_archivo(str(tmp_path / 'archivo_soap'))
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Instala un SoapClient propio en el colector (captura o replay)"""
+    def instalar(**kwargs):
+        nuevo = colector.SoapClient(adaptativo=False, **kwargs)
+        monkeypatch.setattr(colector, 'soap_client', nuevo)
+        return nuevo
+    return instalar
+
+
+def archivos(archivo, prefijo: str) -> list:
+    return list(archivo.almacen.listar(prefijo))
+
+
+# ============================================
+# ALMACÉN
+# ============================================
+
+def test_guardar_y_cargar_devuelve_los_mismos_bytes(archivo):
+    contenido = 'Ñandú [{"NUMDOC": "1"}]'.encode('utf-8') * 100
+
+    sha = archivo.guardar('GenerarInfoVentas', PARAMETROS, contenido)
+
+    assert archivo.cargar('GenerarInfoVentas', dict(reversed(PARAMETROS.items()))) == contenido
+    [objeto] = archivos(archivo, 'objetos')
+    assert sha in objeto and gzip.decompress(archivo.almacen.leer(objeto)) == contenido
+    assert archivo.entrada('GenerarInfoVentas', PARAMETROS)['bytes'] == len(contenido)
+
+
+def test_respuestas_iguales_se_guardan_una_vez(archivo):
+    otros = dict(PARAMETROS, fecha_fin='2025-03-02')
+
+    archivo.guardar('GenerarInfoVentas', PARAMETROS, b'[]')
+    archivo.guardar('GenerarInfoVentas', otros, b'[]')
+
+    assert len(archivos(archivo, 'objetos')) == 1
+    assert len(list(archivo.entradas('GenerarInfoVentas'))) == 2
+
+
+def test_la_ultima_captura_reemplaza_a_la_anterior(archivo):
+    archivo.guardar('GenerarInfoVentas', PARAMETROS, b'primera')
+    archivo.guardar('GenerarInfoVentas', PARAMETROS, b'segunda')
+
+    assert archivo.cargar('GenerarInfoVentas', PARAMETROS) == b'segunda'
+    assert [e['sha256'] for e in archivo.entradas()] == [colector.hashlib.sha256(b'segunda').hexdigest()]
+    assert not any(ruta.endswith('.tmp') for ruta in archivos(archivo, ''))
+
+
+def test_respuesta_no_archivada(archivo):
+    archivo.guardar('GenerarInfoVentas', PARAMETROS, b'[]')
+
+    with pytest.raises(colector.RespuestaNoArchivada):
+        archivo.cargar('GenerarInformacionInventarios', PARAMETROS)
+    with pytest.raises(colector.RespuestaNoArchivada):
+        archivo.cargar('GenerarInfoVentas', dict(PARAMETROS, empresa='OTRA'))
+
+
+def test_abrir_archivo():
+    assert colector.abrir_archivo('') is None
+    assert isinstance(colector.abrir_archivo('/tmp/x').almacen, colector._AlmacenLocal)
+
+
+def test_replay_requiere_archivo():
+    with pytest.raises(ValueError):
+        colector.SoapClient(replay=True)
+
+
+# ============================================
+# CAPTURA Y REPLAY
+# ============================================
+
+def test_replay_de_ventas_e_inventario_sin_red(api_falsa, archivo, cliente):
+    cliente(archivo=archivo)
+    ventas = colector.call_soap_ventas('2025-03-01', '2025-03-02', 'x')
+    inventario = colector.call_soap_inventario('2025-03-01', '0001', 'x', 2, 50)
+    llamadas = api_falsa.llamadas
+
+    reproductor = cliente(archivo=archivo, replay=True)
+
+    assert colector.call_soap_ventas('2025-03-01', '2025-03-02', 'otro-token') == ventas
+    assert colector.call_soap_inventario('2025-03-01', '0001', 'otro-token', 2, 50) == inventario
+    assert api_falsa.llamadas == llamadas
+    assert {llamada['host'] for llamada in reproductor.llamadas} == {'replay'}
+    with pytest.raises(colector.RespuestaNoArchivada):
+        colector.call_soap_inventario('2025-03-01', '0001', 'x', 3, 50)
+
+
+def test_streaming_archiva_y_reproduce_la_respuesta_completa(api_falsa, archivo, cliente):
+    cliente(archivo=archivo)
+    capturados = list(colector.call_soap_ventas_stream('2025-03-01', '2025-03-01', 'x', tamano_lote=7))
+    llamadas = api_falsa.llamadas
+
+    cliente(archivo=archivo, replay=True)
+    reproducidos = list(colector.call_soap_ventas_stream('2025-03-01', '2025-03-01', 'x', tamano_lote=7))
+
+    assert reproducidos == capturados and len(capturados) > 1
+    assert colector.call_soap_ventas('2025-03-01', '2025-03-01', 'x') == [v for lote in capturados for v in lote]
+    assert api_falsa.llamadas == llamadas
+
+
+def test_streaming_leido_a_medias_no_se_archiva(api_falsa, archivo, cliente):
+    cliente(archivo=archivo)
+
+    lotes = colector.call_soap_ventas_stream('2025-03-01', '2025-03-01', 'x', tamano_lote=7)
+    next(lotes)
+    lotes.close()
+
+    assert list(archivo.entradas()) == []
@@ -0,0 +1,135 @@
+"""
+Checkpoints de corridas con plazo
+"""
+
+import json
+from datetime import datetime
+
+import handler as colector
+from conftest import BODEGAS_FALSAS, consultar
+
+
+def test_bodegas_fallidas_siguen_pendientes_en_el_checkpoint(api_falsa, conn, plazo, monkeypatch):
+    cargar_bodega = colector.cargar_bodega
+
+    def cargar(fecha, bodega, delta=False):
+        if bodega == '0002':
+            raise RuntimeError('SOAP caído')
+        return cargar_bodega(fecha, bodega, delta)
+
+    monkeypatch.setattr(colector, 'cargar_bodega', cargar)
+    resultados = colector.inventario_por_bodegas('2025-03-01', BODEGAS_FALSAS)
+
+    assert 'error' in resultados['0002']
+    [(reanudar, progreso)] = consultar(conn, "SELECT reanudar, progreso FROM checkpoints_ingesta")
+    assert reanudar == {'fecha': '2025-03-01', 'bodegas': ['0002']}
+    assert progreso == {'bodegas': 4, 'bodegas_con_error': 1}
+
+
+def test_ultimo_tramo_no_deja_checkpoint_sin_fecha(api_falsa, conn, plazo):
+    respuesta = colector.handler_ventas_tramos('2025-03-01', '2025-03-02', 1, 1)
+
+    assert respuesta['statusCode'] == 200
+    [(reanudar, progreso)] = consultar(conn, "SELECT reanudar, progreso FROM checkpoints_ingesta")
+    assert reanudar == {'fecha_inicio': '2025-03-02', 'fecha_fin': '2025-03-02'}
+    assert progreso['tramos'] == 1
+
+
+def test_ventas_de_varios_dias_con_plazo_van_por_tramos(api_falsa, conn, plazo):
+    respuesta = colector.handler_ventas({'fecha_inicio': '2025-03-01', 'fecha_fin': '2025-03-03'}, None)
+
+    cuerpo = json.loads(respuesta['body'])
+    assert cuerpo['tramos'] == ['2025-03-01 a 2025-03-01', '2025-03-02 a 2025-03-02', '2025-03-03 a 2025-03-03']
+    [(estado,)] = consultar(conn, "SELECT estado FROM checkpoints_ingesta")
+    assert estado == 'completado'
+
+
+def test_streaming_con_plazo_lee_un_tramo_a_la_vez(api_falsa, conn, plazo, monkeypatch):
+    consultas = []
+    extraer_ventas_lotes = colector.extraer_ventas_lotes
+
+    def extraer(inicio, fin, *args):
+        consultas.append((inicio, fin))
+        return extraer_ventas_lotes(inicio, fin, *args)
+
+    monkeypatch.setattr(colector, 'extraer_ventas_lotes', extraer)
+    respuesta = colector.handler_ventas({'fecha_inicio': '2025-03-01', 'fecha_fin': '2025-03-03',
+                                         'streaming': True, 'tamano_lote': 25}, None)
+
+    cuerpo = json.loads(respuesta['body'])
+    assert consultas == [('2025-03-01', '2025-03-01'), ('2025-03-02', '2025-03-02'), ('2025-03-03', '2025-03-03')]
+    assert cuerpo['ventas_insertadas'] == 180 and cuerpo['lotes'] == 9
+
+
+def test_streaming_con_plazo_se_detiene_entre_tramos(api_falsa, conn, plazo, monkeypatch):
+    monkeypatch.setattr(colector, 'plazo_vencido', lambda: True)
+
+    cuerpo = json.loads(colector.handler_ventas_streaming('2025-03-01', '2025-03-03', 25, 1)['body'])
+
+    assert cuerpo['ventas_insertadas'] == 60
+    assert cuerpo['reanudar'] == {'fecha_inicio': '2025-03-02', 'fecha_fin': '2025-03-03'}
+    [(reanudar,)] = consultar(conn, "SELECT reanudar FROM checkpoints_ingesta")
+    assert reanudar == {'fecha_inicio': '2025-03-02', 'fecha_fin': '2025-03-03'}
+
+
+def test_inventario_con_plazo_va_por_el_pipeline(api_falsa, conn, plazo):
+    respuesta = colector.handler_inventario({'fecha': '2025-03-01'}, None)
+
+    cuerpo = json.loads(respuesta['body'])
+    assert cuerpo['paginas'] == 1 and cuerpo['items_procesados'] == 150
+
+
+def ventas_en_desorden(api_falsa, monkeypatch):
+    """La API no promete entregar las ventas en orden de hora: las devuelve al revés"""
+    ventas = api_falsa.generador.ventas
+    monkeypatch.setattr(api_falsa.generador, 'ventas', lambda inicio, fin: ventas(inicio, fin)[::-1])
+
+
+def test_incremental_se_detiene_con_el_plazo_y_reanuda_la_misma_ventana(api_falsa, conn, monkeypatch):
+    hoy = datetime.now().date()
+    esperadas = {(v['PREFIJO'], v['NUMDOC'], v['REFER']) for v in api_falsa.generador.ventas_dia(hoy)}
+    ventas_en_desorden(api_falsa, monkeypatch)
+
+    vencido = [True]
+    monkeypatch.setattr(colector, 'plazo_vencido', lambda: vencido[0])
+    detenida = json.loads(colector.handler_ventas_incremental(streaming=True, tamano_lote=10)['body'])
+    assert consultar(conn, "SELECT COUNT(*) FROM extraccion_watermark") == [(0,)]
+    vencido[0] = False
+    completa = json.loads(colector.handler_ventas_incremental(True, 10, **detenida['reanudar'])['body'])
+
+    assert detenida['reanudar']['ventana'] == [hoy.isoformat(), '00:00:00']
+    assert 0 < detenida['ventas_nuevas'] < len(esperadas)
+    assert 'reanudar' not in completa and completa['watermark'] == detenida['watermark']
+    filas = consultar(conn, "SELECT prefijo, numero_documento, referencia FROM ventas")
+    assert set(filas) == esperadas and len(filas) == len(esperadas)
+
+
+def test_incremental_interrumpido_no_deja_el_watermark_adelantado(api_falsa, conn, monkeypatch):
+    hoy = datetime.now().date()
+    esperadas = {(v['PREFIJO'], v['NUMDOC'], v['REFER']) for v in api_falsa.generador.ventas_dia(hoy)}
+    ventas_en_desorden(api_falsa, monkeypatch)
+    insert_ventas = colector.insert_ventas
+    lotes = []
+
+    def caer_en_el_segundo_lote(conn, ventas, commit=True):
+        lotes.append(len(ventas))
+        if len(lotes) == 2:
+            raise RuntimeError('Lambda terminada')
+        return insert_ventas(conn, ventas, commit)
+
+    monkeypatch.setattr(colector, 'insert_ventas', caer_en_el_segundo_lote)
+    assert colector.handler_ventas_incremental(streaming=True, tamano_lote=10)['statusCode'] == 500
+    monkeypatch.setattr(colector, 'insert_ventas', insert_ventas)
+    colector.handler_ventas_incremental(streaming=True, tamano_lote=10)
+
+    filas = consultar(conn, "SELECT prefijo, numero_documento, referencia FROM ventas")
+    assert set(filas) == esperadas
+
+
+def test_checkpoint_sin_conexion_no_detiene_la_corrida(plazo, monkeypatch):
+    def sin_conexion():
+        raise RuntimeError('Secreto de la BD inaccesible')
+
+    monkeypatch.setattr(colector, 'obtener_conexion', sin_conexion)
+
+    colector.guardar_checkpoint('ventas', {'fecha_inicio': '2025-03-02'}, {'tramos': 1})
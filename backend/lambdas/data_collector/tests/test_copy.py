@@ -0,0 +1,146 @@
+"""
+Carga masiva con COPY: escape del formato texto y lectura por partes
+"""
+
+import re
+from decimal import Decimal
+
+import psycopg2
+import pytest
+
+import handler as colector
+from conftest import consultar
+
+_ESCAPES = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r'}
+
+
+def leer_campo(texto: str):
+    """Lo que COPY ... FROM STDIN (formato texto) carga para un campo"""
+    if texto == '\\N':
+        return None
+    return re.sub(r'\\[\\tnr]', lambda m: _ESCAPES[m.group()], texto)
+
+
+@pytest.mark.parametrize('valor', [
+    'simple', '', ' con espacios ', 'tab\taquí', 'línea\nnueva', 'retorno\r\n', 'barra\\final\\',
+    '\\N', '\\t literal', 'Ñandú "comillas" \'simples\'', '\\\\\t\\n',
+])
+def test_textos_vuelven_iguales_desde_copy(valor):
+    texto = colector._valor_copy(valor)
+
+    assert '\t' not in texto and '\n' not in texto and '\r' not in texto
+    assert leer_campo(texto) == valor
+
+
+def test_null_y_numeros():
+    assert colector._valor_copy(None) == '\\N'
+    assert colector._valor_copy(Decimal('12.50')) == '12.50'
+    assert colector._valor_copy(7) == '7'
+
+
+def test_linea_del_lote_escapa_cada_campo():
+    lote = colector.TransformadorLote(colector.CAMPOS_INVENTARIO).transformar([
+        {'BODEGA': '0001', 'REFERENCIA': 'A\tB', 'CANTIDAD': 2, 'VCOSTO': 1.5, 'VVENTA': '3', 'OBSERV1': 'x\ny'},
+        {'BODEGA': '0002', 'REFERENCIA': 'C\\D', 'OBSERV1': '  '},
+    ])
+
+    lineas = list(lote.lineas_copy())
+
+    assert [[leer_campo(c) for c in linea[:-1].split('\t')] for linea in lineas] == [
+        ['0001', 'A\tB', '2', '1.5', '3', 'x\ny'],
+        ['0002', 'C\\D', '0', '0', '0', None],
+    ]
+
+
+LINEAS = [f"{i}\tvalor {i}\n" for i in range(200)]
+
+
+@pytest.mark.parametrize('size', [1, 5, 13, 8192])
+def test_fuente_entrega_el_texto_completo_en_partes(size):
+    fuente = colector._FuenteCopy(LINEAS)
+    partes = []
+    while True:
+        parte = fuente.read(size)
+        if not parte:
+            break
+        assert len(parte) <= size
+        partes.append(parte)
+
+    assert ''.join(partes) == ''.join(LINEAS)
+
+
+def test_fuente_sin_tamano_lee_todo_lo_pendiente():
+    fuente = colector._FuenteCopy(LINEAS)
+
+    inicio = fuente.read(3)
+
+    assert inicio + fuente.read() == ''.join(LINEAS)
+    assert fuente.read() == '' and fuente.read(10) == ''
+
+
+def test_fuente_no_consume_las_lineas_antes_de_tiempo():
+    consumidas = []
+
+    def lineas():
+        for linea in LINEAS:
+            consumidas.append(linea)
+            yield linea
+
+    fuente = colector._FuenteCopy(lineas())
+    fuente.read(20)
+
+    assert len(consumidas) < 5
+
+
+# ============================================
+# STAGING (BASE DE DATOS)
+# ============================================
+
+def item(referencia: str, cantidad=5, bodega: str = '0001', nombre: str = None) -> dict:
+    return {'BODEGA': bodega, 'REFERENCIA': referencia, 'NOMBRE': nombre or referencia, 'CANTIDAD': cantidad,
+            'VCOSTO': 10, 'VVENTA': 12, 'OBSERV1': ''}
+
+
+@pytest.fixture
+def copy(conn, monkeypatch):
+    monkeypatch.setattr(colector, 'CARGA_COPY_MIN_FILAS', 1)
+    monkeypatch.setattr(colector.catalogo_productos, 'ttl', 0)
+
+
+def test_staging_no_bloquea_otras_conexiones(conn, copy, base_datos):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+    otra = psycopg2.connect(base_datos)
+    try:
+        # Transacción abierta con la staging cargada (commit=False, como los shards por bodega)
+        colector.upsert_inventario(otra, [item('R1')], '2025-03-01', False)
+        with conn.cursor() as cur:
+            cur.execute("SET lock_timeout = '2s'")
+
+        assert colector.upsert_inventario(conn, [item('R2', bodega='0002')], '2025-03-01') == 1
+        otra.commit()
+    finally:
+        otra.close()
+
+    assert consultar(conn, "SELECT bodega_codigo, referencia FROM inventario_actual ORDER BY 1") == [
+        ('0001', 'R1'), ('0002', 'R2')]
+
+
+def test_duplicados_del_lote_gana_el_ultimo(conn, copy):
+    colector.upsert_productos(conn, [item('R1', nombre='PRIMERO'), item('R2'), item('R1', nombre='ULTIMO')])
+    colector.upsert_inventario(conn, [item('R1', cantidad=1), item('R2'), item('R1', cantidad=9)], '2025-03-01')
+
+    assert consultar(conn, "SELECT nombre FROM productos WHERE referencia = 'R1'") == [('ULTIMO',)]
+    assert consultar(conn, """
+        SELECT a.cantidad, s.cantidad FROM inventario_actual a
+        JOIN inventario_snapshot s USING (bodega_codigo, referencia) WHERE referencia = 'R1'
+    """) == [(9, 9)]
+
+
+def test_varias_cargas_en_la_misma_transaccion(conn, copy):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+
+    colector.upsert_inventario(conn, [item('R1')], '2025-03-01', False)
+    colector.upsert_inventario(conn, [item('R2')], '2025-03-01', False)
+    conn.commit()
+
+    assert consultar(conn, "SELECT referencia FROM inventario_actual ORDER BY 1") == [('R1',), ('R2',)]
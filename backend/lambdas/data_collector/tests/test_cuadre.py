@@ -0,0 +1,71 @@
+"""
+Cuadre de ventas por agregados y recarga de bodegas descuadradas
+"""
+
+import json
+
+import pytest
+
+import handler as colector
+from conftest import consultar
+
+DIA = '2025-03-05'
+
+
+@pytest.fixture
+def dia_cargado(api_falsa, conn):
+    """Ventas del día cargadas desde la API falsa"""
+    colector.handler_ventas({'fecha_inicio': DIA, 'fecha_fin': DIA}, None)
+    return [dict(v) for v in api_falsa.generador.ventas_dia(colector.datetime.strptime(DIA, '%Y-%m-%d').date())]
+
+
+def claves_bd(conn) -> set:
+    return set(consultar(conn, "SELECT prefijo, numero_documento, referencia FROM ventas"))
+
+
+def test_cuadre_borra_ventas_sin_bodega(dia_cargado, conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO ventas (prefijo, numero_documento, fecha, referencia, cantidad, valor_total)
+            SELECT 'ZZ', '1', fecha, referencia, 1, 1 FROM ventas LIMIT 1
+        """)
+    conn.commit()
+
+    cuerpo = json.loads(colector.handler_cuadre_ventas({'fecha_inicio': DIA, 'fecha_fin': DIA}, None)['body'])
+
+    assert cuerpo['recargados'] == {DIA: [None]} and cuerpo['ventas_borradas'] == 1
+    assert consultar(conn, "SELECT COUNT(*) FROM ventas WHERE bodega_codigo IS NULL") == [(0,)]
+    assert claves_bd(conn) == {(v['PREFIJO'], v['NUMDOC'], v['REFER']) for v in dia_cargado}
+
+
+def test_recarga_conserva_en_la_bd_las_filas_que_van_a_cuarentena(dia_cargado, conn, monkeypatch):
+    monkeypatch.setattr(colector, 'VALIDACION_FILAS', True)
+    invalida = dia_cargado[0]
+    bodega = invalida['BODEGA']
+    invalida['VALTOT'] = 'NaN'
+
+    borradas, insertadas = colector.recargar_ventas_bodegas(conn, DIA, [bodega], dia_cargado)
+
+    de_la_bodega = [v for v in dia_cargado if v['BODEGA'] == bodega]
+    assert borradas == insertadas == len(de_la_bodega) - 1
+    assert claves_bd(conn) == {(v['PREFIJO'], v['NUMDOC'], v['REFER']) for v in dia_cargado}
+    assert consultar(conn, "SELECT clave FROM cuarentena_ingesta") == [
+        (f"{invalida['PREFIJO']}/{invalida['NUMDOC']}/{invalida['REFER']}",)]
+
+
+def test_recarga_fallida_no_deja_el_borrado_ni_la_insercion_confirmados(dia_cargado, conn, monkeypatch):
+    def fallar(*args, **kwargs):
+        raise RuntimeError('BD caída')
+
+    monkeypatch.setattr(colector, 'VALIDACION_FILAS', True)
+    monkeypatch.setattr(colector, 'poner_en_cuarentena', fallar)
+    dia_cargado[0]['VALTOT'] = 'NaN'
+    with conn.cursor() as cur:
+        cur.execute("UPDATE ventas SET cantidad = cantidad + 1")
+    conn.commit()
+    antes = set(consultar(conn, "SELECT prefijo, numero_documento, referencia, cantidad FROM ventas"))
+
+    with pytest.raises(RuntimeError):
+        colector.recargar_ventas_bodegas(conn, DIA, [dia_cargado[0]['BODEGA']], dia_cargado)
+
+    assert set(consultar(conn, "SELECT prefijo, numero_documento, referencia, cantidad FROM ventas")) == antes
@@ -0,0 +1,85 @@
+"""
+Sincronización delta de inventario: huellas en Python iguales a las de SQL
+"""
+
+from decimal import Decimal
+
+import pytest
+
+import handler as colector
+from conftest import consultar
+
+
+@pytest.mark.parametrize('valor, texto', [
+    (None, ''),
+    (0, '0.00000'),
+    (-0.0, '0.00000'),
+    (7, '7.00000'),
+    ('7', '7.00000'),
+    (Decimal('12.5'), '12.50000'),
+    (2.675, '2.67500'),
+    (Decimal('0.000005'), '0.00001'),     # Redondeo de NUMERIC: mitad hacia arriba
+    (Decimal('-0.000005'), '-0.00001'),
+    (1e-05, '0.00001'),
+])
+def test_texto_numeric_como_postgresql(valor, texto):
+    assert colector._texto_numeric(valor) == texto
+
+
+def test_huella_cambia_con_cada_columna():
+    base = (5, 10, 12, 'AGOTADO')
+    huellas = {colector.huella_inventario(*base)}
+    for i, otro in enumerate((6, 11, 13, 'OTRO')):
+        fila = list(base)
+        fila[i] = otro
+        huellas.add(colector.huella_inventario(*fila))
+
+    assert len(huellas) == 5
+    assert colector.huella_inventario(5, 10, 12, None) == colector.huella_inventario('5.0', Decimal(10), 12.0, '')
+
+
+# ============================================
+# BASE DE DATOS
+# ============================================
+
+def item(referencia: str, cantidad=5, bodega: str = '0001', **otros) -> dict:
+    return dict({'BODEGA': bodega, 'REFERENCIA': referencia, 'NOMREF': referencia, 'CANTIDAD': cantidad,
+                 'VCOSTO': 10, 'VVENTA': 12, 'OBSERV1': ''}, **otros)
+
+
+def test_huellas_cargadas_de_la_bd_coinciden(conn):
+    items = [item('R1'), item('R2', cantidad='0.000005', VCOSTO=2.675, OBSERV1='  AGOTADO '),
+             item('R3', cantidad=-1)]
+    del items[2]['VVENTA']
+    colector.upsert_productos(conn, items)
+    colector.upsert_inventario(conn, items, '2025-03-01')
+
+    sincronizador = colector.SincronizadorDelta(conn, '2025-03-01')
+    sincronizador.procesar(conn, items)
+
+    assert sincronizador.resumen() == {'nuevos': 0, 'cambiados': 0, 'sin_cambios': 3, 'eliminados': 0}
+
+
+def test_solo_escribe_lo_nuevo_o_modificado_y_pone_en_cero_lo_ausente(conn):
+    colector.upsert_productos(conn, [item('R1'), item('R2'), item('R3'), item('R4')])
+    colector.upsert_inventario(conn, [item('R1'), item('R2'), item('R3')], '2025-03-01')
+
+    sincronizador = colector.SincronizadorDelta(conn, '2025-03-01')
+    escritas = sincronizador.procesar(conn, [item('R1'), item('R2', cantidad=9), item('R4')])
+    sincronizador.finalizar(conn)
+
+    assert escritas == 2
+    assert sincronizador.resumen() == {'nuevos': 1, 'cambiados': 1, 'sin_cambios': 1, 'eliminados': 1}
+    assert consultar(conn, "SELECT referencia, cantidad FROM inventario_actual ORDER BY 1") == [
+        ('R1', 5), ('R2', 9), ('R3', 0), ('R4', 5)]
+
+
+def test_feed_incompleto_no_pone_en_cero(conn):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+    colector.upsert_inventario(conn, [item('R1'), item('R2')], '2025-03-01')
+
+    sincronizador = colector.SincronizadorDelta(conn, '2025-03-01')
+    sincronizador.procesar(conn, [item('R1')])
+
+    assert sincronizador.finalizar(conn, completo=False) == 0
+    assert consultar(conn, "SELECT COUNT(*) FROM inventario_actual WHERE cantidad = 0") == [(0,)]
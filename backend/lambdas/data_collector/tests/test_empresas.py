@@ -0,0 +1,59 @@
+"""
+Empresas: una sola por base de datos y ejecución en paralelo
+"""
+
+import contextvars
+import threading
+
+import pytest
+
+import handler as colector
+
+
+def test_vacio_es_la_empresa_por_defecto():
+    assert colector.cargar_empresas('') == [] and colector.cargar_empresas(None) == []
+
+
+def test_una_empresa_desde_json():
+    [empresa] = colector.cargar_empresas('[{"empresa": "OTRA", "llamadas_soap": 3}]')
+
+    assert (empresa.empresa, empresa.base_datos, empresa.llamadas_soap) == ('OTRA', 'OTRA', 3)
+    assert colector.ConfigEmpresa.desde(empresa.configuracion()).configuracion() == empresa.configuracion()
+
+
+def test_empresas_repetidas():
+    with pytest.raises(ValueError, match='repetidas'):
+        colector.cargar_empresas(['GSPSAS', {'empresa': 'GSPSAS'}])
+
+
+def test_dos_empresas_sobre_las_mismas_tablas_se_rechazan():
+    # ventas e inventario_actual no tienen columna de empresa
+    with pytest.raises(ValueError, match='Una sola empresa'):
+        colector.cargar_empresas([{'empresa': 'GSPSAS'}, {'empresa': 'OTRA', 'base_datos': 'OTRA'}])
+
+
+def test_handler_rechaza_antes_de_colectar(monkeypatch):
+    monkeypatch.setattr(colector, 'ejecutar_tipo', lambda event, context: pytest.fail('no debe colectar'))
+
+    with pytest.raises(ValueError):
+        # En un contexto aparte: el handler fija el plazo de la invocación
+        contextvars.copy_context().run(colector.handler, {'tipo': 'ventas', 'empresas': ['A', 'B']}, None)
+
+
+@pytest.mark.skipif(colector.EMPRESAS_CONCURRENCIA < 2, reason='EMPRESAS_CONCURRENCIA < 2')
+def test_ventas_e_inventario_de_cada_empresa_corren_a_la_vez(monkeypatch):
+    # Las cuatro colectas (2 empresas x ventas e inventario) deben estar en vuelo juntas
+    barrera = threading.Barrier(4, timeout=5)
+
+    def colectar(event, context):
+        barrera.wait()
+        return colector.empresa_actual().empresa
+
+    monkeypatch.setattr(colector, 'handler_ventas', colectar)
+    monkeypatch.setattr(colector, 'handler_inventario', colectar)
+    empresas = [colector.ConfigEmpresa('A'), colector.ConfigEmpresa('B')]
+
+    resultados = colector.ejecutar_empresas({'tipo': 'ambos', 'concurrente': True}, None, empresas)
+
+    assert resultados['A']['ventas'] == resultados['A']['inventario'] == 'A'
+    assert resultados['B']['ventas'] == resultados['B']['inventario'] == 'B'
@@ -0,0 +1,140 @@
+"""
+Limitador adaptativo de concurrencia (AIMD) y circuit breaker por host SOAP
+"""
+
+import threading
+
+import pytest
+
+import handler as colector
+
+
+def limitador(inicial: int = 4, minimo: int = 1, maximo: int = 16) -> colector.LimitadorAdaptativo:
+    return colector.LimitadorAdaptativo('api.prueba', inicial, minimo, maximo)
+
+
+def llamar(l: colector.LimitadorAdaptativo, exito: bool = True, segundos: float = 0.1):
+    prueba = l.adquirir()
+    l.liberar(segundos, exito, prueba)
+
+
+def test_crece_aditivamente_solo_con_el_limite_saturado():
+    l = limitador(inicial=2)
+
+    llamar(l)                       # 1 de 2 cupos: no crece
+    assert l.limite == 2
+
+    l.adquirir()
+    l.adquirir()
+    l.liberar(0.1, True)            # 2 de 2 cupos: +1/límite
+    assert l.limite == 2.5
+    l.liberar(0.1, True)
+    assert l.limite == 2.5
+
+
+def test_nunca_pasa_del_maximo():
+    l = limitador(inicial=3, maximo=3)
+    for _ in range(3):
+        l.adquirir()
+    l.liberar(0.1, True)
+
+    assert l.limite == 3
+
+
+def test_falla_reduce_multiplicativamente_hasta_el_minimo(monkeypatch):
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_FALLAS', 100)
+    l = limitador(inicial=8, minimo=2)
+
+    llamar(l, exito=False, segundos=0)
+    assert l.limite == 4
+    llamar(l, exito=False, segundos=0)
+    llamar(l, exito=False, segundos=0)
+    assert l.limite == 2 and l.estadisticas()['limite_min'] == 2
+
+
+def test_una_sola_reduccion_por_ronda(monkeypatch):
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_FALLAS', 100)
+    l = limitador(inicial=8)
+    llamar(l, segundos=60)          # Ronda = latencia de la última llamada exitosa
+
+    llamar(l, exito=False)
+    llamar(l, exito=False)
+
+    assert l.limite == 4 and l.reducciones == 1
+
+
+def test_respuesta_lenta_reduce_un_diez_por_ciento():
+    l = limitador(inicial=10)
+    for _ in range(5):
+        llamar(l, segundos=0.1)
+
+    llamar(l, segundos=0.1 * colector.SOAP_AIMD_TOLERANCIA * 2)
+
+    assert l.limite == pytest.approx(9)
+
+
+def test_adquirir_espera_un_cupo_libre():
+    l = limitador(inicial=1)
+    l.adquirir()
+    adquirido = threading.Event()
+
+    hilo = threading.Thread(target=lambda: (l.adquirir(), adquirido.set()))
+    hilo.start()
+    assert not adquirido.wait(0.1)
+
+    l.liberar(0.1, True)
+    assert adquirido.wait(2)
+    hilo.join()
+    assert l.en_vuelo == 1
+
+
+def test_circuito_abre_rechaza_y_cierra_con_la_prueba(monkeypatch):
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_FALLAS', 3)
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_ESPERA', 0)
+    l = limitador()
+
+    for _ in range(2):
+        llamar(l, exito=False)
+    assert l.estado == 'cerrado'
+    llamar(l, exito=False)
+    assert l.estado == 'abierto' and l.aperturas == 1
+
+    # Pasada la espera, una sola llamada de prueba; las demás se rechazan
+    assert l.adquirir() is True and l.estado == 'semiabierto'
+    with pytest.raises(colector.CircuitoAbierto):
+        l.adquirir()
+    l.liberar(0.1, True, prueba=True)
+
+    assert l.estado == 'cerrado' and l.rechazadas == 1 and l.en_vuelo == 0
+    assert l.adquirir() is False
+
+
+def test_circuito_abierto_rechaza_sin_ocupar_cupo(monkeypatch):
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_FALLAS', 1)
+    l = limitador()
+    llamar(l, exito=False)
+
+    with pytest.raises(colector.CircuitoAbierto):
+        l.adquirir()
+    assert l.en_vuelo == 0
+
+
+def test_prueba_fallida_reabre_el_circuito(monkeypatch):
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_FALLAS', 1)
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_ESPERA', 0)
+    l = limitador()
+    llamar(l, exito=False)
+
+    llamar(l, exito=False)          # La prueba falla
+
+    assert l.estado == 'abierto' and l.aperturas == 2
+
+
+def test_estadisticas_reinician_contadores_pero_no_el_limite(monkeypatch):
+    monkeypatch.setattr(colector, 'SOAP_CIRCUITO_FALLAS', 100)
+    l = limitador(inicial=8)
+    llamar(l, exito=False)
+
+    assert l.estadisticas(reiniciar=True)['reducciones'] == 1
+    assert l.estadisticas() == {'limite': 4, 'limite_min': 4, 'limite_max': 4, 'circuito': 'cerrado',
+                                'aperturas': 0, 'reducciones': 0, 'rechazadas': 0}
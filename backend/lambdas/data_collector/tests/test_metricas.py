@@ -0,0 +1,92 @@
+"""
+Métricas de ingesta: etapas exclusivas y registros en CloudWatch EMF
+"""
+
+import json
+import time
+
+import handler as colector
+
+
+def corrida_con_paginas() -> colector.MetricasIngesta:
+    metricas = colector.MetricasIngesta('ventas', 'PRUEBA')
+    token = colector._metricas_activas.set(metricas)
+    try:
+        for pagina in (1, 2):
+            with colector.pagina_ingesta(pagina, filas=10):
+                with colector.medir('parse'):
+                    with colector.medir('http'):
+                        time.sleep(0.01)
+                colector.contar(bytes=100, llamadas=1)
+        colector.contar(rechazadas=3)
+    finally:
+        colector._metricas_activas.reset(token)
+    metricas.limites_soap = {'api.prueba': {'limite': 4, 'circuito': 'cerrado'}}
+    metricas.finalizar({'statusCode': 200, 'body': json.dumps({'ventas': 20})})
+    return metricas
+
+
+def validar_emf(registro: dict):
+    """Forma que CloudWatch exige para extraer las métricas de la línea"""
+    aws = registro['_aws']
+    assert isinstance(aws['Timestamp'], int) and abs(aws['Timestamp'] / 1000 - time.time()) < 60
+    [directiva] = aws['CloudWatchMetrics']
+    assert directiva['Namespace'] == colector.METRICAS_NAMESPACE
+    for dimensiones in directiva['Dimensions']:
+        assert len(dimensiones) <= 30
+        assert all(isinstance(registro[d], str) for d in dimensiones)
+    assert len(directiva['Metrics']) <= 100
+    for metrica in directiva['Metrics']:
+        assert metrica['Unit'] in ('Seconds', 'Bytes', 'Count')
+        valor = registro[metrica['Name']]
+        assert isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def test_un_registro_por_corrida_y_por_pagina():
+    corrida, *paginas = corrida_con_paginas().emf()
+
+    for registro in [corrida] + paginas:
+        validar_emf(registro)
+    assert (corrida['Fuente'], corrida['Empresa'], corrida['Nivel']) == ('ventas', 'PRUEBA', 'corrida')
+    assert corrida['estado'] == 'ok' and corrida['paginas'] == 2 and corrida['duracion_s'] > 0
+    assert [(p['Nivel'], p['pagina'], p['filas'], p['bytes']) for p in paginas] == [('pagina', 1, 10, 100),
+                                                                                     ('pagina', 2, 10, 100)]
+    # Lo contado fuera de una página solo suma a la corrida
+    assert (corrida['filas'], corrida['rechazadas']) == (20, 3)
+    assert all(p['rechazadas'] == 0 for p in paginas)
+
+
+def test_pagina_no_es_dimension():
+    for registro in corrida_con_paginas().emf():
+        [directiva] = registro['_aws']['CloudWatchMetrics']
+        assert directiva['Dimensions'] == [['Fuente', 'Empresa', 'Nivel']]
+        assert 'pagina' not in {m['Name'] for m in directiva['Metrics']}
+
+
+def test_etapas_anidadas_se_descuentan():
+    metricas = corrida_con_paginas()
+
+    # La espera HTTP dentro del parseo no se cuenta dos veces
+    assert metricas.totales['http'] >= 0.02
+    assert metricas.totales['parse'] < metricas.totales['http']
+
+
+def test_publicar_imprime_una_linea_json_por_registro(capsys, monkeypatch):
+    monkeypatch.setattr(colector, 'METRICAS_PERSISTIR', False)
+
+    colector.publicar_metricas(corrida_con_paginas())
+
+    lineas = capsys.readouterr().out.splitlines()
+    assert len(lineas) == 3
+    for linea in lineas:
+        validar_emf(json.loads(linea))
+
+
+def test_corrida_con_error():
+    metricas = colector.MetricasIngesta('inventario', 'PRUEBA')
+    metricas.finalizar(error=RuntimeError('sin conexión'))
+
+    [corrida] = metricas.emf()
+
+    validar_emf(corrida)
+    assert corrida['estado'] == 'error' and corrida['http_s'] == 0
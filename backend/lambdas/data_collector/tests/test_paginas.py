@@ -0,0 +1,104 @@
+"""
+Paginación de inventario: páginas en vuelo, orden de entrega y última página
+"""
+
+import threading
+import time
+
+import pytest
+
+import handler as colector
+
+FILAS = 10
+
+
+class PaginasFalsas:
+    """_pagina_inventario falso: `total` items repartidos en páginas de FILAS"""
+
+    def __init__(self, total: int, demora: float = 0.0):
+        self.total = total
+        self.demora = demora
+        self.pedidas = []
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, fecha, bodega, pagina, filas):
+        with self._lock:
+            self.pedidas.append(pagina)
+            self.en_vuelo += 1
+            self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        # Las páginas altas responden antes: el orden de entrega no depende de la red
+        time.sleep(self.demora / pagina)
+        with self._lock:
+            self.en_vuelo -= 1
+        inicio = (pagina - 1) * filas
+        return [{'REFERENCIA': f"R{i}"} for i in range(inicio, min(inicio + filas, self.total))]
+
+
+@pytest.fixture
+def paginas(monkeypatch):
+    def instalar(total: int, demora: float = 0.0):
+        falsa = PaginasFalsas(total, demora)
+        monkeypatch.setattr(colector, '_pagina_inventario', falsa)
+        return falsa
+    return instalar
+
+
+def recorrer(concurrencia: int, pagina_inicio: int = 1) -> list:
+    return [(pagina, len(items)) for pagina, items in
+            colector.iter_paginas_inventario('2025-03-01', '', concurrencia, FILAS, pagina_inicio)]
+
+
+@pytest.mark.parametrize('concurrencia', [1, 2, 4])
+def test_entrega_en_orden_hasta_la_pagina_corta(paginas, concurrencia):
+    paginas(total=45, demora=0.02)
+
+    assert recorrer(concurrencia) == [(1, 10), (2, 10), (3, 10), (4, 10), (5, 5)]
+
+
+@pytest.mark.parametrize('concurrencia', [1, 3])
+def test_total_multiplo_de_la_pagina_termina_con_la_vacia(paginas, concurrencia):
+    falsa = paginas(total=30)
+
+    assert recorrer(concurrencia) == [(1, 10), (2, 10), (3, 10)]
+    assert 4 in falsa.pedidas
+
+
+def test_respeta_la_concurrencia(paginas):
+    falsa = paginas(total=200, demora=0.05)
+
+    assert len(recorrer(3)) == 20
+    assert falsa.max_en_vuelo <= 3
+    # Tras la página corta solo quedan en vuelo las ya pedidas
+    assert max(falsa.pedidas) <= 20 + 3
+
+
+def test_continua_desde_la_pagina_pedida(paginas):
+    falsa = paginas(total=45)
+
+    assert recorrer(2, pagina_inicio=4) == [(4, 10), (5, 5)]
+    assert min(falsa.pedidas) == 4
+
+
+@pytest.mark.parametrize('concurrencia', [1, 4])
+def test_limite_de_paginas(paginas, monkeypatch, concurrencia):
+    monkeypatch.setattr(colector, 'INVENTARIO_MAX_PAGINAS', 3)
+    falsa = paginas(total=1000)
+
+    assert recorrer(concurrencia) == [(1, 10), (2, 10), (3, 10)]
+    assert max(falsa.pedidas) == 3
+
+
+def test_error_de_una_pagina_se_propaga(paginas, monkeypatch):
+    falsa = paginas(total=100)
+
+    def fallar(fecha, bodega, pagina, filas):
+        if pagina == 3:
+            raise RuntimeError('página 3')
+        return falsa(fecha, bodega, pagina, filas)
+
+    monkeypatch.setattr(colector, '_pagina_inventario', fallar)
+
+    with pytest.raises(RuntimeError):
+        recorrer(2)
@@ -0,0 +1,54 @@
+"""
+Parser incremental de respuestas SOAP (streaming de ventas)
+"""
+
+import json
+from xml.sax.saxutils import escape
+
+import pytest
+
+import handler as colector
+from fake_soap_server import SOBRE_INVENTARIO, SOBRE_VENTAS
+
+REGISTROS = [{'NUMDOC': str(i), 'NOMREF': f"CAÑÓN {i} \"especial\"", 'VALTOT': i * 1.5} for i in range(23)]
+
+
+def trozos(datos: bytes, tamano: int) -> list:
+    return [datos[i:i + tamano] for i in range(0, len(datos), tamano)]
+
+
+def parsear(chunks, result_tag: str = 'GenerarInfoVentasResult', tamano_lote: int = 5) -> list:
+    return list(colector.parse_soap_stream(chunks, result_tag, tamano_lote))
+
+
+@pytest.mark.parametrize('tamano', [1, 2, 3, 7, 64, 10_000])
+def test_tokens_partidos_entre_chunks(tamano):
+    # Con 1 o 3 bytes se parten también los caracteres UTF-8 de dos bytes
+    datos = (json.dumps(REGISTROS, ensure_ascii=False) + SOBRE_VENTAS).encode('utf-8')
+
+    lotes = parsear(trozos(datos, tamano))
+
+    assert [len(lote) for lote in lotes] == [5, 5, 5, 5, 3]
+    assert [r for lote in lotes for r in lote] == REGISTROS
+
+
+def test_array_vacio():
+    assert parsear([b'[]', SOBRE_VENTAS.encode('utf-8')]) == []
+
+
+def test_json_escapado_dentro_del_xml_usa_el_fallback():
+    datos = SOBRE_INVENTARIO.format(resultado=escape(json.dumps(REGISTROS))).encode('utf-8')
+
+    lotes = parsear(trozos(datos, 16), 'GenerarInformacionInventariosResult')
+
+    assert [r for lote in lotes for r in lote] == REGISTROS
+
+
+@pytest.mark.parametrize('datos', [
+    json.dumps(REGISTROS)[:-200].encode('utf-8'),                     # Respuesta cortada
+    b'[{"NUMDOC": "1"}, {"NUMDOC": }]' + SOBRE_VENTAS.encode('utf-8'),  # Objeto malformado
+    b'[{"NUMDOC": "1"} {"NUMDOC": "2"}]',                             # Falta la coma
+])
+def test_respuesta_truncada_o_malformada_falla(datos):
+    with pytest.raises(ValueError):
+        parsear(trozos(datos, 7))
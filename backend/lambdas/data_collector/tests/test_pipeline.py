@@ -0,0 +1,126 @@
+"""
+Pipeline de inventario: descarga y escritura solapadas con cola acotada
+"""
+
+import threading
+import time
+
+import pytest
+
+import handler as colector
+
+FILAS = colector.INVENTARIO_FILAS_POR_PAGINA
+
+
+class Pipeline:
+    """Páginas falsas del feed y escrituras falsas en la BD"""
+
+    def __init__(self, paginas: int, ultima: int = 3, demora_descarga: float = 0.0, demora_escritura: float = 0.0):
+        self.paginas = paginas
+        self.ultima = ultima
+        self.demora_descarga = demora_descarga
+        self.demora_escritura = demora_escritura
+        self.descargadas = []
+        self.escritas = []
+        self.checkpoints = []
+        self.falla_en = None
+
+    def iterar(self, fecha, bodega, concurrencia, pagina_inicio=1):
+        for pagina in range(pagina_inicio, self.paginas + 1):
+            if pagina == self.falla_en:
+                raise RuntimeError(f"página {pagina}")
+            time.sleep(self.demora_descarga)
+            self.descargadas.append(pagina)
+            n = FILAS if pagina < self.paginas else self.ultima
+            yield pagina, [{'REFERENCIA': f"R{pagina}-{i}"} for i in range(n)]
+
+    def upsert(self, conn, items, fecha, commit=True):
+        time.sleep(self.demora_escritura)
+        self.escritas.append((items[0]['REFERENCIA'], len(items)))
+        return len(items)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    def instalar(**kwargs):
+        falso = Pipeline(**kwargs)
+        monkeypatch.setattr(colector, 'iter_paginas_inventario', falso.iterar)
+        monkeypatch.setattr(colector, 'upsert_inventario', falso.upsert)
+        monkeypatch.setattr(colector, 'guardar_productos', lambda conn, productos: len(productos))
+        monkeypatch.setattr(colector, 'guardar_checkpoint',
+                            lambda fuente, reanudar, progreso, conn=None: falso.checkpoints.append(reanudar))
+        return falso
+    return instalar
+
+
+def test_escribe_cada_pagina_en_orden(pipeline):
+    falso = pipeline(paginas=4)
+
+    totales = colector.pipeline_inventario(None, '2025-03-01', tamano_cola=2)
+
+    assert totales == {'paginas': 4, 'items': 3 * FILAS + 3, 'inventario': 3 * FILAS + 3,
+                       'productos': 3 * FILAS + 3}
+    assert [r for r, _ in falso.escritas] == ['R1-0', 'R2-0', 'R3-0', 'R4-0']
+    assert [c['pagina_inicio'] for c in falso.checkpoints] == [2, 3, 4, 5]
+
+
+def test_descarga_y_escritura_se_solapan(pipeline):
+    pipeline(paginas=6, demora_descarga=0.05, demora_escritura=0.05)
+
+    inicio = time.perf_counter()
+    colector.pipeline_inventario(None, '2025-03-01', tamano_cola=2)
+
+    # En serie serían 0.6 s; solapadas ~max(descarga, escritura) + una página
+    assert time.perf_counter() - inicio < 0.5
+
+
+def test_la_cola_acota_las_paginas_adelantadas(pipeline, monkeypatch):
+    falso = pipeline(paginas=10)
+    adelanto = []
+    upsert = falso.upsert
+
+    def upsert_lento(conn, items, fecha, commit=True):
+        time.sleep(0.05)    # El productor llena la cola mientras tanto
+        adelanto.append(len(falso.descargadas) - len(falso.escritas))
+        return upsert(conn, items, fecha, commit)
+
+    monkeypatch.setattr(colector, 'upsert_inventario', upsert_lento)
+    colector.pipeline_inventario(None, '2025-03-01', tamano_cola=2)
+
+    # Cola llena + la página que el productor tiene en la mano + la que se escribe
+    assert max(adelanto) <= 2 + 2
+
+
+def test_error_de_descarga_se_propaga(pipeline):
+    falso = pipeline(paginas=5)
+    falso.falla_en = 3
+
+    with pytest.raises(RuntimeError, match='página 3'):
+        colector.pipeline_inventario(None, '2025-03-01')
+    assert [r for r, _ in falso.escritas] == ['R1-0', 'R2-0']
+
+
+def test_error_de_escritura_detiene_al_productor(pipeline, monkeypatch):
+    falso = pipeline(paginas=50)
+
+    def fallar(conn, items, fecha, commit=True):
+        raise RuntimeError('escritura')
+
+    monkeypatch.setattr(colector, 'upsert_inventario', fallar)
+    with pytest.raises(RuntimeError, match='escritura'):
+        colector.pipeline_inventario(None, '2025-03-01', tamano_cola=1)
+
+    productores = [h for h in threading.enumerate() if h.name == 'inventario-productor']
+    for hilo in productores:
+        hilo.join(3)
+    assert not any(h.is_alive() for h in productores)
+    assert len(falso.descargadas) < 50
+
+
+def test_plazo_vencido_deja_la_siguiente_pagina(pipeline, monkeypatch):
+    pipeline(paginas=5)
+    monkeypatch.setattr(colector, 'plazo_vencido', lambda: True)
+
+    totales = colector.pipeline_inventario(None, '2025-03-01', pagina_inicio=2)
+
+    assert totales['paginas'] == 1 and totales['siguiente_pagina'] == 3
@@ -0,0 +1,85 @@
+"""
+Prefiltro de ventas ya cargadas: hash de la clave e índice de la ventana
+"""
+
+from array import array
+
+import pytest
+
+import handler as colector
+from conftest import consultar
+
+
+def venta(documento: str, referencia: str = 'R1', fecha: str = '2025-03-01', prefijo: str = 'FV') -> dict:
+    return {'TIPMOV': 'FV', 'PREFIJO': prefijo, 'NUMDOC': documento, 'FECHA': fecha, 'HORA': '10:00:00',
+            'BODEGA': '0001', 'REFER': referencia, 'CANTID': 1, 'VALUND': 100, 'VALTOT': 100}
+
+
+def indice(*cargadas) -> colector.IndiceVentas:
+    """Índice de 2025-03-01 a 2025-03-02 con las ventas dadas ya en la BD"""
+    nuevo = colector.IndiceVentas('2025-03-01', '2025-03-02')
+    nuevo._claves = array('q', sorted(colector.clave_venta(v['PREFIJO'], v['NUMDOC'], v['REFER']) for v in cargadas))
+    return nuevo
+
+
+def documentos(ventas: list) -> list:
+    return [v['NUMDOC'] for v in ventas]
+
+
+def test_clave_es_un_bigint_con_signo():
+    claves = {colector.clave_venta('FV', str(i), 'R1') for i in range(2000)}
+
+    assert len(claves) == 2000
+    assert all(-2 ** 63 <= c < 2 ** 63 for c in claves) and min(claves) < 0 < max(claves)
+    # El separador evita que ('A', '1') y ('A1', '') coincidan por concatenación
+    assert colector.clave_venta('A', '1', 'R') != colector.clave_venta('A1', '', 'R')
+
+
+def test_descarta_solo_las_ya_cargadas():
+    ventas = [venta('1'), venta('2'), venta('3', fecha='2025-03-02T00:00:00')]
+
+    pendientes, claves = indice(venta('2'), venta('3')).filtrar(ventas)
+
+    assert documentos(pendientes) == ['1'] and claves == [colector.clave_venta('FV', '1', 'R1')]
+
+
+def test_fuera_de_la_ventana_o_clave_incompleta_pasan_sin_filtrar():
+    cargada = venta('1')
+    ventas = [venta('1', fecha='2025-03-03'), dict(venta('1'), PREFIJO=None), dict(venta('1'), FECHA=None)]
+
+    pendientes, claves = indice(cargada).filtrar(ventas)
+
+    assert len(pendientes) == 3 and claves == []
+
+
+def test_confirmadas_se_filtran_en_lotes_siguientes():
+    idx = indice()
+    pendientes, claves = idx.filtrar([venta('1'), venta('2')])
+
+    idx.confirmar(claves, 2)
+
+    assert idx.filtrar([venta('1'), venta('3')])[0] == [venta('3')]
+    assert idx.resumen() == {'recibidas': 4, 'filtradas': 1, 'enviadas': 3, 'insertadas': 2}
+
+
+def test_sin_confirmar_no_se_filtran():
+    idx = indice()
+    idx.filtrar([venta('1')])     # Escritura fallida: no se confirma
+
+    assert documentos(idx.filtrar([venta('1')])[0]) == ['1']
+
+
+# ============================================
+# BASE DE DATOS
+# ============================================
+
+@pytest.mark.parametrize('prefijo, documento, referencia', [
+    ('FV', '1', 'R1'), ('FE', '00012345', 'CAÑÓN-Ñ'), ('', '', ''), ('P|X', '1|2', 'R'),
+])
+def test_clave_igual_a_la_de_sql(conn, prefijo, documento, referencia):
+    [(clave,)] = consultar(conn, f"""
+        SELECT {colector.SQL_CLAVE_VENTA}
+        FROM (VALUES (%s, %s, %s)) AS v(prefijo, numero_documento, referencia)
+    """, (prefijo, documento, referencia))
+
+    assert clave == colector.clave_venta(prefijo, documento, referencia)
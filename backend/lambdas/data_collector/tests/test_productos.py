@@ -0,0 +1,70 @@
+"""
+Productos: registro compartido entre ventas e inventario
+"""
+
+import handler as colector
+from conftest import consultar
+
+
+def producto_venta(referencia: str = 'R1', nombre: str = 'DE VENTAS') -> dict:
+    return {'REFER': referencia, 'NOMREF': nombre, 'UNDMED': None}
+
+
+def producto_inventario(referencia: str = 'R1') -> dict:
+    return {'REFERENCIA': referencia, 'CODIGO': '302402270', 'NOMBRE': 'DE INVENTARIO',
+            'UNIDADMED': '94-und', 'CLASE': 'A', 'GRUPO': 'G1', 'LINEA': 'L1'}
+
+
+def fila_producto(conn, referencia: str = 'R1') -> tuple:
+    return consultar(conn, """
+        SELECT codigo, nombre, unidad_medida, clase, grupo, linea FROM productos WHERE referencia = %s
+    """, (referencia,))[0]
+
+
+def test_inventario_completa_lo_que_ventas_escribio_antes(conn):
+    registro = colector.RegistroProductos()
+
+    assert registro.escribir(conn, [producto_venta()]) == 1
+    assert registro.escribir(conn, [producto_inventario()]) == 1
+
+    assert fila_producto(conn) == ('302402270', 'DE INVENTARIO', '94-und', 'A', 'G1', 'L1')
+
+
+def test_ventas_posteriores_no_pisan_lo_de_inventario(conn):
+    registro = colector.RegistroProductos()
+
+    registro.escribir(conn, [producto_inventario()])
+    assert registro.escribir(conn, [producto_venta(), producto_venta(nombre='OTRO')]) == 0
+
+    assert fila_producto(conn) == ('302402270', 'DE INVENTARIO', '94-und', 'A', 'G1', 'L1')
+    assert registro.resumen() == {'recibidos': 3, 'referencias': 1, 'escritos': 1}
+
+
+def test_lote_mixto_se_fusiona_antes_de_escribir(conn):
+    registro = colector.RegistroProductos()
+
+    registro.escribir(conn, [producto_venta(), producto_inventario(), producto_venta(nombre=None)])
+
+    assert fila_producto(conn) == ('302402270', 'DE INVENTARIO', '94-und', 'A', 'G1', 'L1')
+
+
+def test_registros_incompletos_no_alternan_con_los_completos(conn, monkeypatch):
+    monkeypatch.setattr(colector.catalogo_productos, 'ttl', 0)
+
+    assert colector.upsert_productos(conn, [producto_inventario()]) == 1
+    for _ in range(2):
+        assert colector.upsert_productos(conn, [producto_venta(nombre=None)]) == 0
+        assert colector.upsert_productos(conn, [producto_inventario()]) == 0
+
+    assert fila_producto(conn) == ('302402270', 'DE INVENTARIO', '94-und', 'A', 'G1', 'L1')
+
+
+def test_catalogo_descarta_registros_incompletos_sin_ir_a_la_bd(conn):
+    colector.upsert_productos(conn, [producto_inventario()])
+    colector.catalogo_productos.estadisticas(reiniciar=True)
+
+    assert colector.upsert_productos(conn, [producto_venta(nombre=None), producto_inventario()]) == 0
+    assert colector.upsert_productos(conn, [producto_venta(nombre='NUEVO')]) == 1
+
+    assert colector.catalogo_productos.estadisticas()['sin_cambios'] == 2
+    assert fila_producto(conn)[:2] == ('302402270', 'NUEVO')
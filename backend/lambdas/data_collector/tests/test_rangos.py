@@ -0,0 +1,161 @@
+"""
+Planificación y partición de rangos de fechas de ventas
+"""
+
+import pytest
+import requests
+
+import handler as colector
+
+
+class ApiVentas:
+    """call_soap_ventas falso: `filas_dia` ventas por día; falla los rangos de más de `max_dias` días"""
+
+    def __init__(self, filas_dia: int = 10, max_dias: int = 31, error=requests.exceptions.Timeout):
+        self.filas_dia = filas_dia
+        self.max_dias = max_dias
+        self.error = error
+        self.llamadas = []
+
+    def __call__(self, inicio, fin, token, timeout=None):
+        self.llamadas.append((inicio, fin))
+        dias = colector._dias_rango(inicio, fin)
+        if dias > self.max_dias:
+            raise self.error(f"{inicio} a {fin}")
+        return [{'FECHA': inicio, 'NUMDOC': str(i)} for i in range(self.filas_dia * dias)]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    def instalar(**kwargs):
+        falsa = ApiVentas(**kwargs)
+        monkeypatch.setattr(colector, 'call_soap_ventas', falsa)
+        return falsa
+    return instalar
+
+
+def rangos(resultados) -> list:
+    return [(inicio, fin) for inicio, fin, _ in resultados]
+
+
+# ============================================
+# DIVISIÓN ADAPTATIVA
+# ============================================
+
+def test_sin_historial_pide_el_rango_completo():
+    assert colector.planificar_rangos('2025-01-20', '2025-03-05', {}) == [('2025-01-20', '2025-03-05')]
+
+
+def test_con_historial_corta_en_los_meses_con_sus_dias():
+    granularidad = {'2025-01': 7, '2025-02': 14}
+
+    assert colector.planificar_rangos('2025-01-20', '2025-03-05', granularidad) == [
+        ('2025-01-20', '2025-01-26'), ('2025-01-27', '2025-01-31'),
+        ('2025-02-01', '2025-02-14'), ('2025-02-15', '2025-02-28'),
+        ('2025-03-01', '2025-03-05'),
+    ]
+
+
+def test_timeout_parte_a_la_mitad_y_entrega_en_orden(api):
+    falsa = api(max_dias=4)
+    aprendido = {}
+
+    resultados = list(colector.iter_ventas_adaptativo('2025-03-01', '2025-03-16', aprendido=aprendido))
+
+    assert rangos(resultados) == [('2025-03-01', '2025-03-04'), ('2025-03-05', '2025-03-08'),
+                                  ('2025-03-09', '2025-03-12'), ('2025-03-13', '2025-03-16')]
+    assert sum(len(ventas) for _, _, ventas in resultados) == 160
+    assert falsa.llamadas[:3] == [('2025-03-01', '2025-03-16'), ('2025-03-01', '2025-03-08'),
+                                  ('2025-03-01', '2025-03-04')]
+    # Se aprende el mayor rango exitoso por debajo del menor que falló (8 días)
+    assert aprendido['2025-03']['dias'] == 4
+
+
+def test_rango_impar_no_pierde_ni_repite_dias(api):
+    api(max_dias=2, error=requests.exceptions.ConnectionError)
+
+    resultados = rangos(colector.iter_ventas_adaptativo('2025-02-26', '2025-03-04'))
+
+    dias = [colector._sumar_dias(inicio, i) for inicio, fin in resultados
+            for i in range(colector._dias_rango(inicio, fin))]
+    assert dias == [colector._sumar_dias('2025-02-26', i) for i in range(7)]
+    assert all(colector._dias_rango(inicio, fin) <= 2 for inicio, fin in resultados)
+
+
+def test_demasiadas_filas_parten_el_rango(api):
+    api(filas_dia=10)
+
+    resultados = rangos(colector.iter_ventas_adaptativo('2025-03-01', '2025-03-08', max_filas=25))
+
+    assert resultados == [('2025-03-01', '2025-03-02'), ('2025-03-03', '2025-03-04'),
+                          ('2025-03-05', '2025-03-06'), ('2025-03-07', '2025-03-08')]
+
+
+def test_un_dia_con_demasiadas_filas_se_entrega_igual(api):
+    api(filas_dia=50)
+
+    [(inicio, fin, ventas)] = colector.iter_ventas_adaptativo('2025-03-01', '2025-03-01', max_filas=25)
+
+    assert (inicio, fin, len(ventas)) == ('2025-03-01', '2025-03-01', 50)
+
+
+def test_un_dia_que_sigue_fallando_propaga_el_error(api):
+    api(max_dias=0)
+
+    with pytest.raises(requests.exceptions.Timeout):
+        list(colector.iter_ventas_adaptativo('2025-03-01', '2025-03-02'))
+
+
+def test_con_holgura_amplia_el_rango_aprendido(api):
+    api(filas_dia=1)
+    aprendido = {}
+
+    list(colector.iter_ventas_adaptativo('2025-03-01', '2025-03-10', {'2025-03': 5}, max_filas=100,
+                                         aprendido=aprendido))
+
+    assert aprendido['2025-03']['dias'] == 10
+
+
+# ============================================
+# TRAMOS EN PARALELO
+# ============================================
+
+@pytest.mark.parametrize('inicio, fin, dias, esperados', [
+    ('2025-03-01', '2025-03-01', 7, [('2025-03-01', '2025-03-01')]),
+    ('2025-03-01', '2025-03-06', 3, [('2025-03-01', '2025-03-03'), ('2025-03-04', '2025-03-06')]),
+    ('2024-02-27', '2024-03-02', 2, [('2024-02-27', '2024-02-28'), ('2024-02-29', '2024-03-01'),
+                                     ('2024-03-02', '2024-03-02')]),
+    ('2025-03-01', '2025-03-02', 0, [('2025-03-01', '2025-03-01'), ('2025-03-02', '2025-03-02')]),
+    ('2025-03-02', '2025-03-01', 1, []),
+])
+def test_planificar_tramos(inicio, fin, dias, esperados):
+    assert colector.planificar_tramos(inicio, fin, dias) == esperados
+
+
+def test_tramos_fallidos_no_detienen_al_resto(api):
+    falsa = api(max_dias=1)
+    errores = {}
+
+    resultados = list(colector.iter_ventas_tramos('2025-03-01', '2025-03-05', 2, 3, errores))
+
+    assert sorted(rangos(resultados)) == [('2025-03-05', '2025-03-05')]
+    assert sorted(errores) == [('2025-03-01', '2025-03-02'), ('2025-03-03', '2025-03-04')]
+    assert len(falsa.llamadas) == 3
+
+
+def test_sin_dict_de_errores_el_primero_se_propaga(api):
+    api(max_dias=0)
+
+    with pytest.raises(requests.exceptions.Timeout):
+        list(colector.iter_ventas_tramos('2025-03-01', '2025-03-03', 1, 2))
+
+
+def test_tramos_con_plazo_vencido_quedan_pendientes(api, monkeypatch):
+    api()
+    monkeypatch.setattr(colector, 'plazo_vencido', lambda: True)
+    restantes = []
+
+    resultados = list(colector.iter_ventas_tramos('2025-03-01', '2025-03-03', 1, 2, {}, restantes))
+
+    assert resultados == [] and restantes == [('2025-03-01', '2025-03-01'), ('2025-03-02', '2025-03-02'),
+                                              ('2025-03-03', '2025-03-03')]
@@ -0,0 +1,106 @@
+"""
+Cliente SOAP: sesión por host, límite de tasa y reintentos
+"""
+
+import time
+import threading
+import contextvars
+from urllib.parse import urlsplit
+
+import handler as colector
+
+
+class TasaContada:
+    """Limitador de tasa que solo cuenta los tokens pedidos"""
+
+    def __init__(self):
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        with self._lock:
+            self.tokens += 1
+
+
+def test_tasa_cobra_un_token_por_llamada_http(api_falsa, monkeypatch):
+    tasa = TasaContada()
+    monkeypatch.setattr(colector.soap_client, 'tasa', tasa)
+    llamadas_antes = api_falsa.llamadas
+
+    tramos = list(colector.iter_ventas_tramos('2025-03-01', '2025-03-03', dias=1, concurrencia=2))
+    with colector.soap_client.llamar_stream(colector.VENTAS_API_URL, 'GenerarInfoVentas',
+                                            colector._sobre_ventas('2025-03-04', '2025-03-04', 'x')) as chunks:
+        for _ in chunks:
+            pass
+
+    assert len(tramos) == 3
+    assert tasa.tokens == api_falsa.llamadas - llamadas_antes == 4
+
+
+def test_streaming_libera_el_cupo_al_terminar_la_lectura(api_falsa):
+    empresa = colector.ConfigEmpresa('PRUEBA', llamadas_soap=1)
+    cliente = colector.SoapClient(adaptativo=True)
+
+    def consumir():
+        colector._empresa_actual.set(empresa)
+        with cliente.llamar_stream(colector.VENTAS_API_URL, 'GenerarInfoVentas',
+                                   colector._sobre_ventas('2025-03-01', '2025-03-01', 'x')) as chunks:
+            for _ in chunks:
+                time.sleep(0.2)     # Escritura en la BD del consumidor
+            # La lectura terminó: el cupo ya está libre aunque el bloque siga abierto
+            assert empresa._semaforo.acquire(blocking=False)
+            empresa._semaforo.release()
+
+    contextvars.copy_context().run(consumir)
+
+    [llamada] = cliente.llamadas
+    assert llamada['status'] == 200 and llamada['segundos'] < 0.2
+    limitador = cliente._limitadores[urlsplit(colector.VENTAS_API_URL).netloc]
+    assert limitador.en_vuelo == 0 and limitador._latencias[-1] < 0.2
+
+
+def test_sesion_adaptativa_no_reintenta():
+    assert colector.SoapClient(adaptativo=True).sesion('http://a/').get_adapter('http://a/').max_retries.total == 0
+    assert colector.SoapClient(adaptativo=False).sesion('http://a/').get_adapter('http://a/').max_retries.total == 3
+
+
+def test_streaming_adaptativo_reintenta_la_apertura(api_falsa, monkeypatch):
+    cliente = colector.SoapClient(adaptativo=True)
+    abrir = cliente._llamar_stream
+    intentos = []
+
+    def abrir_con_falla(*args):
+        # La primera llamada recibe un 500 del servidor; la segunda sale bien
+        api_falsa.config.tasa_error = 0.0 if intentos else 1.0
+        intentos.append(1)
+        return abrir(*args)
+
+    monkeypatch.setattr(api_falsa.config, 'tasa_error', 0.0)
+    monkeypatch.setattr(cliente, '_llamar_stream', abrir_con_falla)
+    monkeypatch.setattr(colector.time, 'sleep', lambda segundos: None)     # Backoff entre intentos
+    with cliente.llamar_stream(colector.VENTAS_API_URL, 'GenerarInfoVentas',
+                               colector._sobre_ventas('2025-03-01', '2025-03-01', 'x')) as chunks:
+        datos = b''.join(chunks)
+
+    assert len(intentos) == 2 and datos.startswith(b'[{')
+    assert [llamada['status'] for llamada in cliente.llamadas] == [500, 200]
+
+
+def test_una_sesion_por_host():
+    cliente = colector.SoapClient(pool_maxsize=7)
+
+    assert cliente.sesion('http://a/srvAPI.asmx') is cliente.sesion('http://a/otra')
+    assert cliente.sesion('http://a/') is not cliente.sesion('http://b/')
+    assert cliente.sesion('http://a/').get_adapter('http://a/')._pool_maxsize == 7
+
+
+def test_llamadas_seguidas_reutilizan_la_conexion(api_falsa):
+    cliente = colector.SoapClient(adaptativo=False)
+
+    for dia in ('2025-03-01', '2025-03-02', '2025-03-03'):
+        cliente.llamar(colector.VENTAS_API_URL, 'GenerarInfoVentas', colector._sobre_ventas(dia, dia, 'x'))
+
+    adaptador = cliente.sesion(colector.VENTAS_API_URL).get_adapter(colector.VENTAS_API_URL)
+    [clave] = adaptador.poolmanager.pools.keys()
+    pool = adaptador.poolmanager.pools[clave]
+    assert pool.num_connections == 1 and pool.num_requests == 3
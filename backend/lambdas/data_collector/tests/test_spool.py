@@ -0,0 +1,51 @@
+"""
+Spool de páginas: separación por empresa
+"""
+
+import sqlite3
+import contextvars
+
+import handler as colector
+from conftest import consultar
+
+
+def test_cada_empresa_toma_solo_sus_paginas(tmp_path):
+    spool = colector.SpoolIngesta(str(tmp_path))
+    spool.encolar('EMPRESA_A', 'ventas', 'ventas|2025-03-01', '2025-03-01', [{'NUMDOC': 'A1'}])
+    spool.encolar('EMPRESA_B', 'ventas', 'ventas|2025-03-01', '2025-03-01', [{'NUMDOC': 'B1'}, {'NUMDOC': 'B2'}])
+
+    [(_, _, registros)] = spool.tomar('EMPRESA_A', 'ventas')
+
+    assert registros == [{'NUMDOC': 'A1'}]
+    assert spool.pendientes('EMPRESA_B') == {'ventas': {'paginas': 1, 'filas': 2}}
+
+
+def test_spool_sin_empresa_se_migra_a_la_empresa_por_defecto(tmp_path):
+    anterior = sqlite3.connect(str(tmp_path / 'spool.db'))
+    anterior.execute("""
+        CREATE TABLE paginas (id INTEGER PRIMARY KEY AUTOINCREMENT, fuente TEXT NOT NULL,
+                              clave TEXT NOT NULL UNIQUE, fecha TEXT NOT NULL, filas INTEGER NOT NULL,
+                              contenido BLOB NOT NULL, encolada REAL NOT NULL)
+    """)
+    anterior.commit()
+    anterior.close()
+
+    spool = colector.SpoolIngesta(str(tmp_path))
+    spool.encolar(colector.EMPRESA, 'inventario', 'inv|0001', '2025-03-01', [{'BODEGA': '0001'}])
+
+    assert spool.pendientes(colector.EMPRESA) == {'inventario': {'paginas': 1, 'filas': 1}}
+
+
+def test_ingesta_con_spool_no_carga_paginas_de_otra_empresa(conn, tmp_path):
+    spool = colector.SpoolIngesta(str(tmp_path))
+    spool.encolar('OTRA', 'ventas', 'ventas|2025-03-01', '2025-03-01', [{'NUMDOC': 'X'}])
+
+    def ingestar():
+        colector._empresa_actual.set(colector.ConfigEmpresa('PROPIA'))
+        return colector.ingestar_con_spool('ventas', iter(()), spool)
+
+    resultado = contextvars.copy_context().run(ingestar)
+
+    assert resultado['error'] is None and resultado['carga']['paginas'] == 0
+    assert spool.pendientes('OTRA') == {'ventas': {'paginas': 1, 'filas': 1}}
+    assert consultar(conn, "SELECT COUNT(*) FROM ventas") == [(0,)]
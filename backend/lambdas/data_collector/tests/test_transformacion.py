@@ -0,0 +1,78 @@
+"""
+Transformación columnar contra la conversión previa fila por fila con Decimal(str())
+"""
+
+from decimal import Decimal
+
+import handler as colector
+from bench_transform import fila_inventario_previa, fila_venta_previa, generar_inventario, generar_ventas
+
+# Casos de borde: claves ausentes (0), números como texto, 1 y 1.0 en la misma
+# columna, hora vacía, observación con espacios
+VENTAS_BORDE = [
+    {'TIPMOV': 'FV', 'PREFIJO': 'FE', 'NUMDOC': '1', 'FECHA': '2025-03-01', 'HORA': '', 'REFER': 'R1',
+     'BODEGA': '0001', 'CANTID': 1, 'VALUND': '12.50', 'VALTOT': 1.0, 'PORIVA': 19},
+    {'TIPMOV': 'FV', 'PREFIJO': 'FE', 'NUMDOC': '2', 'FECHA': '2025-03-01', 'HORA': '10:00:00', 'REFER': 'R2',
+     'BODEGA': '0001', 'CANTID': 1.0, 'VALUND': 0.1, 'VALTOT': 1, 'PORDES': 1e-05, 'VCOSTO': -3},
+]
+INVENTARIO_BORDE = [
+    {'BODEGA': '0001', 'REFERENCIA': 'R1', 'CANTIDAD': '7', 'OBSERV1': '  AGOTADO  '},
+    {'BODEGA': '0002', 'REFERENCIA': 'R2', 'VCOSTO': 2.675, 'VVENTA': 3, 'OBSERV1': '   '},
+]
+
+
+def comparar_copy(lineas, filas_previas: list, tipos: tuple):
+    """Mismo valor por campo; los números pueden diferir en notación ('1e-05' vs '0.00001')"""
+    lineas = list(lineas)
+    assert len(lineas) == len(filas_previas)
+    for linea, fila in zip(lineas, filas_previas):
+        campos = linea[:-1].split('\t')
+        for campo, valor, tipo in zip(campos, fila, tipos):
+            if tipo == colector.NUMERO:
+                assert Decimal(campo) == valor
+            else:
+                assert campo == colector._valor_copy(valor)
+
+
+def test_ventas_igual_que_fila_por_fila():
+    ventas = generar_ventas(2_000) + VENTAS_BORDE
+
+    filas = colector.TransformadorLote(colector.CAMPOS_VENTAS).transformar(ventas).filas()
+
+    assert filas == [fila_venta_previa(v) for v in ventas]
+
+
+def test_inventario_igual_que_fila_por_fila_con_fecha_constante():
+    inventario = generar_inventario(2_000) + INVENTARIO_BORDE
+
+    filas = colector.TransformadorLote(colector.CAMPOS_INVENTARIO).transformar(inventario).filas('2025-03-01')
+
+    assert filas == [('2025-03-01',) + fila_inventario_previa(i) for i in inventario]
+
+
+def test_copy_igual_que_fila_por_fila():
+    ventas = generar_ventas(500) + VENTAS_BORDE
+    inventario = generar_inventario(500) + INVENTARIO_BORDE
+
+    for campos, registros, previa in ((colector.CAMPOS_VENTAS, ventas, fila_venta_previa),
+                                      (colector.CAMPOS_INVENTARIO, inventario, fila_inventario_previa)):
+        lote = colector.TransformadorLote(campos).transformar(registros)
+        filas_previas = [previa(r) for r in registros]
+        comparar_copy(lote.lineas_copy(), filas_previas, lote.tipos)
+
+
+def test_codigos_internados_se_comparten_entre_paginas():
+    transformador = colector.TransformadorLote(colector.CAMPOS_VENTAS)
+    bodega = ''.join(['00', '01'])     # Instancia distinta de la literal '0001'
+
+    primera = transformador.transformar([dict(VENTAS_BORDE[0], BODEGA=bodega)])
+    segunda = transformador.transformar([dict(VENTAS_BORDE[1], BODEGA=''.join(['00', '01']))])
+
+    assert primera.columna('bodega_codigo')[0] is segunda.columna('bodega_codigo')[0]
+
+
+def test_seleccionar_conserva_el_orden_de_las_filas():
+    lote = colector.TransformadorLote(colector.CAMPOS_VENTAS).transformar(VENTAS_BORDE)
+
+    assert lote.seleccionar([1]).filas() == [fila_venta_previa(VENTAS_BORDE[1])]
+    assert len(lote.seleccionar([])) == 0
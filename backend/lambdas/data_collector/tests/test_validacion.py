@@ -0,0 +1,115 @@
+"""
+Validación fila por fila, cuarentena y su interacción con el prefiltro y el delta
+"""
+
+import pytest
+
+import handler as colector
+from conftest import consultar
+
+
+@pytest.fixture
+def validacion(monkeypatch):
+    monkeypatch.setattr(colector, 'VALIDACION_FILAS', True)
+
+
+def item(referencia: str, cantidad=5, bodega: str = '0001') -> dict:
+    return {'BODEGA': bodega, 'REFERENCIA': referencia, 'NOMREF': referencia, 'CANTIDAD': cantidad,
+            'VCOSTO': 10, 'VVENTA': 12, 'OBSERV1': ''}
+
+
+def venta(documento: str, referencia: str) -> dict:
+    return {'TIPMOV': 'FV', 'PREFIJO': 'FV', 'NUMDOC': documento, 'FECHA': '2025-03-01', 'HORA': '10:00:00',
+            'BODEGA': '0001', 'REFER': referencia, 'CANTID': 1, 'VALUND': 100, 'VALTOT': 100}
+
+
+@pytest.mark.parametrize('valor', ['NaN', 'sNaN', '-nan', 'Infinity', float('nan'), float('inf')])
+def test_no_finitos_no_son_numeros_validos(valor):
+    assert not colector._numero_valido(valor, colector.LIMITE_NUMERICO)
+
+
+def test_cantidad_nan_va_a_cuarentena(conn, validacion):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+
+    escritas = colector.upsert_inventario(conn, [item('R1'), item('R2', cantidad='NaN')], '2025-03-01')
+
+    assert escritas == 1
+    assert consultar(conn, "SELECT clave FROM cuarentena_ingesta") == [('0001/R2',)]
+
+
+def test_commit_por_posicion_deja_la_cuarentena_en_la_transaccion(conn, validacion):
+    colector.upsert_productos(conn, [item('R1')])
+
+    colector.upsert_inventario(conn, [item('R1'), item('R1', bodega='9999')], '2025-03-01', False)
+    conn.rollback()
+
+    assert consultar(conn, "SELECT COUNT(*) FROM cuarentena_ingesta") == [(0,)]
+    assert consultar(conn, "SELECT COUNT(*) FROM inventario_actual") == [(0,)]
+
+
+def test_particion_del_lote_no_repite_el_prefiltro(conn, validacion):
+    colector.upsert_productos(conn, [item('R1')])
+    indice = colector.IndiceVentas('2025-03-01', '2025-03-01')
+    indice.cargar(conn)
+    token = colector._indice_ventas.set(indice)
+    try:
+        # R404 no existe en productos: la BD la rechaza y el lote se parte
+        insertadas = colector.insert_ventas(conn, [venta('1', 'R1'), venta('2', 'R1'), venta('3', 'R404'),
+                                                   venta('4', 'R1')])
+    finally:
+        colector._indice_ventas.reset(token)
+
+    assert insertadas == 3
+    assert indice.resumen() == {'recibidas': 4, 'filtradas': 0, 'enviadas': 4, 'insertadas': 3}
+    assert consultar(conn, "SELECT clave FROM cuarentena_ingesta") == [('FV/3/R404',)]
+
+
+def test_delta_no_pone_en_cero_filas_rechazadas(conn, validacion):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+    colector.upsert_inventario(conn, [item('R1'), item('R2')], '2025-03-01')
+
+    sincronizador = colector.SincronizadorDelta(conn, '2025-03-02', '0001')
+    sincronizador.procesar(conn, [item('R1'), item('R2', cantidad='NaN')])
+    sincronizador.finalizar(conn)
+
+    assert sincronizador.eliminados == 0
+    assert consultar(conn, "SELECT referencia, cantidad FROM inventario_actual ORDER BY referencia") == [
+        ('R1', 5), ('R2', 5)]
+
+
+def test_particion_de_productos_con_catalogo_frio(conn, validacion):
+    # El catálogo se carga dentro del savepoint: no puede confirmarlo antes del fallo
+    assert colector.catalogo_productos.activo
+    productos = [item('R1'), dict(item('R2'), MARCA='NO-EXISTE'), item('R3'), item('R4')]
+
+    assert colector.upsert_productos(conn, productos) == 3
+
+    assert consultar(conn, "SELECT referencia FROM productos ORDER BY referencia") == [('R1',), ('R3',), ('R4',)]
+    assert consultar(conn, "SELECT registro->>'MARCA' FROM cuarentena_ingesta") == [('NO-EXISTE',)]
+
+
+def test_observacion_larga_va_a_cuarentena(conn, validacion):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+    # La observación se guarda sin espacios: 50 caracteres con relleno caben
+    items = [dict(item('R1'), OBSERV1='  ' + 'A' * 50 + '  '), dict(item('R2'), OBSERV1='B' * 51)]
+
+    assert colector.upsert_inventario(conn, items, '2025-03-01') == 1
+    assert consultar(conn, "SELECT clave, motivo FROM cuarentena_ingesta") == [
+        ('0001/R2', 'OBSERV1 excede 50 caracteres')]
+
+
+def test_delta_aisla_las_filas_que_rechaza_la_bd(conn, validacion):
+    colector.upsert_productos(conn, [item('R1'), item('R2')])
+    sincronizador = colector.SincronizadorDelta(conn, '2025-03-01', '0001')
+
+    # R404 no existe en productos: la BD la rechaza y el lote se parte
+    escritas = sincronizador.procesar(conn, [item('R1'), item('R404'), item('R2')])
+
+    assert escritas == 2
+    assert consultar(conn, "SELECT referencia FROM inventario_actual ORDER BY 1") == [('R1',), ('R2',)]
+    assert consultar(conn, "SELECT clave FROM cuarentena_ingesta") == [('0001/R404',)]
+    # Sin huella de la fila rechazada: cuando exista el producto se escribe
+    assert sincronizador.resumen()['nuevos'] == 2 and ('0001', 'R404') not in sincronizador.huellas
+    colector.upsert_productos(conn, [item('R404')])
+    assert sincronizador.procesar(conn, [item('R1'), item('R404')]) == 1
+    assert sincronizador.finalizar(conn) == 0
@@ -0,0 +1,47 @@
+"""
+Watermark de ventas: filtro de lo ya ingerido y extracción incremental
+"""
+
+from datetime import datetime
+
+import handler as colector
+from conftest import consultar
+
+
+def venta(fecha: str, hora: str, prefijo: str = 'FV', documento: str = '1') -> dict:
+    return {'FECHA': fecha, 'HORA': hora, 'PREFIJO': prefijo, 'NUMDOC': documento, 'REFER': 'R1'}
+
+
+def test_mismo_segundo_no_descarta_documentos_que_ordenan_antes_como_texto():
+    watermark = ('2025-03-01', '10:00:00', 'FV', '9')
+    ventas = [venta('2025-03-01', '10:00:00', 'FV', '10'), venta('2025-03-01', '10:00:00', 'AB', '9')]
+
+    assert colector.filtrar_posteriores_watermark(ventas, watermark) == ventas
+
+
+def test_descarta_solo_segundos_anteriores_al_watermark():
+    watermark = ('2025-03-01', '10:00:00', 'FV', '9')
+    ventas = [venta('2025-03-01', '09:59:59'), venta('2025-02-28', '23:00:00'), venta('2025-03-01', '10:00:01')]
+
+    assert colector.filtrar_posteriores_watermark(ventas, watermark) == ventas[2:]
+
+
+def test_hora_sin_relleno_se_compara_como_hora():
+    watermark = ('2025-03-01', '08:00:00', '', '')
+    ventas = [venta('2025-03-01', '9:30:00'), venta('2025-03-01', '7:59:59'), venta('2025-03-01', '2025-03-01T8:0:5')]
+
+    assert colector.filtrar_posteriores_watermark(ventas, watermark) == [ventas[0], ventas[2]]
+
+
+def test_incremental_no_pierde_ni_duplica_ventas(api_falsa, conn):
+    hoy = datetime.now().date()
+    esperadas = {(v['PREFIJO'], v['NUMDOC'], v['REFER']) for v in api_falsa.generador.ventas_dia(hoy)}
+
+    primera = colector.handler_ventas_incremental()
+    segunda = colector.handler_ventas_incremental()
+
+    assert primera['statusCode'] == segunda['statusCode'] == 200
+    filas = consultar(conn, "SELECT prefijo, numero_documento, referencia FROM ventas")
+    assert set(filas) == esperadas and len(filas) == len(esperadas)
+    watermark = consultar(conn, "SELECT ultima_fecha, ultima_hora FROM extraccion_watermark")
+    assert watermark[0][0] == hoy
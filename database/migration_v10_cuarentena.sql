@@ -0,0 +1,22 @@
+-- ============================================
+-- MIGRACIÓN V10: CUARENTENA DE FILAS RECHAZADAS
+-- Filas de la API que no pasan la validación (o que la BD rechaza) se guardan
+-- aquí con el motivo en lugar de revertir el lote completo
+-- Ejecutar después de migration_v9_ingest_runs.sql
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS cuarentena_ingesta (
+    id BIGSERIAL PRIMARY KEY,
+    empresa VARCHAR(20) NOT NULL,
+    fuente VARCHAR(20) NOT NULL,                -- 'ventas' | 'inventario' | 'productos'
+    clave TEXT,                                 -- p.ej. PREFIJO/NUMDOC/REFER o BODEGA/REFERENCIA
+    motivo TEXT NOT NULL,
+    registro JSONB NOT NULL,                    -- Registro tal como llegó de la API
+    revisado BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cuarentena_fuente_fecha ON cuarentena_ingesta (empresa, fuente, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_cuarentena_pendientes ON cuarentena_ingesta (fuente) WHERE NOT revisado;
+
+COMMENT ON TABLE cuarentena_ingesta IS 'Filas rechazadas por la validación del colector, con su motivo, para revisión';
@@ -0,0 +1,23 @@
+-- ============================================
+-- MIGRACIÓN V11: CHECKPOINTS DE CORRIDAS CON PLAZO
+-- Hasta dónde llegó cada corrida del colector (por lote confirmado) y con qué
+-- parámetros se reanuda en la invocación de continuación
+-- Ejecutar después de migration_v10_cuarentena.sql
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS checkpoints_ingesta (
+    empresa VARCHAR(20) NOT NULL,
+    fuente VARCHAR(20) NOT NULL,                -- 'ventas' | 'inventario'
+    corrida VARCHAR(64) NOT NULL,               -- Request id de la primera invocación
+    estado VARCHAR(20) NOT NULL,                -- 'en_curso' | 'continuado' | 'completado' | 'error'
+    continuacion INTEGER NOT NULL DEFAULT 0,    -- 0 = invocación original
+    reanudar JSONB,                             -- Parámetros del evento para continuar
+    progreso JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (empresa, fuente, corrida)
+);
+
+CREATE INDEX IF NOT EXISTS idx_checkpoints_estado ON checkpoints_ingesta (estado, updated_at DESC);
+
+COMMENT ON TABLE checkpoints_ingesta IS 'Último punto confirmado de cada corrida del colector, para reanudar antes del timeout del Lambda';
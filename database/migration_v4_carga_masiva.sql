@@ -0,0 +1,54 @@
+-- ============================================
+-- MIGRACIÓN V4: Tablas staging para carga masiva (COPY)
+-- ============================================
+-- Plantillas de staging: el Data Collector crea por conexión una tabla
+-- temporal con la misma estructura (CREATE TEMP TABLE ... (LIKE stg_*)), carga
+-- cada lote con COPY FROM STDIN y lo fusiona en las tablas definitivas con
+-- sentencias set-based. Estas tablas quedan vacías; las conexiones concurrentes
+-- no comparten filas ni locks de staging.
+-- Activar en el Lambda con CARGA_COPY_MIN_FILAS > 0.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS stg_productos (
+    referencia VARCHAR(50),
+    codigo VARCHAR(20),
+    nombre TEXT,
+    unidad_medida VARCHAR(20),
+    clase VARCHAR(10),
+    grupo VARCHAR(10),
+    linea VARCHAR(10),
+    marca_codigo VARCHAR(10)
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS stg_ventas (
+    tipo_movimiento VARCHAR(10),
+    prefijo VARCHAR(10),
+    numero_documento VARCHAR(20),
+    fecha DATE,
+    hora TIME,
+    cedula_cliente VARCHAR(20),
+    nombre_cliente VARCHAR(200),
+    codigo_seccion VARCHAR(20),
+    nombre_seccion VARCHAR(100),
+    bodega_codigo VARCHAR(10),
+    referencia VARCHAR(50),
+    cantidad DECIMAL(15,5),
+    valor_unitario DECIMAL(15,5),
+    valor_total DECIMAL(15,5),
+    porcentaje_descuento DECIMAL(10,5),
+    valor_descuento DECIMAL(15,5),
+    valor_costo DECIMAL(15,5),
+    valor_utilidad DECIMAL(15,5),
+    porcentaje_utilidad DECIMAL(10,5),
+    porcentaje_iva DECIMAL(5,2),
+    vendedor_codigo VARCHAR(10),
+    vendedor_nombre VARCHAR(100)
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS stg_inventario (
+    bodega_codigo VARCHAR(10),
+    referencia VARCHAR(50),
+    cantidad DECIMAL(15,5),
+    valor_costo DECIMAL(15,5),
+    valor_venta DECIMAL(15,5),
+    observacion TEXT
+);
@@ -0,0 +1,11 @@
+-- ============================================
+-- MIGRACIÓN V5: Sincronización delta de inventario
+-- ============================================
+-- La huella de cada fila (cantidad/valor_costo/valor_venta/observacion) se
+-- calcula en línea contra inventario_actual y el snapshot del día, por lo que
+-- no requiere tablas nuevas. Esta migración solo asegura la columna
+-- observacion que el Data Collector escribe y que la huella compara.
+-- Activar en el Lambda con INVENTARIO_DELTA=true (o evento 'delta').
+
+ALTER TABLE inventario_actual ADD COLUMN IF NOT EXISTS observacion VARCHAR(50);
+ALTER TABLE inventario_snapshot ADD COLUMN IF NOT EXISTS observacion VARCHAR(50);
@@ -0,0 +1,18 @@
+-- ============================================
+-- MIGRACIÓN V6: Watermark de extracción incremental
+-- ============================================
+-- Último registro ingerido por empresa y fuente. La extracción incremental de
+-- ventas pide a la API solo la ventana posterior a este punto.
+-- Activar en el Lambda con VENTAS_INCREMENTAL=true (o evento 'incremental').
+
+CREATE TABLE IF NOT EXISTS extraccion_watermark (
+    empresa VARCHAR(20) NOT NULL,
+    fuente VARCHAR(20) NOT NULL,             -- 'ventas'
+    ultima_fecha DATE NOT NULL,
+    ultima_hora TIME NOT NULL,
+    ultimo_prefijo VARCHAR(10),
+    ultimo_documento VARCHAR(20),
+    filas_ultima_corrida INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (empresa, fuente)
+);
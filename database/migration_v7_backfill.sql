@@ -0,0 +1,22 @@
+-- ============================================
+-- MIGRACIÓN V7: Checkpoints de carga histórica
+-- ============================================
+-- Un registro por rango de fechas procesado por load_historical.py. Los días
+-- cubiertos por rangos 'completado' se omiten al reanudar; los rangos en
+-- 'error' se vuelven a intentar en la siguiente ejecución.
+
+CREATE TABLE IF NOT EXISTS backfill_rangos (
+    empresa VARCHAR(20) NOT NULL,
+    fuente VARCHAR(20) NOT NULL DEFAULT 'ventas',
+    fecha_inicio DATE NOT NULL,
+    fecha_fin DATE NOT NULL,
+    estado VARCHAR(20) NOT NULL,             -- reintentando, completado, error
+    intentos INTEGER DEFAULT 0,
+    filas INTEGER,
+    segundos NUMERIC(10,2),
+    error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (empresa, fuente, fecha_inicio, fecha_fin)
+);
+
+CREATE INDEX IF NOT EXISTS idx_backfill_rangos_estado ON backfill_rangos(empresa, fuente, estado);
@@ -0,0 +1,16 @@
+-- ============================================
+-- MIGRACIÓN V8: GRANULARIDAD ADAPTATIVA DE VENTAS
+-- Días por llamada aprendidos por mes para la extracción adaptativa
+-- Ejecutar después de migration_v7_backfill.sql
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS ventas_granularidad (
+    empresa VARCHAR(20) NOT NULL,
+    periodo CHAR(7) NOT NULL,                   -- 'YYYY-MM'
+    dias_por_llamada INTEGER NOT NULL,
+    max_filas_dia INTEGER NOT NULL DEFAULT 0,   -- Máximo de filas por día observado
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (empresa, periodo)
+);
+
+COMMENT ON TABLE ventas_granularidad IS 'Tamaño de rango por llamada SOAP de ventas aprendido por mes';
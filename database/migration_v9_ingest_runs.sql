@@ -0,0 +1,32 @@
+-- ============================================
+-- MIGRACIÓN V9: MÉTRICAS DE CORRIDAS DE INGESTA
+-- Resumen por corrida del colector con el tiempo de cada etapa
+-- Ejecutar después de migration_v8_granularidad_ventas.sql
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id BIGSERIAL PRIMARY KEY,
+    empresa VARCHAR(20) NOT NULL,
+    fuente VARCHAR(20) NOT NULL,                -- 'ventas' | 'inventario'
+    inicio TIMESTAMP NOT NULL,
+    duracion_s DECIMAL(10,3) NOT NULL,
+    estado VARCHAR(20) NOT NULL,                -- 'ok' | 'error'
+    filas INTEGER NOT NULL DEFAULT 0,           -- Registros recibidos de la API
+    paginas INTEGER NOT NULL DEFAULT 0,
+    llamadas INTEGER NOT NULL DEFAULT 0,        -- Llamadas SOAP
+    bytes BIGINT NOT NULL DEFAULT 0,            -- Bytes descomprimidos
+    bytes_red BIGINT NOT NULL DEFAULT 0,        -- Bytes recibidos por la red
+    -- Segundos por etapa (tiempo exclusivo, acumulado entre hilos)
+    http_s DECIMAL(10,3),
+    parse_s DECIMAL(10,3),
+    transform_s DECIMAL(10,3),
+    db_write_s DECIMAL(10,3),
+    commit_s DECIMAL(10,3),
+    detalle JSONB,                              -- Resultado del handler y etapas por página
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_runs_fuente_inicio ON ingest_runs (empresa, fuente, inicio DESC);
+
+COMMENT ON TABLE ingest_runs IS 'Tiempo por etapa (HTTP, parseo, transformación, escritura, commit) de cada corrida del colector';
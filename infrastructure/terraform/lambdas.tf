@@ -95,6 +95,68 @@ resource "aws_lambda_permission" "allow_eventbridge_data_collector" {
   source_arn    = aws_cloudwatch_event_rule.data_collector_schedule.arn
 }
 
+# Regla para reconciliación de ventas - diaria 11:30 PM Colombia (04:30 UTC)
+# Recoge documentos que llegaron tarde a la extracción incremental por watermark
+resource "aws_cloudwatch_event_rule" "reconciliacion_ventas_schedule" {
+  name                = "${var.project_name}-reconciliacion-ventas-schedule"
+  description         = "Reconciliar ventas de los últimos días (11:30PM Colombia)"
+  schedule_expression = "cron(30 4 * * ? *)"
+
+  tags = {
+    Name        = "${var.project_name}-reconciliacion-ventas-schedule"
+    Environment = var.environment
+  }
+}
+
+resource "aws_cloudwatch_event_target" "reconciliacion_ventas_target" {
+  rule      = aws_cloudwatch_event_rule.reconciliacion_ventas_schedule.name
+  target_id = "reconciliacion-ventas"
+  arn       = aws_lambda_function.data_collector.arn
+
+  input = jsonencode({
+    tipo = "reconciliacion_ventas"
+  })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_reconciliacion_ventas" {
+  statement_id  = "AllowEventBridgeInvokeReconciliacionVentas"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.data_collector.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.reconciliacion_ventas_schedule.arn
+}
+
+# Regla para cuadre de ventas - semanal, domingo 12:00 AM Colombia (05:00 UTC)
+# Compara agregados por día y bodega de la última semana y recarga solo lo que no cuadra
+resource "aws_cloudwatch_event_rule" "cuadre_ventas_schedule" {
+  name                = "${var.project_name}-cuadre-ventas-schedule"
+  description         = "Cuadrar ventas de la última semana contra la API (domingo 12:00AM Colombia)"
+  schedule_expression = "cron(0 5 ? * SUN *)"
+
+  tags = {
+    Name        = "${var.project_name}-cuadre-ventas-schedule"
+    Environment = var.environment
+  }
+}
+
+resource "aws_cloudwatch_event_target" "cuadre_ventas_target" {
+  rule      = aws_cloudwatch_event_rule.cuadre_ventas_schedule.name
+  target_id = "cuadre-ventas"
+  arn       = aws_lambda_function.data_collector.arn
+
+  input = jsonencode({
+    tipo = "cuadre_ventas"
+  })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_cuadre_ventas" {
+  statement_id  = "AllowEventBridgeInvokeCuadreVentas"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.data_collector.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.cuadre_ventas_schedule.arn
+}
+
 # Regla para Analytics Engine - cada 4 horas (7AM, 11AM, 3PM, 7PM Colombia)
 resource "aws_cloudwatch_event_rule" "analytics_schedule" {
   name                = "${var.project_name}-analytics-schedule"
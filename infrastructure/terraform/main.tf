@@ -389,6 +389,14 @@ resource "aws_iam_role_policy" "lambda_policy" {
         ]
         Resource = aws_sns_topic.alerts.arn
       },
+      {
+        # El colector se re-invoca para continuar corridas antes del timeout
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        Resource = aws_lambda_function.data_collector.arn
+      },
       {
         Effect = "Allow"
         Action = [
@@ -473,4 +481,18 @@ resource "aws_vpc_endpoint" "secretsmanager" {
   tags = {
     Name = "${var.project_name}-secretsmanager-endpoint"
   }
-}
\ No newline at end of file
+}
+
+# VPC Endpoint para Lambda (el colector se re-invoca para continuar corridas)
+resource "aws_vpc_endpoint" "lambda" {
+  vpc_id              = aws_vpc.main.id
+  service_name        = "com.amazonaws.${var.aws_region}.lambda"
+  vpc_endpoint_type   = "Interface"
+  subnet_ids          = [aws_subnet.private_1.id, aws_subnet.private_2.id]
+  security_group_ids  = [aws_security_group.lambda.id]
+  private_dns_enabled = true
+
+  tags = {
+    Name = "${var.project_name}-lambda-endpoint"
+  }
+}